@@ -0,0 +1,235 @@
+"""Aggregate queries behind the analytics routes"""
+from datetime import date, timedelta
+
+from dateutil.relativedelta import relativedelta
+
+GRANULARITIES = ('day', 'week', 'month')
+
+# SQL expression mapping a transaction date to its bucket label
+_BUCKET_SQL = {
+    'day': 'date',
+    'week': "date(date, 'weekday 0', '-6 days')",  # Monday of the week
+    'month': 'substr(date, 1, 7)'
+}
+
+
+def bucket_labels(start, end, granularity):
+    """Return every bucket label between start and end (inclusive dates)"""
+    labels = []
+    if granularity == 'day':
+        current = start
+        step = timedelta(days=1)
+    elif granularity == 'week':
+        current = start - timedelta(days=start.weekday())
+        step = timedelta(weeks=1)
+    else:
+        current = start.replace(day=1)
+        step = relativedelta(months=1)
+
+    while current <= end:
+        labels.append(current.strftime('%Y-%m') if granularity == 'month' else current.isoformat())
+        current = current + step
+    return labels
+
+
+def _bucket(day, granularity):
+    """Python equivalent of _BUCKET_SQL for a YYYY-MM-DD date"""
+    if granularity == 'day':
+        return day
+    if granularity == 'week':
+        parsed = date.fromisoformat(day)
+        return (parsed - timedelta(days=parsed.weekday())).isoformat()
+    return day[:7]
+
+
+def _month_range_sql(start, end):
+    """Build the rollup + raw-edge subquery covering start..end for monthly buckets
+
+    Whole months are read from monthly_category_totals; partial months at either end
+    of the range are summed from the raw transactions. Also returns those raw date
+    ranges (inclusive).
+    """
+    first_full = start if start.day == 1 else start.replace(day=1) + relativedelta(months=1)
+    after_end = end + timedelta(days=1)
+    end_full = after_end.replace(day=1) if after_end.day != 1 else after_end  # exclusive
+
+    if first_full >= end_full:
+        # No whole month inside the range; everything comes from raw rows
+        return '''
+            SELECT substr(date, 1, 7) AS period, category, type,
+                   amount AS amount_total, ABS(amount) AS abs_total
+            FROM transactions
+            WHERE type IN ('income', 'expense') AND date >= ? AND date <= ?
+        ''', [start.isoformat(), end.isoformat()], [(start, end)]
+
+    sql = '''
+        SELECT month AS period, category, type, amount_total, abs_total
+        FROM monthly_category_totals
+        WHERE month >= ? AND month < ?
+        UNION ALL
+        SELECT substr(date, 1, 7), category, type, amount, ABS(amount)
+        FROM transactions
+        WHERE type IN ('income', 'expense')
+        AND ((date >= ? AND date < ?) OR (date >= ? AND date <= ?))
+    '''
+    params = [first_full.strftime('%Y-%m'), end_full.strftime('%Y-%m'),
+              start.isoformat(), first_full.isoformat(), end_full.isoformat(), end.isoformat()]
+    raw_ranges = [(start, first_full - timedelta(days=1)), (end_full, end)]
+    return sql, params, [(low, high) for low, high in raw_ranges if low <= high]
+
+
+def time_series(conn, start, end, granularity='month', by_category=False, archive=None):
+    """Return income/expense/net per bucket (and per category if requested) in one grouped query
+
+    With an archive (see archive.py), archived rows inside the ranges read from the raw
+    transactions are added in; whole months are already in the rollup.
+    """
+    if granularity == 'month':
+        source, params, raw_ranges = _month_range_sql(start, end)
+    else:
+        source = f'''
+            SELECT {_BUCKET_SQL[granularity]} AS period, category, type,
+                   amount AS amount_total, ABS(amount) AS abs_total
+            FROM transactions
+            WHERE type IN ('income', 'expense') AND date >= ? AND date <= ?
+        '''
+        params = [start.isoformat(), end.isoformat()]
+        raw_ranges = [(start, end)]
+
+    group = 'period, category' if by_category else 'period'
+    rows = conn.execute(f'''
+        SELECT period, {'category' if by_category else 'NULL AS category'},
+               COALESCE(SUM(CASE WHEN type = 'income' THEN amount_total END), 0) AS income,
+               COALESCE(SUM(CASE WHEN type = 'expense' THEN abs_total END), 0) AS expenses
+        FROM ({source})
+        GROUP BY {group}
+        ORDER BY {group}
+    ''', params).fetchall()
+    totals = {(row['period'], row['category']): [row['income'], row['expenses']] for row in rows}
+
+    if archive is not None:
+        for low, high in raw_ranges:
+            filters = {'start_date': low.isoformat(), 'end_date': high.isoformat()}
+            for day, category, kind, amount in archive.scan(conn, filters, ['date', 'category', 'type', 'amount']):
+                if kind not in ('income', 'expense'):
+                    continue
+                entry = totals.setdefault((_bucket(day, granularity), category if by_category else None), [0, 0])
+                if kind == 'income':
+                    entry[0] += amount
+                else:
+                    entry[1] += abs(amount)
+
+    def point(period, income, expenses, category=None):
+        entry = {'period': period}
+        if by_category:
+            entry['category'] = category
+        entry.update({
+            'income': round(income, 2),
+            'expenses': round(expenses, 2),
+            'net': round(income - expenses, 2)
+        })
+        return entry
+
+    if by_category:
+        return [point(period, income, expenses, category)
+                for (period, category), (income, expenses) in sorted(totals.items())]
+
+    # Zero-fill buckets with no transactions so charts get a continuous axis
+    series = []
+    for label in bucket_labels(start, end, granularity):
+        income, expenses = totals.get((label, None), (0, 0))
+        series.append(point(label, income, expenses))
+    return series
+
+
+BUDGET_BUCKETS = ('monthly_income', 'debt_payments', 'savings', 'investments', 'discretionary')
+
+# Expense categories (lower-cased) that count toward a budget bucket other than discretionary;
+# all income counts toward monthly_income
+CATEGORY_BUCKETS = {
+    'debt': 'debt_payments',
+    'debt payments': 'debt_payments',
+    'loan payment': 'debt_payments',
+    'credit card payment': 'debt_payments',
+    'mortgage': 'debt_payments',
+    'savings': 'savings',
+    'emergency fund': 'savings',
+    'investments': 'investments',
+    'investment': 'investments',
+    'tfsa': 'investments',
+    'rrsp': 'investments',
+    'fhsa': 'investments'
+}
+
+
+def _bucket_case_sql():
+    """SQL CASE expression mapping a rollup row to its budget bucket, plus its parameters"""
+    sql = "CASE WHEN type = 'income' THEN 'monthly_income'"
+    params = []
+    for bucket in ('debt_payments', 'savings', 'investments'):
+        categories = [c for c, b in CATEGORY_BUCKETS.items() if b == bucket]
+        sql += f" WHEN lower(category) IN ({', '.join('?' * len(categories))}) THEN '{bucket}'"
+        params.extend(categories)
+    return sql + " ELSE 'discretionary' END", params
+
+
+def budget_variance(conn, start_month, end_month, default_goals):
+    """Return planned vs. actual per budget bucket for each month from start_month to end_month
+
+    Actuals come from one grouped query over the monthly rollup. Each month is planned
+    against the budget_goals version in effect at the end of that month (the table is
+    append-only), or default_goals before the first version was saved.
+    """
+    bucket_sql, params = _bucket_case_sql()
+    rows = conn.execute(f'''
+        SELECT month, {bucket_sql} AS bucket,
+               SUM(CASE WHEN type = 'income' THEN amount_total ELSE abs_total END) AS actual
+        FROM monthly_category_totals
+        WHERE month >= ? AND month <= ?
+        GROUP BY month, bucket
+    ''', params + [start_month, end_month]).fetchall()
+    actuals = {(row['month'], row['bucket']): row['actual'] for row in rows}
+
+    versions = [dict(row) for row in conn.execute('''
+        SELECT id, monthly_income, debt_payments, savings, investments, discretionary, created_at
+        FROM budget_goals
+        ORDER BY created_at, id
+    ''')]
+
+    months = []
+    current = date.fromisoformat(start_month + '-01')
+    last = date.fromisoformat(end_month + '-01')
+    version_index = -1
+    while current <= last:
+        month = current.strftime('%Y-%m')
+        month_end = (current + relativedelta(months=1)).isoformat()
+
+        # Versions are sorted, so advance to the last one created before the month ended
+        while version_index + 1 < len(versions) and versions[version_index + 1]['created_at'] < month_end:
+            version_index += 1
+        goals = versions[version_index] if version_index >= 0 else default_goals
+
+        buckets = []
+        for bucket in BUDGET_BUCKETS:
+            planned = goals[bucket]
+            actual = round(actuals.get((month, bucket), 0), 2)
+            buckets.append({
+                'bucket': bucket,
+                'planned': planned,
+                'actual': actual,
+                'variance': round(actual - planned, 2)
+            })
+
+        months.append({
+            'month': month,
+            'budget_version': versions[version_index]['id'] if version_index >= 0 else None,
+            'buckets': buckets
+        })
+        current = current + relativedelta(months=1)
+
+    return {
+        'start_month': start_month,
+        'end_month': end_month,
+        'budget_versions': versions,
+        'months': months
+    }
@@ -0,0 +1,536 @@
+"""Cold storage for closed years of transactions
+
+archive_transactions() moves every transaction dated before a cutoff year out of the
+hot transactions table into one compressed columnar file per year, keeping the table,
+its indexes and the page cache sized to the years still in use. Archived rows remain
+readable: Archive.scan() yields them in the same (date, id) descending order as the
+routes' queries so the two can be merged, and the monthly rollup, learned categories
+and account balances keep counting them.
+
+File layout:
+
+    b'FTARCH1\\n'     magic
+    uint32 (LE)      header length
+    header (JSON)    row count, column encodings and block offsets, plus summaries:
+                     date and id range, categories, types and monthly totals
+    blocks           one zlib-compressed block per column; text columns are
+                     dictionary-encoded (distinct values, then one code per row)
+
+Files are memory-mapped and only the blocks a query needs are decompressed; the header
+alone decides whether a file can match a filter at all. Filters on text columns are
+evaluated once per distinct value rather than once per row.
+
+Which files are live is recorded in archive_segments (migration 9), written in the same
+database transaction that deletes the archived rows, so readers see each transaction
+exactly once, hot or archived. A failed run leaves at worst an unreferenced file,
+which the next run deletes.
+"""
+import bisect
+import json
+import mmap
+import os
+import re
+import struct
+import sys
+import threading
+import unicodedata
+import uuid
+import zlib
+from array import array
+from datetime import date
+
+MAGIC = b'FTARCH1\n'
+VERSION = 1
+FILE_SUFFIX = '.ftarch'
+COMPRESSION_LEVEL = 6
+
+# Columns stored as fixed-width arrays; every other column is dictionary-encoded
+NUMERIC_COLUMNS = {'id': 'q', 'amount': 'd'}
+
+SWAP_BYTES = sys.byteorder != 'little'  # Blocks are little-endian on disk
+
+
+def _pack_array(values):
+    if SWAP_BYTES:
+        values = array(values.typecode, values)
+        values.byteswap()
+    return zlib.compress(values.tobytes(), COMPRESSION_LEVEL)
+
+
+def _unpack_array(typecode, data):
+    values = array(typecode)
+    values.frombytes(data)
+    if SWAP_BYTES:
+        values.byteswap()
+    return values
+
+
+def _code_typecode(size):
+    return 'B' if size <= 0xFF else 'H' if size <= 0xFFFF else 'I'
+
+
+def _sort_key(value):
+    # Dictionaries are sorted so a date range maps to a contiguous range of codes
+    return (value is not None, str(value))
+
+
+def _fold(text):
+    """Case-fold and strip diacritics, like the FTS5 tokenizer (remove_diacritics 2)"""
+    decomposed = unicodedata.normalize('NFKD', text)
+    return ''.join(char for char in decomposed if not unicodedata.combining(char)).casefold()
+
+
+def search_terms(text):
+    """Split a q= search into the terms each matched row must contain as word prefixes"""
+    return [term for word in re.findall(r'\w+', text or '') for term in re.findall(r'[^\W_]+', _fold(word))]
+
+
+def _term_mask(text, terms):
+    """Bitmask of the terms that prefix some word of text"""
+    words = re.findall(r'[^\W_]+', _fold(text or ''))
+    mask = 0
+    for index, term in enumerate(terms):
+        if any(word.startswith(term) for word in words):
+            mask |= 1 << index
+    return mask
+
+
+def write_archive_file(path, columns, rows):
+    """Write rows (tuples in columns order, newest first) to a new archive file
+
+    Returns the file's header.
+    """
+    blocks = []
+    offset = 0
+    column_meta = []
+
+    def add_block(data):
+        nonlocal offset
+        blocks.append(data)
+        offset += len(data)
+        return [offset - len(data), len(data)]
+
+    for index, name in enumerate(columns):
+        values = [row[index] for row in rows]
+        if name in NUMERIC_COLUMNS:
+            typecode = NUMERIC_COLUMNS[name]
+            cast = int if typecode == 'q' else float
+            column_meta.append({'name': name, 'encoding': 'array', 'typecode': typecode,
+                                'data': add_block(_pack_array(array(typecode, map(cast, values))))})
+        else:
+            dictionary = sorted(set(values), key=_sort_key)
+            codes_by_value = {value: code for code, value in enumerate(dictionary)}
+            typecode = _code_typecode(len(dictionary))
+            column_meta.append({
+                'name': name, 'encoding': 'dictionary', 'typecode': typecode,
+                'values': add_block(zlib.compress(json.dumps(dictionary).encode(), COMPRESSION_LEVEL)),
+                'data': add_block(_pack_array(array(typecode, (codes_by_value[value] for value in values))))
+            })
+
+    date_index, id_index = columns.index('date'), columns.index('id')
+    category_index, type_index = columns.index('category'), columns.index('type')
+    amount_index = columns.index('amount')
+    categories, types, months = {}, {}, {}
+    for row in rows:
+        categories[row[category_index]] = categories.get(row[category_index], 0) + 1
+        types[row[type_index]] = types.get(row[type_index], 0) + 1
+        key = (row[date_index][:7], row[category_index], row[type_index])
+        totals = months.setdefault(key, [0.0, 0.0, 0])
+        totals[0] += row[amount_index]
+        totals[1] += abs(row[amount_index])
+        totals[2] += 1
+
+    header = {
+        'version': VERSION,
+        'rows': len(rows),
+        'columns': column_meta,
+        'min_date': min((row[date_index] for row in rows), default=None),
+        'max_date': max((row[date_index] for row in rows), default=None),
+        'min_id': min((row[id_index] for row in rows), default=None),
+        'max_id': max((row[id_index] for row in rows), default=None),
+        'categories': categories,
+        'types': types,
+        # (month, category, type, amount_total, abs_total, count), as in monthly_category_totals
+        'monthly_totals': [list(key) + totals for key, totals in sorted(months.items())]
+    }
+    encoded = json.dumps(header).encode()
+
+    with open(path, 'wb') as output:
+        output.write(MAGIC + struct.pack('<I', len(encoded)) + encoded)
+        for block in blocks:
+            output.write(block)
+        output.flush()
+        os.fsync(output.fileno())
+    return header
+
+
+def _first_index(count, predicate):
+    """First index in range(count) where predicate holds (it must stay true from there on)"""
+    low, high = 0, count
+    while low < high:
+        middle = (low + high) // 2
+        if predicate(middle):
+            high = middle
+        else:
+            low = middle + 1
+    return low
+
+
+class ArchiveFile:
+    """A memory-mapped archive file; blocks are decompressed on demand"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as source:
+            self._mmap = mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mmap[:len(MAGIC)] != MAGIC:
+            self._mmap.close()
+            raise ValueError(f'Not a transaction archive: {path}')
+        length, = struct.unpack_from('<I', self._mmap, len(MAGIC))
+        start = len(MAGIC) + 4
+        self.header = json.loads(self._mmap[start:start + length])
+        self._data_start = start + length
+        self.columns = [column['name'] for column in self.header['columns']]
+        self._meta = {column['name']: column for column in self.header['columns']}
+
+    def _block(self, location):
+        offset, length = location
+        start = self._data_start + offset
+        with memoryview(self._mmap)[start:start + length] as block:
+            return zlib.decompress(block)
+
+    def dictionary(self, name):
+        """Return (distinct values, per-row codes) of a dictionary-encoded column"""
+        meta = self._meta[name]
+        return json.loads(self._block(meta['values'])), _unpack_array(meta['typecode'], self._block(meta['data']))
+
+    def values(self, name):
+        """Return a column's values as a sequence (None for a column the file lacks)"""
+        meta = self._meta.get(name)
+        if meta is None:
+            return None
+        if meta['encoding'] == 'array':
+            return _unpack_array(meta['typecode'], self._block(meta['data']))
+        dictionary, codes = self.dictionary(name)
+        return [dictionary[code] for code in codes]
+
+    def _reader(self, name):
+        """Return a function from row index to the column's value, decoding values lazily"""
+        meta = self._meta.get(name)
+        if meta is None:
+            return lambda index: None
+        if meta['encoding'] == 'array':
+            return self.values(name).__getitem__
+        dictionary, codes = self.dictionary(name)
+        return lambda index: dictionary[codes[index]]
+
+    def may_match(self, filters, before=None, after=None):
+        """Whether the header rules out every row for these filters"""
+        header = self.header
+        if not header['rows']:
+            return False
+        if filters.get('start_date') and header['max_date'] < filters['start_date']:
+            return False
+        if filters.get('end_date') and header['min_date'] > filters['end_date']:
+            return False
+        if filters.get('category') and filters['category'] not in header['categories']:
+            return False
+        if filters.get('type') and filters['type'] not in header['types']:
+            return False
+        if before is not None and (header['min_date'], header['min_id']) >= tuple(before):
+            return False
+        if after is not None and header['max_date'] < after[0]:
+            return False
+        return True
+
+    def scan(self, filters, columns, before=None, after=None):
+        """Yield the rows matching filters as tuples of columns, newest first
+
+        before/after are exclusive (date, id) bounds, as used for cursors.
+        """
+        if not self.may_match(filters, before, after):
+            return
+        before = tuple(before) if before is not None else None
+        after = tuple(after) if after is not None else None
+
+        dates, date_codes = self.dictionary('date')
+        ids = self.values('id')
+        low = bisect.bisect_left(dates, filters['start_date']) if filters.get('start_date') else 0
+        high = bisect.bisect_right(dates, filters['end_date']) if filters.get('end_date') else len(dates)
+
+        # Equality filters become a single code to compare against (or rule the file out)
+        code_filters = []
+        for name in ('category', 'type'):
+            if filters.get(name):
+                dictionary, codes = self.dictionary(name)
+                try:
+                    code_filters.append((codes, dictionary.index(filters[name])))
+                except ValueError:
+                    return
+
+        # Search: which terms each distinct description and note contains
+        terms = search_terms(filters.get('q'))
+        masks = []
+        if terms:
+            for name in ('description', 'notes'):
+                dictionary, codes = self.dictionary(name)
+                masks.append(([_term_mask(value, terms) for value in dictionary], codes))
+        all_terms = (1 << len(terms)) - 1
+
+        def position(index):
+            return dates[date_codes[index]], ids[index]
+
+        # Rows are newest first, so the bounds are a contiguous run found by bisection
+        rows = self.header['rows']
+        first = 0
+        if high < len(dates):
+            first = _first_index(rows, lambda index: date_codes[index] < high)
+        if before is not None:
+            first = max(first, _first_index(rows, lambda index: position(index) < before))
+
+        readers = [self._reader(name) for name in columns]
+        for index in range(first, rows):
+            if date_codes[index] < low or (after is not None and position(index) <= after):
+                break
+            if any(codes[index] != wanted for codes, wanted in code_filters):
+                continue
+            if terms:
+                mask = 0
+                for term_masks, codes in masks:
+                    mask |= term_masks[codes[index]]
+                if mask != all_terms:
+                    continue
+            yield tuple(reader(index) for reader in readers)
+
+    def rows(self, ids):
+        """Yield the rows whose id is in ids as dicts, in file order"""
+        header = self.header
+        wanted = {row_id for row_id in ids if header['rows'] and header['min_id'] <= row_id <= header['max_id']}
+        if not wanted:
+            return
+        readers = None
+        for index, value in enumerate(self.values('id')):
+            if value in wanted:
+                if readers is None:
+                    readers = {name: self._reader(name) for name in self.columns}
+                yield {name: reader(index) for name, reader in readers.items()}
+
+    def find(self, transaction_id):
+        """Return the row with this id as a dict, or None"""
+        return next(self.rows((transaction_id,)), None)
+
+    def existing(self, keys):
+        """Yield the (date, description, amount) keys that occur in this file
+
+        keys maps a date to the set of (description, amount rounded to cents) wanted on
+        it; only the rows of those dates are read.
+        """
+        if not self.header['rows']:
+            return
+        dates, date_codes = self.dictionary('date')
+        rows = self.header['rows']
+        description = amount = None
+        for day, wanted in keys.items():
+            code = bisect.bisect_left(dates, day)
+            if code == len(dates) or dates[code] != day:
+                continue
+            if description is None:
+                description, amount = self._reader('description'), self._reader('amount')
+            # Rows are newest first, so the date's rows are one contiguous run
+            for index in range(_first_index(rows, lambda index: date_codes[index] <= code), rows):
+                if date_codes[index] != code:
+                    break
+                key = (description(index), round(amount(index), 2))
+                if key in wanted:
+                    yield (day,) + key
+
+    def close(self):
+        self._mmap.close()
+
+
+class Archive:
+    """The archive files of one database
+
+    directory is None for a database that can't be archived (':memory:'). Files are
+    immutable, so opened ones are kept until close(); which are live is read from
+    archive_segments on the caller's connection, i.e. in the caller's snapshot.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._files = {}
+        self._lock = threading.Lock()
+
+    def _open(self, name):
+        with self._lock:
+            archive_file = self._files.get(name)
+            if archive_file is None:
+                archive_file = self._files[name] = ArchiveFile(os.path.join(self.directory, name))
+            return archive_file
+
+    def segments(self, conn):
+        """Return the live archive files, newest year first"""
+        if self.directory is None:
+            return []
+        return [self._open(row[0]) for row in conn.execute('SELECT file FROM archive_segments ORDER BY year DESC')]
+
+    def scan(self, conn, filters, columns, before=None, after=None):
+        """Yield archived rows matching the transaction filters in filters, newest first
+
+        filters takes the same keys as the transaction routes (start_date, end_date,
+        category, type, q); rows are tuples of columns.
+        """
+        for archive_file in self.segments(conn):
+            yield from archive_file.scan(filters, columns, before, after)
+
+    def find(self, conn, transaction_id):
+        """Return an archived transaction as a dict, or None"""
+        for archive_file in self.segments(conn):
+            row = archive_file.find(transaction_id)
+            if row is not None:
+                return row
+        return None
+
+    def rows(self, conn, ids):
+        """Return the archived transactions among ids as dicts"""
+        remaining = set(ids)
+        found = []
+        for archive_file in self.segments(conn):
+            if not remaining:
+                break
+            rows = list(archive_file.rows(remaining))
+            found.extend(rows)
+            remaining.difference_update(row['id'] for row in rows)
+        return found
+
+    def existing(self, conn, keys):
+        """Return the archived (date, description, amount) keys among keys (see ArchiveFile.existing)"""
+        found = set()
+        if not keys:
+            return found
+        first, last = min(keys), max(keys)
+        for archive_file in self.segments(conn):
+            if archive_file.header['rows'] and archive_file.header['min_date'] <= last \
+                    and archive_file.header['max_date'] >= first:
+                found.update(archive_file.existing(keys))
+        return found
+
+    def categories(self, conn):
+        """Return every category that occurs in archived transactions"""
+        return {category for archive_file in self.segments(conn) for category in archive_file.header['categories']}
+
+    def monthly_totals(self, conn):
+        """Return the archived rows' (month, category, type, amount_total, abs_total, count)"""
+        return [tuple(totals) for archive_file in self.segments(conn)
+                for totals in archive_file.header['monthly_totals']]
+
+    def remove_unreferenced(self, conn):
+        """Delete archive files no segment refers to (left by replaced or failed runs)"""
+        if self.directory is None or not os.path.isdir(self.directory):
+            return []
+        live = {row[0] for row in conn.execute('SELECT file FROM archive_segments')}
+        removed = []
+        for name in os.listdir(self.directory):
+            if name.endswith(FILE_SUFFIX) and name not in live:
+                with self._lock:
+                    archive_file = self._files.pop(name, None)
+                if archive_file is not None:
+                    archive_file.close()
+                os.remove(os.path.join(self.directory, name))
+                removed.append(name)
+        return removed
+
+    def close(self):
+        with self._lock:
+            files, self._files = list(self._files.values()), {}
+        for archive_file in files:
+            archive_file.close()
+
+
+def archive_transactions(conn, archive, before_year):
+    """Move transactions dated before January 1st of before_year into archive files
+
+    One file is written per year; a year archived before is rewritten with its new
+    rows merged in. The rows are deleted with the transactions triggers dropped, so
+    the rollup, learned categories and account balances keep counting them (each
+    account's archived net amount moves into its opening balance, which keeps
+    reconcile-accounts exact), and no change-feed tombstones are recorded: the rows'
+    change_log entries stay, and changes_since() serves them from the archive. The
+    caller must hold the write lock. Returns a summary dict.
+    """
+    if archive.directory is None:
+        raise ValueError('This database has no archive directory')
+    os.makedirs(archive.directory, exist_ok=True)
+    removed = archive.remove_unreferenced(conn)
+    cutoff = f'{before_year:04d}-01-01'
+
+    written = []
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        years = [int(row[0]) for row in conn.execute(
+            'SELECT DISTINCT substr(date, 1, 4) FROM transactions WHERE date < ?', (cutoff,))]
+        columns = [column[0] for column in conn.execute('SELECT * FROM transactions LIMIT 0').description]
+        date_index, id_index = columns.index('date'), columns.index('id')
+        segments = {row[0]: row[1] for row in conn.execute('SELECT year, file FROM archive_segments')}
+
+        summary = {'before': cutoff, 'years': [], 'rows': 0, 'bytes': 0, 'removed_files': removed}
+        for year in years:
+            rows = [tuple(row) for row in conn.execute('''
+                SELECT * FROM transactions WHERE date >= ? AND date < ? ORDER BY date DESC, id DESC
+            ''', (f'{year:04d}-01-01', f'{year + 1:04d}-01-01'))]
+            added = len(rows)
+            if year in segments:
+                # Merge with what was archived before (ids never repeat)
+                previous = archive._open(segments[year])
+                rows.extend(previous.scan({}, columns))
+                rows.sort(key=lambda row: (row[date_index], row[id_index]), reverse=True)
+
+            name = f'transactions-{year:04d}-{uuid.uuid4().hex[:12]}{FILE_SUFFIX}'
+            path = os.path.join(archive.directory, name)
+            written.append(path)
+            header = write_archive_file(path, columns, rows)
+            conn.execute('''
+                INSERT OR REPLACE INTO archive_segments (year, file, rows, min_date, max_date, archived_at)
+                VALUES (?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+            ''', (year, name, header['rows'], header['min_date'], header['max_date']))
+            size = os.path.getsize(path)
+            summary['years'].append({'year': year, 'rows_added': added, 'rows': header['rows'], 'bytes': size})
+            summary['rows'] += added
+            summary['bytes'] += size
+
+        # Fold the archived amounts into the accounts' opening balances
+        conn.execute('''
+            UPDATE accounts SET opening_balance = opening_balance + (
+                SELECT SUM(CASE WHEN type = 'income' THEN ABS(amount) ELSE -ABS(amount) END)
+                FROM transactions WHERE account_id = accounts.id AND date < ?
+            )
+            WHERE id IN (SELECT account_id FROM transactions WHERE date < ? AND account_id IS NOT NULL)
+        ''', (cutoff, cutoff))
+        conn.execute('''
+            INSERT INTO transactions_fts (transactions_fts, rowid, description, notes)
+            SELECT 'delete', id, description, notes FROM transactions WHERE date < ?
+        ''', (cutoff,))
+
+        triggers = conn.execute('''
+            SELECT name, sql FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'transactions'
+        ''').fetchall()
+        for trigger in triggers:
+            conn.execute(f'DROP TRIGGER {trigger[0]}')
+        conn.execute('DELETE FROM transactions WHERE date < ?', (cutoff,))
+        for trigger in triggers:
+            conn.execute(trigger[1])
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        for path in written:
+            os.remove(path)
+        raise
+
+    # The files these years replaced are deleted on the next run, once no reader can
+    # still be using them
+    return summary
+
+
+def default_before_year(older_than_years, today=None):
+    """The first year kept hot when archiving years more than older_than_years old"""
+    return (today or date.today()).year - older_than_years
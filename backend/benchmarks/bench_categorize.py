@@ -0,0 +1,91 @@
+"""Benchmark the compiled categorizer against a naive per-rule loop
+
+Builds a rule set of substring and regex rules plus learned mappings, then
+categorizes synthetic bank descriptions with both and checks they agree.
+
+    python benchmarks/bench_categorize.py --rows 100000 --rules 500
+"""
+import argparse
+import random
+import re
+import time
+
+import common  # noqa: F401 (puts the backend on sys.path)
+from categorize import Categorizer, normalize_description
+
+CATEGORIES = ['Groceries', 'Housing', 'Transportation', 'Dining Out', 'Entertainment', 'Utilities']
+
+
+def make_rules(count, rng):
+    rules = []
+    for rule_id in range(count):
+        if rule_id % 10 == 0:
+            rule = {'match_type': 'regex', 'pattern': rf'store\s*#?{rule_id}\b'}
+        else:
+            rule = {'match_type': 'substring', 'pattern': f'merchant{rule_id} '}
+        rule.update({'id': rule_id, 'category': rng.choice(CATEGORIES), 'min_amount': None,
+                     'max_amount': None, 'transaction_type': None})
+        rules.append(rule)
+    return rules
+
+
+def make_descriptions(count, rule_count, rng):
+    descriptions = []
+    for _ in range(count):
+        roll = rng.random()
+        number = rng.randint(0, rule_count * 2)
+        if roll < 0.4:
+            descriptions.append(f'POS MERCHANT{number} CARD {rng.randint(1000, 9999)}')
+        elif roll < 0.6:
+            descriptions.append(f'STORE #{number} PURCHASE')
+        else:
+            descriptions.append(f'Payee {rng.randint(1, 500)} ref {rng.randint(1, 99999)}')
+    return descriptions
+
+
+def naive(rules, learned, description):
+    for rule in rules:
+        if rule['match_type'] == 'substring':
+            matched = rule['pattern'].lower() in description.lower()
+        else:
+            matched = re.search(rule['pattern'], description, re.I) is not None
+        if matched:
+            return rule['category']
+    return learned.get(normalize_description(description))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--rules', type=int, default=500)
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    rules = make_rules(args.rules, rng)
+    learned = {'payee ref': 'Other'}
+    descriptions = make_descriptions(args.rows, args.rules, rng)
+
+    started = time.perf_counter()
+    categorizer = Categorizer(rules, learned)
+    compile_elapsed = time.perf_counter() - started
+
+    started = time.perf_counter()
+    compiled = [categorizer.categorize(description, 10.0, 'expense')[0] for description in descriptions]
+    compiled_elapsed = time.perf_counter() - started
+
+    sample = descriptions[:min(len(descriptions), 5000)]
+    started = time.perf_counter()
+    expected = [naive(rules, learned, description) for description in sample]
+    naive_elapsed = (time.perf_counter() - started) * len(descriptions) / len(sample)
+
+    assert compiled[:len(sample)] == expected, 'compiled matcher disagrees with the naive loop'
+
+    print(f'rows:               {args.rows}')
+    print(f'rules:              {args.rules}')
+    print(f'compile:            {compile_elapsed * 1000:.1f}ms')
+    print(f'compiled matcher:   {compiled_elapsed:.3f}s ({args.rows / compiled_elapsed:,.0f} rows/s)')
+    print(f'per-rule loop:      {naive_elapsed:.3f}s ({args.rows / naive_elapsed:,.0f} rows/s, extrapolated)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,302 @@
+"""Compare server CPU for N idle dashboards: pushed change events vs. polling
+
+Seeds a synthetic ledger, then measures two ways of keeping N open dashboards fresh
+while transactions are written at a steady rate:
+
+  events   N clients hold GET /api/events open on the event server (flask
+           serve-events) and refetch nothing until a change is pushed
+  polling  N clients fetch the four dashboard routes from gunicorn every
+           --poll-interval seconds, as a frontend without push would
+
+Server CPU is read from /proc for the server process and its children (the gunicorn
+workers), so it excludes this script's own clients. For events, the delay between a
+write committing and each client receiving its notification is reported too.
+
+    python benchmarks/bench_events.py --clients 1000 --duration 30 --poll-interval 10
+"""
+import argparse
+import asyncio
+import bisect
+import json
+import os
+import random
+import resource
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date
+
+from common import BACKEND_DIR, create_database, percentile
+from load_test import wait_until_ready
+from synth import generate_ledger
+
+# What the dashboard loads (and would reload on every poll)
+DASHBOARD_ROUTES = [
+    '/api/transactions?limit=50',
+    '/api/analytics/financial-overview',
+    '/api/analytics/spending-by-category?period=month',
+    '/api/categories'
+]
+
+CONNECT_CONCURRENCY = 100
+
+
+def process_tree_cpu(pid):
+    """CPU seconds (user + system) used so far by pid and its live descendants"""
+    children = {}
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as stat:
+                fields = stat.read().rsplit(')', 1)[1].split()
+        except OSError:
+            continue  # Exited while we were looking
+        children.setdefault(int(fields[1]), []).append((int(entry), int(fields[11]) + int(fields[12])))
+
+    ticks = 0
+    with open(f'/proc/{pid}/stat') as stat:
+        fields = stat.read().rsplit(')', 1)[1].split()
+        ticks += int(fields[11]) + int(fields[12])
+    pending = [pid]
+    while pending:
+        for child, child_ticks in children.get(pending.pop(), []):
+            ticks += child_ticks
+            pending.append(child)
+    return ticks / os.sysconf('SC_CLK_TCK')
+
+
+def raise_file_limit(clients):
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    wanted = clients + 256
+    if soft != resource.RLIM_INFINITY and soft < wanted:
+        limit = wanted if hard == resource.RLIM_INFINITY else min(wanted, hard)
+        resource.setrlimit(resource.RLIMIT_NOFILE, (limit, hard))
+        if limit < wanted:
+            print(f'warning: open file limit is {limit}; some of the {clients} clients may fail to connect')
+
+
+def start_server(args, db_path, port):
+    env = dict(os.environ, FINANCE_TRACKER_DATABASE=db_path, FINANCE_TRACKER_ACCESS_LOG='',
+               FINANCE_TRACKER_LOG_LEVEL='warning')
+    if args.mode == 'events':
+        command = [sys.executable, '-m', 'flask', '--app', 'finance-tracker-backend.py', 'serve-events',
+                   '--port', str(port)]
+    else:
+        command = [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'wsgi:app',
+                   '--workers', str(args.workers), '--threads', str(args.threads), '--bind', f'127.0.0.1:{port}']
+    return subprocess.Popen(command, cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL)
+
+
+async def wait_for_port(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            _, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.close()
+            return
+        except OSError:
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f'Nothing listening on port {port}')
+
+
+async def fetch_json(port, path):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    try:
+        writer.write(f'GET {path} HTTP/1.1\r\nHost: localhost\r\nConnection: close\r\n\r\n'.encode())
+        response = await reader.read()
+    finally:
+        writer.close()
+    return json.loads(response.split(b'\r\n\r\n', 1)[1])
+
+
+class Writer:
+    """Creates a transaction every interval seconds, recording (seq, commit time)"""
+
+    def __init__(self, db_path, interval):
+        self.app = create_database(db_path)
+        self.client = self.app.test_client()
+        self.db_pool = self.app.extensions['finance_tracker']['db_pool']
+        self.interval = interval
+        self.writes = []
+        self.rng = random.Random(11)
+
+    def write(self):
+        response = self.client.post('/api/transactions', json={
+            'date': date.today().isoformat(), 'description': 'Load test purchase', 'category': 'Other',
+            'amount': -round(self.rng.uniform(1, 50), 2), 'type': 'expense'})
+        committed = time.monotonic()
+        assert response.status_code == 201, response.get_data(as_text=True)
+        with self.db_pool.connection() as conn:
+            seq = conn.execute('SELECT MAX(seq) FROM change_log').fetchone()[0]
+        self.writes.append((seq, committed))
+
+    async def run(self, deadline):
+        loop = asyncio.get_running_loop()
+        while time.monotonic() + self.interval < deadline:
+            await asyncio.sleep(self.interval)
+            # A commit blocks for a few milliseconds; keep the clients' loop running
+            await loop.run_in_executor(None, self.write)
+
+
+class EventClient:
+    """Holds GET /api/events open, recording (seq, receive time) of each change event"""
+
+    def __init__(self):
+        self.events = []
+        self.ready = False
+        self.failed = False
+
+    async def run(self, port, connect_slots):
+        try:
+            async with connect_slots:
+                reader, writer = await asyncio.open_connection('127.0.0.1', port)
+                writer.write(b'GET /api/events HTTP/1.1\r\nHost: localhost\r\nAccept: text/event-stream\r\n\r\n')
+            event = None
+            while line := await reader.readline():
+                if line.startswith(b'event: '):
+                    event = line[7:].strip()
+                elif line.startswith(b'data: '):
+                    if event == b'ready':
+                        self.ready = True
+                    elif event == b'change':
+                        self.events.append((json.loads(line[6:])['seq'], time.monotonic()))
+        except OSError:
+            self.failed = True
+
+    def latencies(self, writes):
+        """Milliseconds from each write committing until this client was told of it"""
+        seqs = [seq for seq, _ in self.events]
+        result = []
+        for seq, committed in writes:
+            index = bisect.bisect_left(seqs, seq)
+            if index < len(seqs):
+                result.append((self.events[index][1] - committed) * 1000)
+        return result
+
+
+async def poll_client(port, interval, deadline, offset, counts):
+    """Reload the dashboard every interval seconds, counting responses by status"""
+    await asyncio.sleep(offset)
+    while time.monotonic() < deadline:
+        started = time.monotonic()
+        try:
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            for path in DASHBOARD_ROUTES:
+                writer.write(f'GET {path} HTTP/1.1\r\nHost: localhost\r\n\r\n'.encode())
+                status = int((await reader.readline()).split()[1])
+                length = 0
+                while (line := await reader.readline()) not in (b'\r\n', b''):
+                    name, _, value = line.partition(b':')
+                    if name.lower() == b'content-length':
+                        length = int(value)
+                await reader.readexactly(length)
+                counts[status] = counts.get(status, 0) + 1
+            writer.close()
+        except (OSError, ValueError, IndexError, asyncio.IncompleteReadError):
+            counts['failed'] = counts.get('failed', 0) + 1
+        await asyncio.sleep(max(0, interval - (time.monotonic() - started)))
+
+
+async def measure_events(args, server, port, writer):
+    connect_slots = asyncio.Semaphore(CONNECT_CONCURRENCY)
+    clients = [EventClient() for _ in range(args.clients)]
+    tasks = [asyncio.create_task(client.run(port, connect_slots)) for client in clients]
+
+    # Wait for every client to be subscribed before measuring
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        stats = await fetch_json(port, '/api/events/stats')
+        if stats['subscribers'] + sum(client.failed for client in clients) >= args.clients:
+            break
+        await asyncio.sleep(0.5)
+
+    cpu_before, started = process_tree_cpu(server.pid), time.monotonic()
+    await writer.run(started + args.duration)
+    await asyncio.sleep(max(0, started + args.duration - time.monotonic()))
+    cpu = process_tree_cpu(server.pid) - cpu_before
+    stats = await fetch_json(port, '/api/events/stats')
+
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+    latencies = [latency for client in clients for latency in client.latencies(writer.writes)]
+    expected = len(writer.writes) * sum(client.ready for client in clients)
+    print(f'  subscribed {stats["subscribers"]:,} of {args.clients:,} clients '
+          f'({sum(client.failed for client in clients)} failed to connect)')
+    print(f'  server CPU {cpu:.2f}s over {args.duration}s ({cpu / args.duration:.1%} of a core), '
+          f'{stats["polls"]:,} database polls')
+    print(f'  {len(writer.writes)} writes, {stats["events_published"]} events published, '
+          f'{len(latencies):,} of {expected:,} notifications received')
+    print(f'  notification delay p50 {percentile(latencies, 0.5):.0f} ms, '
+          f'p99 {percentile(latencies, 0.99):.0f} ms')
+
+
+async def measure_polling(args, server, port, writer):
+    await asyncio.get_running_loop().run_in_executor(None, wait_until_ready, port)
+    counts = {}
+    started = time.monotonic()
+    deadline = started + args.duration
+    rng = random.Random(5)
+    tasks = [asyncio.create_task(poll_client(port, args.poll_interval, deadline,
+                                             rng.uniform(0, args.poll_interval), counts))
+             for _ in range(args.clients)]
+
+    cpu_before = process_tree_cpu(server.pid)
+    await writer.run(deadline)
+    await asyncio.sleep(max(0, deadline - time.monotonic()))
+    cpu = process_tree_cpu(server.pid) - cpu_before
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+    requests = sum(count for status, count in counts.items() if status != 'failed')
+    errors = sum(count for status, count in counts.items() if status == 'failed' or status >= 400)
+    print(f'  {requests:,} requests ({requests / args.duration:,.0f}/s), {errors:,} errors or failed polls')
+    print(f'  server CPU {cpu:.2f}s over {args.duration}s ({cpu / args.duration:.1%} of a core)')
+    print(f'  {len(writer.writes)} writes; a dashboard sees each about {args.poll_interval / 2:g}s '
+          f'later on average (half the poll interval)')
+
+
+def run(args, db_path, port):
+    print(f'\n{args.mode}: {args.clients:,} idle clients, {args.duration}s, a write every {args.write_interval:g}s')
+    server = start_server(args, db_path, port)
+    try:
+        writer = Writer(db_path, args.write_interval)
+        if args.mode == 'events':
+            asyncio.run(wait_for_port(port))
+            asyncio.run(measure_events(args, server, port, writer))
+        else:
+            asyncio.run(measure_polling(args, server, port, writer))
+    finally:
+        server.send_signal(signal.SIGTERM)
+        server.wait(timeout=60)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--modes', default='events,polling', help='comma-separated: events, polling')
+    parser.add_argument('--clients', type=int, default=1000, help='connected dashboards')
+    parser.add_argument('--duration', type=int, default=30, help='seconds to measure each mode')
+    parser.add_argument('--poll-interval', type=float, default=10, help='seconds between dashboard reloads')
+    parser.add_argument('--write-interval', type=float, default=1, help='seconds between writes')
+    parser.add_argument('--rows', type=int, default=50000, help='transactions to seed')
+    parser.add_argument('--workers', type=int, default=2, help='gunicorn workers (polling)')
+    parser.add_argument('--threads', type=int, default=4, help='gunicorn threads per worker (polling)')
+    parser.add_argument('--port', type=int, default=5056)
+    args = parser.parse_args()
+
+    raise_file_limit(args.clients)
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'events.db')
+        generate_ledger(db_path, rows=args.rows)
+        for mode in args.modes.split(','):
+            args.mode = mode
+            run(args, db_path, args.port)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+"""Benchmark the bulk transaction import endpoint
+
+Posts a statement of synthetic transactions through the Flask test client, then
+re-imports it with dedupe enabled to show re-imports are idempotent.
+
+    python benchmarks/bench_import.py --rows 50000
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+from datetime import date, timedelta
+
+from common import create_database
+
+CATEGORIES = ['Groceries', 'Housing', 'Transportation', 'Dining Out', 'Entertainment', 'Utilities']
+
+
+def make_rows(count):
+    rng = random.Random(7)
+    start = date.today() - timedelta(days=365)
+    return [{
+        'date': (start + timedelta(days=rng.randint(0, 365))).isoformat(),
+        'description': f'Merchant {rng.randint(1, 2000)}',
+        'amount': -round(rng.uniform(1, 300), 2),
+        'type': 'expense',
+        'category': rng.choice(CATEGORIES)
+    } for _ in range(count)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=50000)
+    args = parser.parse_args()
+
+    rows = make_rows(args.rows)
+    with tempfile.TemporaryDirectory() as tmp:
+        app = create_database(os.path.join(tmp, 'bench.db'))
+        client = app.test_client()
+
+        started = time.perf_counter()
+        first = client.post('/api/transactions/bulk', json=rows).get_json()
+        import_elapsed = time.perf_counter() - started
+
+        started = time.perf_counter()
+        second = client.post('/api/transactions/bulk?dedupe=true', json=rows).get_json()
+        dedupe_elapsed = time.perf_counter() - started
+        app.extensions['finance_tracker']['db_pool'].close_all()
+
+    print(f'rows:               {args.rows}')
+    print(f'import:             {import_elapsed:.3f}s ({first["inserted"] / import_elapsed:,.0f} rows/s)')
+    print(f'dedupe re-import:   {dedupe_elapsed:.3f}s, inserted {second["inserted"]}, '
+          f'skipped {len(second["duplicates"])}')
+
+
+if __name__ == '__main__':
+    main()
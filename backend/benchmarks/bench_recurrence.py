@@ -0,0 +1,90 @@
+"""Parity check and microbenchmark for recurrence expansion
+
+First verifies that recurrence.expand_occurrences() produces exactly the dates
+obtained by chaining calculate_next_occurrence() (every start day of a leap year and
+every month end of the surrounding years, for every frequency), then times both
+approaches expanding the same rules.
+
+    python benchmarks/bench_recurrence.py --rules 2000 --years 10
+"""
+import argparse
+import random
+import time
+from datetime import date, timedelta
+
+from common import load_backend
+
+from recurrence import expand_occurrences
+
+FREQUENCIES = ['weekly', 'biweekly', 'monthly', 'quarterly', 'yearly']
+
+
+def chained(calculate_next_occurrence, first, frequency, until):
+    """Reference expansion: one calculate_next_occurrence() call per step"""
+    until = until.isoformat()
+    occurrences = []
+    current = first
+    while current <= until:
+        occurrences.append(current)
+        current = calculate_next_occurrence(current, frequency)
+    return occurrences, current
+
+
+def parity_starts():
+    starts = [date(2020, 1, 1) + timedelta(days=i) for i in range(366)]
+    for year in range(2017, 2026):
+        for month in range(1, 13):
+            first_of_next = date(year + (month == 12), month % 12 + 1, 1)
+            starts.append(first_of_next - timedelta(days=1))
+    return starts
+
+
+def check_parity(calculate_next_occurrence):
+    until = date(2026, 12, 31)
+    checked = 0
+    for start in parity_starts():
+        for frequency in FREQUENCIES:
+            first = start.isoformat()
+            expected = chained(calculate_next_occurrence, first, frequency, until)
+            actual = expand_occurrences(first, frequency, until)
+            if actual != expected:
+                raise AssertionError(f'{frequency} from {first}: {actual[0][:5]}... != {expected[0][:5]}...')
+            checked += 1
+    return checked
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rules', type=int, default=2000)
+    parser.add_argument('--years', type=int, default=10)
+    args = parser.parse_args()
+
+    calculate_next_occurrence = load_backend().calculate_next_occurrence
+
+    started = time.perf_counter()
+    checked = check_parity(calculate_next_occurrence)
+    print(f'parity:    {checked} rule expansions identical ({time.perf_counter() - started:.1f}s)')
+
+    rng = random.Random(3)
+    today = date.today()
+    until = today + timedelta(days=365 * args.years)
+    rules = [((today + timedelta(days=rng.randint(0, 60))).isoformat(), rng.choice(FREQUENCIES))
+             for _ in range(args.rules)]
+
+    started = time.perf_counter()
+    old_total = sum(len(chained(calculate_next_occurrence, first, f, until)[0]) for first, f in rules)
+    old_elapsed = time.perf_counter() - started
+
+    started = time.perf_counter()
+    new_total = sum(len(expand_occurrences(first, f, until)[0]) for first, f in rules)
+    new_elapsed = time.perf_counter() - started
+
+    assert old_total == new_total
+    print(f'rules:     {args.rules} over {args.years} years ({new_total} occurrences)')
+    print(f'chained:   {old_elapsed:.3f}s ({old_total / old_elapsed:,.0f} dates/s)')
+    print(f'expanded:  {new_elapsed:.3f}s ({new_total / new_elapsed:,.0f} dates/s)')
+    print(f'speedup:   {old_elapsed / new_elapsed:.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+"""Benchmark catch-up materialization of recurring transactions
+
+Creates many recurring templates whose next_occurrence lies years in the past and
+times a single materialization pass.
+
+    python benchmarks/bench_recurring.py --templates 20000 --years 2
+"""
+import argparse
+import os
+import random
+import sqlite3
+import tempfile
+import time
+from datetime import date, timedelta
+
+from common import create_database
+
+from recurrence import materialize_due_occurrences
+
+FREQUENCIES = ['weekly', 'biweekly', 'monthly', 'quarterly', 'yearly']
+
+
+def seed_templates(conn, count, years, today):
+    rng = random.Random(42)
+    rows = []
+    for i in range(count):
+        start = today - timedelta(days=rng.randint(1, years * 365))
+        rows.append((f'Rule {i}', -round(rng.uniform(5, 500), 2), 'expense', 'Bills', '',
+                     rng.choice(FREQUENCIES), start.isoformat(), None, start.isoformat(), 1))
+    conn.executemany('''
+        INSERT INTO recurring_transactions
+        (description, amount, type, category, notes, frequency, start_date, end_date, next_occurrence, is_active)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', rows)
+    conn.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--templates', type=int, default=20000)
+    parser.add_argument('--years', type=int, default=2, help='maximum backlog per template')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.db')
+        create_database(path)
+        conn = sqlite3.connect(path)
+        conn.row_factory = sqlite3.Row
+        today = date.today()
+        seed_templates(conn, args.templates, args.years, today)
+
+        started = time.perf_counter()
+        created = materialize_due_occurrences(conn, today)
+        elapsed = time.perf_counter() - started
+
+        # A second pass must find nothing left to do
+        again = materialize_due_occurrences(conn, today)
+        conn.close()
+
+    print(f'templates:        {args.templates}')
+    print(f'rows created:     {created}')
+    print(f'elapsed:          {elapsed:.3f}s')
+    print(f'rows/second:      {created / elapsed:,.0f}')
+    print(f'second pass rows: {again}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+"""Measure cold start: process launch to the first served request
+
+Each run starts a fresh interpreter that imports the backend, calls create_app()
+and serves one transactions page through the test client. For comparison it also
+times the SELECT COUNT(*) the old startup path ran before seeding.
+
+    python benchmarks/bench_startup.py --rows 1000000
+    python benchmarks/bench_startup.py --database /path/to/finance_tracker.db
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+from common import BACKEND_DIR, create_database
+
+CHILD = '''
+import json, sqlite3, sys, time
+started = time.perf_counter()
+sys.path.insert(0, {benchmarks!r})
+import common
+backend = common.load_backend()
+imported = time.perf_counter()
+app = backend.create_app({{'DATABASE': {database!r}}})
+created = time.perf_counter()
+response = app.test_client().get('/api/transactions?limit=50')
+assert response.status_code == 200, response.status_code
+served = time.perf_counter()
+conn = sqlite3.connect({database!r})
+conn.execute('SELECT COUNT(*) FROM transactions').fetchone()
+counted = time.perf_counter()
+print(json.dumps({{'import': imported - started, 'create_app': created - imported,
+                  'first_request': served - created, 'total': served - started,
+                  'count': counted - served}}))
+'''
+
+
+def generate(path, rows, batch=100000):
+    app = create_database(path)
+    db_pool = app.extensions['finance_tracker']['db_pool']
+    rng = random.Random(7)
+    start = date.today() - timedelta(days=3650)
+    with db_pool.connection() as conn:
+        for offset in range(0, rows, batch):
+            conn.executemany('''
+                INSERT INTO transactions (date, description, amount, type, category, notes)
+                VALUES (?, ?, ?, 'expense', ?, '')
+            ''', [((start + timedelta(days=rng.randint(0, 3650))).isoformat(), f'Merchant {rng.randint(1, 5000)}',
+                   -round(rng.uniform(1, 300), 2), rng.choice(['Groceries', 'Housing', 'Other']))
+                  for _ in range(min(batch, rows - offset))])
+            conn.commit()
+    db_pool.close_all()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database', help='existing database to start against')
+    parser.add_argument('--rows', type=int, default=200000, help='transactions to generate otherwise')
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database = args.database
+        if database is None:
+            database = os.path.join(tmp, 'startup.db')
+            generate(database, args.rows)
+
+        code = CHILD.format(benchmarks=os.path.join(BACKEND_DIR, 'benchmarks'), database=os.path.abspath(database))
+        runs = []
+        for _ in range(args.runs):
+            started = time.perf_counter()
+            output = subprocess.run([sys.executable, '-c', code], cwd=BACKEND_DIR, capture_output=True,
+                                    text=True, check=True).stdout
+            timings = json.loads(output.strip().splitlines()[-1])
+            timings['process'] = time.perf_counter() - started
+            runs.append(timings)
+
+        size = os.path.getsize(database)
+
+    print(f'database:          {size / 1e6:,.1f} MB')
+    for name in ('process', 'import', 'create_app', 'first_request', 'count'):
+        label = 'COUNT(*) (old path)' if name == 'count' else name
+        print(f'{label + ":":<19}{statistics.median(run[name] for run in runs) * 1000:8.1f} ms (median of {args.runs})')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,619 @@
+"""Benchmark every API route against a synthetic ledger
+
+Generates a ledger with synth.py (or copies one made earlier with --ledger), then runs
+a timed scenario per route through the Flask test client: read scenarios first, then
+writes. Each scenario reports throughput, latency percentiles and the peak Python
+memory allocated while serving one request, and the results are written as JSON so
+runs on different commits can be compared (--compare).
+
+The response cache is disabled unless --response-cache is given, so read scenarios
+measure the queries rather than cache hits.
+
+    python benchmarks/bench_suite.py --rows 1000000
+    python benchmarks/synth.py /tmp/ledger-10m.db --rows 10000000 --years 10
+    python benchmarks/bench_suite.py --ledger /tmp/ledger-10m.db --compare results/before.json
+"""
+import argparse
+import fnmatch
+import io
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date, datetime, timedelta
+from urllib.parse import quote
+
+from common import BACKEND_DIR, load_backend, percentile
+from synth import EXPENSE_PROFILES, generate_ledger
+
+try:
+    import resource
+except ImportError:  # Windows: peak RSS is not reported
+    resource = None
+
+RESULTS_DIR = os.path.join(BACKEND_DIR, 'benchmarks', 'results')
+
+# (name, method, route, build, setup); build(ctx) returns (path, client.open() kwargs)
+SCENARIOS = []
+
+
+def scenario(name, method, route, setup=None):
+    """Register a scenario whose request is built by the decorated function"""
+    def decorator(build):
+        SCENARIOS.append((name, method, route, build, setup))
+        return build
+    return decorator
+
+
+class Context:
+    """Request parameters drawn from the ledger, plus ids created by setup steps"""
+
+    def __init__(self, app, seed):
+        self.client = app.test_client()
+        self.rng = random.Random(seed)
+        self.db_pool = app.extensions['finance_tracker']['db_pool']
+        self.pending = []  # Ids created by a setup step for the next request to use
+        with self.db_pool.connection() as conn:
+            self.first_date, self.last_date, self.max_id = conn.execute(
+                'SELECT MIN(date), MAX(date), MAX(id) FROM transactions').fetchone()
+            self.account_ids = [row[0] for row in conn.execute('SELECT id FROM accounts')]
+            self.recurring_ids = [row[0] for row in conn.execute('SELECT id FROM recurring_transactions')]
+            self.rule_ids = [row[0] for row in conn.execute('SELECT id FROM categorization_rules')]
+            self.categories = [row[0] for row in conn.execute('SELECT DISTINCT category FROM transactions')]
+            self.max_seq = conn.execute('SELECT COALESCE(MAX(seq), 0) FROM change_log').fetchone()[0]
+        self.merchants = [merchant for merchants, _, _ in EXPENSE_PROFILES.values() for merchant in merchants]
+        self._deletable = None
+        self.deleted = set()  # Ids handed out by deletable_id()
+
+    def day(self):
+        """A random date within the ledger"""
+        first = date.fromisoformat(self.first_date)
+        span = (date.fromisoformat(self.last_date) - first).days
+        return first + timedelta(days=self.rng.randint(0, span))
+
+    def month_range(self):
+        start = self.day().replace(day=1)
+        end = (start + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+        return start.isoformat(), end.isoformat()
+
+    def transaction_id(self):
+        """A random id of a seeded transaction that no scenario has deleted"""
+        while True:
+            transaction_id = self.rng.randint(1, self.max_id)
+            if transaction_id not in self.deleted:
+                return transaction_id
+
+    def deletable_id(self):
+        """A transaction id not handed out before (deleted rows can't be deleted twice)"""
+        if self._deletable is None:
+            self._deletable = self.rng.sample(range(1, self.max_id + 1), min(self.max_id, 100000))
+        transaction_id = self._deletable.pop()
+        self.deleted.add(transaction_id)
+        return transaction_id
+
+    def new_transaction(self, with_category=True):
+        merchant = self.rng.choice(self.merchants)
+        transaction = {'date': self.day().isoformat(), 'description': f'{merchant} #{self.rng.randint(100, 999)}',
+                       'amount': -round(self.rng.uniform(3, 150), 2), 'type': 'expense'}
+        if with_category:
+            transaction['category'] = self.rng.choice(self.categories)
+        return transaction
+
+    def create(self, path, body):
+        """Create an entity through the API (untimed) and queue its id"""
+        response = self.client.post(path, json=body)
+        assert response.status_code == 201, (path, response.status_code, response.get_data(as_text=True))
+        self.pending.append(response.get_json()['id'])
+
+    def execute(self, sql, params=()):
+        with self.db_pool.connection() as conn:
+            conn.execute(sql, params)
+            conn.commit()
+
+
+# ==================== READ SCENARIOS ====================
+
+@scenario('transactions: first page', 'GET', '/api/transactions')
+def transactions_first_page(ctx):
+    return '/api/transactions?limit=50', {}
+
+
+@scenario('transactions: deep page', 'GET', '/api/transactions')
+def transactions_deep_page(ctx):
+    cursor = load_backend().encode_cursor({'date': ctx.day().isoformat(), 'id': ctx.max_id})
+    return f'/api/transactions?limit=50&cursor={cursor}', {}
+
+
+@scenario('transactions: category + month', 'GET', '/api/transactions')
+def transactions_filtered(ctx):
+    start, end = ctx.month_range()
+    category = ctx.rng.choice(ctx.categories)
+    return f'/api/transactions?category={quote(category)}&start_date={start}&end_date={end}&limit=100', {}
+
+
+@scenario('transactions: full month', 'GET', '/api/transactions')
+def transactions_month(ctx):
+    start, end = ctx.month_range()
+    return f'/api/transactions?start_date={start}&end_date={end}', {}
+
+
+@scenario('transactions: projected fields', 'GET', '/api/transactions')
+def transactions_fields(ctx):
+    return '/api/transactions?limit=500&fields=date,amount,category', {}
+
+
+@scenario('transactions: search', 'GET', '/api/transactions')
+def transactions_search(ctx):
+    word = ctx.rng.choice(ctx.merchants).split()[0]
+    return f'/api/transactions?q={word}&limit=50', {}
+
+
+@scenario('transactions: search by relevance', 'GET', '/api/transactions')
+def transactions_search_relevance(ctx):
+    word = ctx.rng.choice(ctx.merchants).split()[0]
+    return f'/api/transactions?q={word}&sort=relevance&limit=50', {}
+
+
+@scenario('transactions: export month (ndjson)', 'GET', '/api/transactions/export')
+def export_month(ctx):
+    start, end = ctx.month_range()
+    return f'/api/transactions/export?start_date={start}&end_date={end}', {}
+
+
+@scenario('transactions: export year (csv, gzip)', 'GET', '/api/transactions/export')
+def export_year(ctx):
+    end = ctx.day()
+    start = end - timedelta(days=365)
+    return (f'/api/transactions/export?format=csv&start_date={start}&end_date={end}',
+            {'headers': {'Accept-Encoding': 'gzip'}})
+
+
+@scenario('recurring: list', 'GET', '/api/recurring-transactions')
+def recurring_list(ctx):
+    return '/api/recurring-transactions', {}
+
+
+@scenario('changes: full sync page', 'GET', '/api/changes')
+def changes_full_sync(ctx):
+    return '/api/changes?since=0&limit=1000', {}
+
+
+@scenario('changes: last 100', 'GET', '/api/changes')
+def changes_recent(ctx):
+    return f'/api/changes?since={max(ctx.max_seq - 100, 0)}', {}
+
+
+@scenario('analytics: spending by category (month)', 'GET', '/api/analytics/spending-by-category')
+def spending_month(ctx):
+    return '/api/analytics/spending-by-category?period=month', {}
+
+
+@scenario('analytics: spending by category (year)', 'GET', '/api/analytics/spending-by-category')
+def spending_year(ctx):
+    return '/api/analytics/spending-by-category?period=year', {}
+
+
+@scenario('analytics: financial overview', 'GET', '/api/analytics/financial-overview')
+def financial_overview(ctx):
+    return '/api/analytics/financial-overview', {}
+
+
+@scenario('analytics: time series (month)', 'GET', '/api/analytics/time-series')
+def time_series_month(ctx):
+    return f'/api/analytics/time-series?start_date={ctx.first_date}&end_date={ctx.last_date}', {}
+
+
+@scenario('analytics: time series (day, by category)', 'GET', '/api/analytics/time-series')
+def time_series_day(ctx):
+    return '/api/analytics/time-series?granularity=day&by_category=true', {}
+
+
+@scenario('analytics: forecast', 'GET', '/api/analytics/forecast')
+def forecast_months(ctx):
+    return '/api/analytics/forecast?months=24', {}
+
+
+@scenario('analytics: forecast (daily)', 'GET', '/api/analytics/forecast')
+def forecast_days(ctx):
+    return '/api/analytics/forecast?months=12&granularity=day', {}
+
+
+@scenario('budget goals: get', 'GET', '/api/budget-goals')
+def budget_goals(ctx):
+    return '/api/budget-goals', {}
+
+
+@scenario('budget goals: variance', 'GET', '/api/budget-goals/variance')
+def budget_variance(ctx):
+    return '/api/budget-goals/variance', {}
+
+
+@scenario('categorization rules: list', 'GET', '/api/categorization-rules')
+def rules_list(ctx):
+    return '/api/categorization-rules', {}
+
+
+@scenario('accounts: list', 'GET', '/api/accounts')
+def accounts_list(ctx):
+    return '/api/accounts', {}
+
+
+@scenario('accounts: history', 'GET', '/api/accounts/<id>/history')
+def account_history(ctx):
+    return f'/api/accounts/{ctx.rng.choice(ctx.account_ids)}/history', {}
+
+
+@scenario('categories', 'GET', '/api/categories')
+def categories(ctx):
+    return '/api/categories', {}
+
+
+@scenario('recurring scheduler stats', 'GET', '/api/process-recurring')
+def scheduler_stats(ctx):
+    return '/api/process-recurring', {}
+
+
+@scenario('pool stats', 'GET', '/api/pool-stats')
+def pool_stats(ctx):
+    return '/api/pool-stats', {}
+
+
+@scenario('cache stats', 'GET', '/api/cache-stats')
+def cache_stats(ctx):
+    return '/api/cache-stats', {}
+
+
+@scenario('metrics', 'GET', '/metrics')
+def metrics(ctx):
+    return '/metrics', {}
+
+
+# ==================== WRITE SCENARIOS ====================
+
+@scenario('transactions: create', 'POST', '/api/transactions')
+def create_transaction(ctx):
+    return '/api/transactions', {'json': ctx.new_transaction()}
+
+
+@scenario('transactions: create (auto-categorized)', 'POST', '/api/transactions')
+def create_transaction_auto(ctx):
+    return '/api/transactions', {'json': ctx.new_transaction(with_category=False)}
+
+
+@scenario('transactions: update', 'PUT', '/api/transactions/<id>')
+def update_transaction(ctx):
+    return (f'/api/transactions/{ctx.transaction_id()}',
+            {'json': {'amount': -round(ctx.rng.uniform(3, 150), 2), 'category': ctx.rng.choice(ctx.categories)}})
+
+
+@scenario('transactions: delete', 'DELETE', '/api/transactions/<id>')
+def delete_transaction(ctx):
+    return f'/api/transactions/{ctx.deletable_id()}', {}
+
+
+@scenario('transactions: bulk import 1000 (JSON)', 'POST', '/api/transactions/bulk')
+def bulk_import(ctx):
+    return '/api/transactions/bulk', {'json': [ctx.new_transaction(with_category=index % 2 == 0)
+                                               for index in range(1000)]}
+
+
+@scenario('transactions: bulk import 1000 (CSV upload, dedupe)', 'POST', '/api/transactions/bulk')
+def bulk_upload(ctx):
+    lines = ['date,description,amount,type,category']
+    for _ in range(1000):
+        row = ctx.new_transaction()
+        lines.append(f"{row['date']},{row['description']},{row['amount']},{row['type']},{row['category']}")
+    upload = (io.BytesIO('\n'.join(lines).encode()), 'statement.csv')
+    return '/api/transactions/bulk', {'data': {'file': upload, 'dedupe': 'true'}}
+
+
+@scenario('transactions: recategorize month (dry run)', 'POST', '/api/transactions/recategorize')
+def recategorize_month(ctx):
+    start, end = ctx.month_range()
+    return '/api/transactions/recategorize', {'json': {'start_date': start, 'end_date': end, 'dry_run': True}}
+
+
+@scenario('batch: recategorize 500 transactions', 'POST', '/api/batch')
+def batch_recategorize(ctx):
+    category = ctx.rng.choice(ctx.categories)
+    ids = {ctx.transaction_id() for _ in range(500)}
+    return '/api/batch', {'json': {'operations': [
+        {'op': 'update', 'entity': 'transaction', 'id': transaction_id, 'data': {'category': category}}
+        for transaction_id in ids]}}
+
+
+@scenario('batch: 100 mixed operations', 'POST', '/api/batch')
+def batch_mixed(ctx):
+    operations = [{'op': 'create', 'entity': 'transaction', 'data': ctx.new_transaction()} for _ in range(50)]
+    operations += [{'op': 'update', 'entity': 'transaction', 'id': ctx.transaction_id(),
+                    'data': {'amount': -round(ctx.rng.uniform(3, 150), 2)}} for _ in range(49)]
+    operations.append({'op': 'delete', 'entity': 'transaction', 'id': ctx.deletable_id()})
+    return '/api/batch', {'json': {'operations': operations}}
+
+
+@scenario('recurring: create', 'POST', '/api/recurring-transactions')
+def create_recurring(ctx):
+    return '/api/recurring-transactions', {'json': {
+        'description': f'Subscription {ctx.rng.randint(1, 10 ** 6)}', 'amount': -9.99, 'type': 'expense',
+        'category': 'Entertainment', 'frequency': 'monthly', 'start_date': (date.today() + timedelta(days=1)).isoformat()}}
+
+
+@scenario('recurring: update', 'PUT', '/api/recurring-transactions/<id>')
+def update_recurring(ctx):
+    return (f'/api/recurring-transactions/{ctx.rng.choice(ctx.recurring_ids)}',
+            {'json': {'amount': -round(ctx.rng.uniform(5, 100), 2)}})
+
+
+def create_recurring_to_delete(ctx):
+    path, kwargs = create_recurring(ctx)
+    ctx.create(path, kwargs['json'])
+
+
+@scenario('recurring: delete', 'DELETE', '/api/recurring-transactions/<id>', setup=create_recurring_to_delete)
+def delete_recurring(ctx):
+    return f'/api/recurring-transactions/{ctx.pending.pop()}', {}
+
+
+def rewind_recurring(ctx):
+    # Leave a month of occurrences due for every active template
+    ctx.execute("UPDATE recurring_transactions SET next_occurrence = date('now', 'localtime', '-1 month') "
+                'WHERE is_active = 1')
+
+
+@scenario('recurring: process a month of due occurrences', 'POST', '/api/process-recurring', setup=rewind_recurring)
+def process_recurring(ctx):
+    return '/api/process-recurring', {}
+
+
+@scenario('budget goals: update', 'POST', '/api/budget-goals')
+def update_budget_goals(ctx):
+    return '/api/budget-goals', {'json': {'monthly_income': 5600, 'debt_payments': 800, 'savings': 1000,
+                                          'investments': 600, 'discretionary': ctx.rng.randint(2500, 3500)}}
+
+
+def new_rule(ctx):
+    return {'match_type': 'substring', 'pattern': f'vendor {ctx.rng.randint(1, 10 ** 6)}', 'category': 'Other'}
+
+
+@scenario('categorization rules: create', 'POST', '/api/categorization-rules')
+def create_rule(ctx):
+    return '/api/categorization-rules', {'json': new_rule(ctx)}
+
+
+@scenario('categorization rules: update', 'PUT', '/api/categorization-rules/<id>')
+def update_rule(ctx):
+    return (f'/api/categorization-rules/{ctx.rng.choice(ctx.rule_ids)}',
+            {'json': {'priority': ctx.rng.randint(1, 500)}})
+
+
+@scenario('categorization rules: delete', 'DELETE', '/api/categorization-rules/<id>',
+          setup=lambda ctx: ctx.create('/api/categorization-rules', new_rule(ctx)))
+def delete_rule(ctx):
+    return f'/api/categorization-rules/{ctx.pending.pop()}', {}
+
+
+@scenario('accounts: create', 'POST', '/api/accounts')
+def create_account(ctx):
+    return '/api/accounts', {'json': {'name': f'Account {ctx.rng.randint(1, 10 ** 6)}', 'type': 'Savings',
+                                      'balance': 1000}}
+
+
+# ==================== RUNNER ====================
+
+def timed_request(ctx, method, build, setup):
+    """Run setup (untimed), then one request, returning (seconds, status, body)"""
+    if setup is not None:
+        setup(ctx)
+    path, kwargs = build(ctx)
+    started = time.perf_counter()
+    response = ctx.client.open(path, method=method, **kwargs)
+    body = response.get_data()  # Consumes streamed responses too
+    elapsed = time.perf_counter() - started
+    response.close()
+    return elapsed, response.status_code, body
+
+
+def peak_rss_mib():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def run_scenario(ctx, name, method, route, build, setup, iterations, warmup, max_seconds):
+    for _ in range(warmup):
+        timed_request(ctx, method, build, setup)
+
+    latencies = []
+    errors = []
+    deadline = time.perf_counter() + max_seconds
+    while len(latencies) < iterations and (len(latencies) < 3 or time.perf_counter() < deadline):
+        elapsed, status, body = timed_request(ctx, method, build, setup)
+        latencies.append(elapsed)
+        if status >= 400:
+            errors.append(f'{status}: {body[:200].decode(errors="replace")}')
+
+    # One more request with allocation tracing on (it slows the request, so it isn't timed)
+    tracemalloc.start()
+    timed_request(ctx, method, build, setup)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    milliseconds = [latency * 1000 for latency in latencies]
+    return {
+        'name': name,
+        'method': method,
+        'route': route,
+        'iterations': len(latencies),
+        'errors': len(errors),
+        'first_error': errors[0] if errors else None,
+        'throughput_rps': round(len(latencies) / sum(latencies), 2),
+        'latency_ms': {
+            'min': round(min(milliseconds), 3),
+            'mean': round(statistics.fmean(milliseconds), 3),
+            'p50': round(percentile(milliseconds, 0.5), 3),
+            'p90': round(percentile(milliseconds, 0.9), 3),
+            'p95': round(percentile(milliseconds, 0.95), 3),
+            'p99': round(percentile(milliseconds, 0.99), 3),
+            'max': round(max(milliseconds), 3)
+        },
+        'peak_python_kib': round(peak / 1024, 1),
+        'peak_rss_mib': peak_rss_mib()
+    }
+
+
+def git_revision():
+    """Return {'commit', 'dirty'} for the working tree, or None outside a git checkout"""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BACKEND_DIR, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        status = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=BACKEND_DIR,
+                                capture_output=True, text=True, check=True).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return {'commit': commit, 'dirty': bool(status.strip())}
+
+
+def describe_ledger(path):
+    conn = sqlite3.connect(path)
+    try:
+        rows, first, last = conn.execute('SELECT COUNT(*), MIN(date), MAX(date) FROM transactions').fetchone()
+    finally:
+        conn.close()
+    return {'rows': rows, 'start_date': first, 'end_date': last, 'size_bytes': os.path.getsize(path)}
+
+
+def copy_database(source, target):
+    """Copy a (possibly live, WAL-mode) SQLite database with the backup API"""
+    src = sqlite3.connect(f'file:{source}?mode=ro', uri=True)
+    dst = sqlite3.connect(target)
+    try:
+        src.backup(dst)
+    finally:
+        src.close()
+        dst.close()
+
+
+def print_results(results, baseline=None):
+    before = {scenario['name']: scenario for scenario in (baseline or {}).get('scenarios', [])}
+    header = f'{"scenario":<52} {"req/s":>9} {"p50 ms":>9} {"p95 ms":>9} {"p99 ms":>9} {"peak KiB":>9} {"err":>4}'
+    if before:
+        header += f' {"p50 vs base":>12}'
+    print(header)
+    for scenario in results['scenarios']:
+        latency = scenario['latency_ms']
+        line = (f'{scenario["name"]:<52} {scenario["throughput_rps"]:>9,.1f} {latency["p50"]:>9.2f} '
+                f'{latency["p95"]:>9.2f} {latency["p99"]:>9.2f} {scenario["peak_python_kib"]:>9,.0f} '
+                f'{scenario["errors"]:>4}')
+        old = before.get(scenario['name'])
+        if old and old['latency_ms']['p50']:
+            change = (latency['p50'] - old['latency_ms']['p50']) / old['latency_ms']['p50'] * 100
+            line += f' {change:>+11.1f}%'
+        print(line)
+        if scenario['first_error']:
+            print(f'    first error: {scenario["first_error"]}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ledger = parser.add_argument_group('ledger (ignored with --ledger)')
+    ledger.add_argument('--rows', type=int, default=100000, help='transactions to generate')
+    ledger.add_argument('--categories', type=int, default=12)
+    ledger.add_argument('--recurring', type=int, default=50, help='recurring templates')
+    ledger.add_argument('--years', type=float, default=3, help='date span ending today')
+    ledger.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--ledger', help='database made by synth.py to run against (a copy is used)')
+    parser.add_argument('--iterations', type=int, default=30, help='timed requests per scenario')
+    parser.add_argument('--warmup', type=int, default=2, help='untimed requests per scenario')
+    parser.add_argument('--max-seconds', type=float, default=10,
+                        help='stop a scenario early after this long (at least 3 requests are timed)')
+    parser.add_argument('--scenarios', help='comma-separated name patterns to run, e.g. "analytics*,categories"')
+    parser.add_argument('--response-cache', action='store_true', help='leave the response cache enabled')
+    parser.add_argument('--output', help='results file (default: benchmarks/results/<time>-<commit>.json)')
+    parser.add_argument('--compare', help='earlier results file to compare p50 latencies with')
+    parser.add_argument('--list', action='store_true', help='list the scenarios and exit')
+    args = parser.parse_args()
+
+    selected = SCENARIOS
+    if args.scenarios:
+        patterns = [pattern.strip() for pattern in args.scenarios.split(',')]
+        selected = [s for s in SCENARIOS if any(fnmatch.fnmatch(s[0], pattern) for pattern in patterns)]
+    if args.list or not selected:
+        for name, method, route, _, _ in selected or SCENARIOS:
+            print(f'{name:<52} {method:<6} {route}')
+        return
+
+    revision = git_revision()
+    with tempfile.TemporaryDirectory() as tmp:
+        database = os.path.join(tmp, 'ledger.db')
+        if args.ledger:
+            copy_database(args.ledger, database)
+            ledger_info = {**describe_ledger(database), 'source': os.path.abspath(args.ledger)}
+        else:
+            print(f'Generating {args.rows:,} transactions...')
+            ledger_info = generate_ledger(database, args.rows, args.categories, args.recurring, args.years,
+                                          seed=args.seed)
+        print(f"Ledger: {ledger_info['rows']:,} transactions, {ledger_info['size_bytes'] / 1e6:,.1f} MB")
+
+        config = {'DATABASE': database}
+        if not args.response_cache:
+            config['RESPONSE_CACHE_TTL'] = 0  # Every entry is already expired when read
+        app = load_backend().create_app(config)
+        ctx = Context(app, args.seed)
+
+        started = datetime.now()
+        scenarios = []
+        for name, method, route, build, setup in selected:
+            print(f'  {name}...', end='', flush=True)
+            result = run_scenario(ctx, name, method, route, build, setup, args.iterations, args.warmup,
+                                  args.max_seconds)
+            print(f' p50 {result["latency_ms"]["p50"]:.2f} ms')
+            scenarios.append(result)
+        app.extensions['finance_tracker']['db_pool'].close_all()
+
+    results = {
+        'created_at': started.isoformat(timespec='seconds'),
+        'git': revision,
+        'environment': {
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'platform': platform.platform(),
+            'cpus': os.cpu_count()
+        },
+        'ledger': ledger_info,
+        'options': {
+            'iterations': args.iterations,
+            'warmup': args.warmup,
+            'max_seconds': args.max_seconds,
+            'response_cache': args.response_cache
+        },
+        'scenarios': scenarios
+    }
+
+    output = args.output
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        commit = revision['commit'] + ('-dirty' if revision['dirty'] else '') if revision else 'nogit'
+        output = os.path.join(RESULTS_DIR, f"{started.strftime('%Y%m%d-%H%M%S')}-{commit}.json")
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print()
+    print_results(results, baseline)
+    print(f'\nPeak RSS: {peak_rss_mib()} MiB. Results written to {output}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,32 @@
+"""Shared helpers for the backend benchmark scripts"""
+import importlib.util
+import os
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+_backend = None
+
+
+def load_backend():
+    """Import finance-tracker-backend.py (its file name is not a valid module name)"""
+    global _backend
+    if _backend is None:
+        path = os.path.join(BACKEND_DIR, 'finance-tracker-backend.py')
+        spec = importlib.util.spec_from_file_location('finance_tracker_backend', path)
+        _backend = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(_backend)
+    return _backend
+
+
+def create_database(path):
+    """Create an empty database with the application schema at path and return its app"""
+    return load_backend().create_app({'DATABASE': path})
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of values (0 for no values)"""
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))] if values else 0
@@ -0,0 +1,145 @@
+"""Load test the API under gunicorn at several worker counts
+
+Seeds a database, then for each worker count starts gunicorn (gunicorn.conf.py)
+and drives a read-heavy route mix with concurrent POSTs from client processes,
+reporting requests/second and p50/p99 latency per route. Any 5xx response (such as
+"database is locked") is counted as an error.
+
+    python benchmarks/load_test.py --workers 1,2,4 --clients 16 --duration 10
+"""
+import argparse
+import http.client
+import json
+import multiprocessing
+import os
+import random
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+from common import BACKEND_DIR, create_database, percentile
+
+# (name, method, path, weight)
+ROUTES = [
+    ('transactions page', 'GET', '/api/transactions?limit=50', 30),
+    ('transactions search', 'GET', '/api/transactions?q=coffee&limit=50', 10),
+    ('financial overview', 'GET', '/api/analytics/financial-overview', 20),
+    ('spending by category', 'GET', '/api/analytics/spending-by-category?period=year', 15),
+    ('categories', 'GET', '/api/categories', 10),
+    ('create transaction', 'POST', '/api/transactions', 15)
+]
+
+DESCRIPTIONS = ['Coffee Shop', 'Grocery Store', 'Gas Station', 'Restaurant', 'Pharmacy', 'Bookstore']
+
+
+def seed(path, rows):
+    db_pool = create_database(path).extensions['finance_tracker']['db_pool']
+    rng = random.Random(7)
+    start = date.today() - timedelta(days=365)
+    with db_pool.connection() as conn:
+        conn.executemany('''
+            INSERT INTO transactions (date, description, amount, type, category, notes)
+            VALUES (?, ?, ?, ?, ?, '')
+        ''', [((start + timedelta(days=rng.randint(0, 365))).isoformat(), rng.choice(DESCRIPTIONS),
+               -round(rng.uniform(1, 200), 2), 'expense', rng.choice(['Groceries', 'Dining Out', 'Other']))
+              for _ in range(rows)])
+        conn.commit()
+    db_pool.close_all()
+
+
+def wait_until_ready(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+            conn.request('GET', '/api/categories')
+            if conn.getresponse().status == 200:
+                return
+        except OSError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError('gunicorn did not start')
+
+
+def client(args):
+    """Issue requests until the deadline and return (route, status, latency_ms) samples"""
+    port, deadline, seed_value = args
+    rng = random.Random(seed_value)
+    names = [route[0] for route in ROUTES]
+    weights = [route[3] for route in ROUTES]
+    by_name = {route[0]: route for route in ROUTES}
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    samples = []
+    while time.time() < deadline:
+        name = rng.choices(names, weights)[0]
+        _, method, path, _ = by_name[name]
+        body = None
+        headers = {}
+        if method == 'POST':
+            body = json.dumps({'date': date.today().isoformat(), 'description': rng.choice(DESCRIPTIONS),
+                               'amount': -round(rng.uniform(1, 50), 2), 'type': 'expense', 'category': 'Other'})
+            headers['Content-Type'] = 'application/json'
+        started = time.perf_counter()
+        try:
+            conn.request(method, path, body=body, headers=headers)
+            response = conn.getresponse()
+            response.read()
+            status = response.status
+        except (OSError, http.client.HTTPException):
+            conn.close()
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+            status = 0
+        samples.append((name, status, (time.perf_counter() - started) * 1000))
+    conn.close()
+    return samples
+
+
+def run(db_path, workers, threads, clients, duration, port):
+    env = dict(os.environ, FINANCE_TRACKER_DATABASE=db_path, FINANCE_TRACKER_ACCESS_LOG='',
+               FINANCE_TRACKER_LOG_LEVEL='warning')
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'wsgi:app',
+         '--workers', str(workers), '--threads', str(threads), '--bind', f'127.0.0.1:{port}'],
+        cwd=BACKEND_DIR, env=env)
+    try:
+        wait_until_ready(port)
+        deadline = time.time() + duration
+        with multiprocessing.Pool(clients) as pool:
+            results = pool.map(client, [(port, deadline, index) for index in range(clients)])
+    finally:
+        server.send_signal(signal.SIGTERM)
+        server.wait(timeout=60)
+
+    samples = [sample for result in results for sample in result]
+    print(f'\n{workers} worker(s) x {threads} thread(s), {clients} clients, {duration}s: '
+          f'{len(samples) / duration:,.0f} req/s')
+    print(f'  {"route":<22} {"req/s":>8} {"p50 ms":>8} {"p99 ms":>8} {"errors":>7}')
+    for name, _, _, _ in ROUTES:
+        latencies = [latency for route, _, latency in samples if route == name]
+        errors = sum(1 for route, status, _ in samples if route == name and not 200 <= status < 400)
+        print(f'  {name:<22} {len(latencies) / duration:>8,.0f} {percentile(latencies, 0.5):>8.1f} '
+              f'{percentile(latencies, 0.99):>8.1f} {errors:>7}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', default='1,2,4', help='comma-separated worker counts')
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--duration', type=int, default=10)
+    parser.add_argument('--rows', type=int, default=50000, help='transactions to seed')
+    parser.add_argument('--port', type=int, default=5055)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'load.db')
+        seed(db_path, args.rows)
+        for workers in [int(value) for value in args.workers.split(',')]:
+            run(db_path, workers, args.threads, args.clients, args.duration, args.port)
+
+
+if __name__ == '__main__':
+    main()
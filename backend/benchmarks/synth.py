@@ -0,0 +1,305 @@
+"""Generate a realistic synthetic ledger into a SQLite database
+
+Expenses are spread over a date span (busier on weekends) and drawn from
+per-category merchant lists (with store and card numbers in the descriptions, as
+bank exports have) and amount ranges, alongside a biweekly salary and freelance and
+investment income. Recurring templates, accounts, budget goals
+and categorization rules are generated alongside.
+
+Large ledgers are loaded with the transactions triggers dropped; the derived tables
+(rollup, full-text index, learned categories, change feed, account balances) are
+then rebuilt in bulk and the triggers recreated, which is several times faster than
+per-row upkeep.
+
+    python benchmarks/synth.py ledger.db --rows 1000000 --years 5 --categories 20
+"""
+import argparse
+import os
+import random
+import time
+from datetime import date, timedelta
+
+from common import create_database
+
+from ledger import reconcile_accounts
+from rollups import REBUILD_SQL as REBUILD_ROLLUPS_SQL
+
+# category -> (merchants, typical amount range, relative frequency)
+EXPENSE_PROFILES = {
+    'Groceries': (['Whole Foods', 'Safeway', 'Trader Joes', 'Costco', 'Farmers Market', 'Loblaws'], (15, 180), 22),
+    'Dining Out': (['Starbucks', 'Chipotle', 'Sushi Bar', 'Pizza Palace', 'Thai Kitchen', 'Tim Hortons'], (4, 90), 18),
+    'Transportation': (['Shell', 'Esso', 'Uber', 'Lyft', 'Transit Pass', 'Parking Meter'], (3, 95), 12),
+    'Shopping': (['Amazon', 'Target', 'Best Buy', 'Ikea', 'Walmart', 'Etsy'], (10, 400), 10),
+    'Entertainment': (['Netflix', 'Spotify', 'Cinema', 'Steam', 'Concert Tickets', 'Bowling'], (8, 120), 7),
+    'Utilities': (['Hydro Electric', 'City Water', 'Internet Provider', 'Mobile Phone', 'Gas Utility'], (30, 220), 4),
+    'Healthcare': (['Pharmacy', 'Dental Clinic', 'Physiotherapy', 'Optometrist'], (10, 300), 3),
+    'Housing': (['Rent Payment', 'Home Depot', 'Property Management', 'Home Insurance'], (40, 1800), 2),
+    'Travel': (['Air Canada', 'Expedia', 'Marriott', 'Airbnb', 'Via Rail'], (60, 1500), 1),
+    'Education': (['Coursera', 'Bookstore', 'Tuition Office'], (15, 900), 1),
+    'Personal Care': (['Hair Salon', 'Barber Shop', 'Spa'], (15, 150), 2),
+    'Other': (['ATM Withdrawal', 'Bank Fee', 'E-Transfer', 'Misc Purchase'], (5, 250), 3)
+}
+
+INCOME_PROFILES = {
+    'Salary': (['Payroll Deposit ACME Corp'], (2400, 3200)),
+    'Freelance': (['Client Payment', 'Upwork Payout', 'Stripe Transfer'], (150, 2500)),
+    'Investment Returns': (['Dividend Payment', 'Interest Payment'], (5, 400))
+}
+
+DESCRIPTION_FORMATS = ['{merchant}', '{merchant} #{store}', 'POS {card} {merchant}', '{merchant} {store} ON',
+                       'Card purchase {merchant}', '{merchant} #{store} ({card})']
+
+ACCOUNT_TYPES = [('Chequing', 'Chequing'), ('Credit Card', 'Credit'), ('Emergency Fund', 'Savings'),
+                 ('TFSA', 'Tax-Free Savings'), ('RRSP', 'Retirement Savings'), ('FHSA', 'First Home Savings')]
+
+FREQUENCIES = ['weekly', 'biweekly', 'monthly', 'monthly', 'monthly', 'quarterly', 'yearly']
+
+INSERT_BATCH = 50000
+
+
+def expense_profiles(categories, rng):
+    """Return the expense profiles for categories (extra categories get generated merchants)"""
+    profiles = dict(list(EXPENSE_PROFILES.items())[:categories])
+    for index in range(len(profiles), categories):
+        merchants = [f'Vendor {index}-{m}' for m in range(rng.randint(2, 8))]
+        low = rng.uniform(5, 50)
+        profiles[f'Category {index + 1}'] = (merchants, (low, low * rng.uniform(2, 20)), rng.randint(1, 5))
+    return profiles
+
+
+def describe(merchant, rng):
+    return rng.choice(DESCRIPTION_FORMATS).format(merchant=merchant, store=rng.randint(100, 9999),
+                                                  card=rng.randint(1000, 9999))
+
+
+def spread(total, weights):
+    """Split total into per-slot integer counts proportional to weights"""
+    scale = total / sum(weights)
+    counts = []
+    carry = 0.0
+    for weight in weights:
+        share = weight * scale + carry
+        counts.append(int(share))
+        carry = share - counts[-1]
+    counts[-1] += total - sum(counts)  # Absorb rounding in the last slot
+    return counts
+
+
+def iter_transactions(rows, start, end, profiles, account_ids, rng):
+    """Yield rows (date, description, amount, type, category, notes, account_id) in date order"""
+    days = (end - start).days + 1
+    names = list(profiles)
+    weights = [profiles[name][2] for name in names]
+    income_account = account_ids[0] if account_ids else None
+
+    # Biweekly salary, plus freelance and investment income: about one income row per 40
+    paydays = set(range(rng.randint(0, 13), days, 14))
+    extra_income = max(rows // 40 - len(paydays), 0)
+    expenses = max(rows - len(paydays) - extra_income, 0)
+
+    # Weekends see more spending
+    day_weights = [1.4 if (start + timedelta(days=offset)).weekday() >= 5 else 1.0 for offset in range(days)]
+    expense_counts = spread(expenses, day_weights)
+    income_counts = spread(extra_income, [1.0] * days)
+
+    for offset in range(days):
+        day = (start + timedelta(days=offset)).isoformat()
+        if offset in paydays:
+            merchants, (low, high) = INCOME_PROFILES['Salary']
+            yield (day, merchants[0], round(rng.uniform(low, high), 2), 'income', 'Salary', 'Paycheque',
+                   income_account)
+        for _ in range(income_counts[offset]):
+            category = rng.choice(['Freelance', 'Investment Returns'])
+            merchants, (low, high) = INCOME_PROFILES[category]
+            yield (day, rng.choice(merchants), round(rng.uniform(low, high), 2), 'income', category, '',
+                   income_account)
+
+        for category in rng.choices(names, weights, k=expense_counts[offset]):
+            merchants, (low, high), _ = profiles[category]
+            # Skewed towards the low end of the range, like real spending
+            amount = low + (high - low) * rng.random() ** 2.5
+            yield (day, describe(rng.choice(merchants), rng), -round(amount, 2), 'expense', category,
+                   'split with roommate' if rng.random() < 0.02 else '',
+                   rng.choice(account_ids) if account_ids and rng.random() < 0.3 else None)
+
+
+def make_recurring(count, profiles, today, rng):
+    templates = []
+    names = list(profiles)
+    for index in range(count):
+        frequency = rng.choice(FREQUENCIES)
+        if index == 0:
+            description, amount, kind, category, frequency = 'Salary', 2800.0, 'income', 'Salary', 'biweekly'
+        else:
+            category = rng.choice(names)
+            merchants, (low, high), _ = profiles[category]
+            description = f'{rng.choice(merchants)} subscription {index}'
+            amount, kind = -round(rng.uniform(low, high), 2), 'expense'
+        start = today - timedelta(days=rng.randint(30, 720))
+        # Next occurrence in the near future: nothing is due until a benchmark rewinds it
+        next_occurrence = today + timedelta(days=rng.randint(1, 28))
+        end_date = (today + timedelta(days=rng.randint(180, 1800))).isoformat() if rng.random() < 0.2 else None
+        templates.append((description, amount, kind, category, '', frequency, start.isoformat(), end_date,
+                          next_occurrence.isoformat(), 1))
+    return templates
+
+
+def make_rules(count, profiles, rng):
+    rules = []
+    names = list(profiles)
+    for index in range(count):
+        category = rng.choice(names)
+        merchant = rng.choice(profiles[category][0])
+        if index % 10 == 9:
+            rules.append((f'Large {category}', 'amount', None, 500.0, None, 'expense', category, 200 + index, 1))
+        elif index % 4 == 3:
+            pattern = merchant.split()[0] + r'\s*#?\d*'
+            rules.append((f'{merchant} regex', 'regex', pattern, None, None, None, category, 100 + index, 1))
+        else:
+            rules.append((merchant, 'substring', merchant.lower(), None, None, None, category, 100 + index, 1))
+    return rules
+
+
+def bulk_insert_transactions(conn, rows):
+    """Insert rows with the transactions triggers dropped, then rebuild what they maintain
+
+    Returns the number of rows inserted. Runs in one write transaction, so a failure
+    leaves the database (and its triggers) as they were.
+    """
+    triggers = conn.execute('''
+        SELECT name, sql FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'transactions'
+    ''').fetchall()
+    inserted = 0
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        for trigger in triggers:
+            conn.execute(f'DROP TRIGGER {trigger["name"]}')
+
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) == INSERT_BATCH:
+                conn.executemany('''
+                    INSERT INTO transactions (date, description, amount, type, category, notes, account_id)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                ''', batch)
+                inserted += len(batch)
+                batch = []
+        conn.executemany('''
+            INSERT INTO transactions (date, description, amount, type, category, notes, account_id)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', batch)
+        inserted += len(batch)
+
+        # Derived data the dropped triggers would have maintained
+        conn.execute('DELETE FROM monthly_category_totals')
+        conn.execute(REBUILD_ROLLUPS_SQL)
+        conn.execute("INSERT INTO transactions_fts (transactions_fts) VALUES ('rebuild')")
+        conn.execute('DELETE FROM description_categories')
+        conn.execute('''
+            INSERT INTO description_categories (description_key, category, count)
+            SELECT lower(trim(description)), category, COUNT(*)
+            FROM transactions
+            GROUP BY lower(trim(description)), category
+        ''')
+        conn.execute("INSERT OR REPLACE INTO change_log (entity, entity_id) SELECT 'transaction', id FROM transactions")
+
+        for trigger in triggers:
+            conn.execute(trigger['sql'])
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    # Account balances: opening balance plus the linked transactions
+    reconcile_accounts(conn, fix=True)
+    return inserted
+
+
+def generate_ledger(path, rows=100000, categories=12, recurring=50, years=3, accounts=4, rules=50, seed=42,
+                    today=None):
+    """Create a database at path holding a synthetic ledger and return a summary of it
+
+    Transactions span the `years` before today (inclusive).
+    """
+    rng = random.Random(seed)
+    today = today or date.today()
+    start = today - timedelta(days=int(years * 365.25) - 1)
+    started = time.perf_counter()
+
+    app = create_database(path)
+    db_pool = app.extensions['finance_tracker']['db_pool']
+    profiles = expense_profiles(categories, rng)
+
+    with db_pool.connection() as conn:
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.executemany('''
+                INSERT INTO accounts (name, type, balance, opening_balance, monthly_contribution)
+                VALUES (?, ?, ?, ?, ?)
+            ''', [(name if index < len(ACCOUNT_TYPES) else f'{name} {index + 1}', kind, opening, opening,
+                   rng.choice([0, 100, 250, 500]))
+                  for index in range(accounts)
+                  for name, kind in [ACCOUNT_TYPES[index % len(ACCOUNT_TYPES)]]
+                  for opening in [round(rng.uniform(500, 20000), 2)]])
+            conn.executemany('''
+                INSERT INTO recurring_transactions
+                (description, amount, type, category, notes, frequency, start_date, end_date, next_occurrence, is_active)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', make_recurring(recurring, profiles, today, rng))
+            conn.executemany('''
+                INSERT INTO categorization_rules
+                (name, match_type, pattern, min_amount, max_amount, transaction_type, category, priority, is_active)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', make_rules(rules, profiles, rng))
+            conn.execute('''
+                INSERT INTO budget_goals (monthly_income, debt_payments, savings, investments, discretionary)
+                VALUES (5600, 800, 1000, 600, 3200)
+            ''')
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+        account_ids = [row['id'] for row in conn.execute('SELECT id FROM accounts ORDER BY id')]
+        inserted = bulk_insert_transactions(conn, iter_transactions(rows, start, today, profiles, account_ids, rng))
+        conn.execute('ANALYZE')
+    db_pool.close_all()
+
+    return {
+        'rows': inserted,
+        'categories': categories,
+        'recurring': recurring,
+        'accounts': accounts,
+        'rules': rules,
+        'years': years,
+        'seed': seed,
+        'start_date': start.isoformat(),
+        'end_date': today.isoformat(),
+        'size_bytes': os.path.getsize(path),
+        'seconds': round(time.perf_counter() - started, 3)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('database', help='path of the database to create (must not exist)')
+    parser.add_argument('--rows', type=int, default=100000, help='transactions to generate')
+    parser.add_argument('--categories', type=int, default=12, help='expense categories')
+    parser.add_argument('--recurring', type=int, default=50, help='recurring templates')
+    parser.add_argument('--years', type=float, default=3, help='date span ending today')
+    parser.add_argument('--accounts', type=int, default=4)
+    parser.add_argument('--rules', type=int, default=50, help='categorization rules')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    if os.path.exists(args.database):
+        parser.error(f'{args.database} already exists')
+    summary = generate_ledger(args.database, args.rows, args.categories, args.recurring, args.years,
+                              args.accounts, args.rules, args.seed)
+    print(f"{summary['rows']:,} transactions ({summary['start_date']} to {summary['end_date']}), "
+          f"{summary['size_bytes'] / 1e6:,.1f} MB in {summary['seconds']:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+"""Grouped trigger maintenance for bulk inserts into transactions
+
+Every insert into transactions fires five row triggers: the monthly rollup
+(migration 3), the account ledger (4), the full-text index (5), learned description
+categories (6) and the change feed (7). For a large insert - recurring catch-up or a
+CSV import - those per-row statements cost several times the insert itself, so
+grouped_insert_maintenance() drops the triggers for the duration of the insert and
+then applies their combined effect with one grouped statement per table.
+"""
+from contextlib import contextmanager
+
+from rollups import GROUPED_MIN_ROWS, add_to_rollups
+
+INSERT_TRIGGERS = ('trg_rollup_insert', 'trg_ledger_insert', 'trg_fts_insert', 'trg_learned_insert',
+                   'trg_changes_transaction_insert')
+
+LEDGER_SQL = '''
+    UPDATE accounts
+    SET balance = balance + delta.amount, updated_at = CURRENT_TIMESTAMP
+    FROM (
+        SELECT account_id, SUM(CASE WHEN type = 'income' THEN ABS(amount) ELSE -ABS(amount) END) AS amount
+        FROM transactions
+        WHERE id > ? AND account_id IS NOT NULL
+        GROUP BY account_id
+    ) AS delta
+    WHERE accounts.id = delta.account_id
+'''
+
+FTS_SQL = '''
+    INSERT INTO transactions_fts (rowid, description, notes)
+    SELECT id, description, notes FROM transactions WHERE id > ?
+'''
+
+LEARNED_SQL = '''
+    INSERT INTO description_categories (description_key, category, count)
+    SELECT lower(trim(description)), category, COUNT(*)
+    FROM transactions
+    WHERE id > ?
+    GROUP BY lower(trim(description)), category
+    ON CONFLICT (description_key, category) DO UPDATE SET count = count + excluded.count
+'''
+
+CHANGES_SQL = '''
+    INSERT OR REPLACE INTO change_log (entity, entity_id, deleted)
+    SELECT 'transaction', id, 0 FROM transactions WHERE id > ? ORDER BY id
+'''
+
+
+@contextmanager
+def grouped_insert_maintenance(conn, rows):
+    """Run a bulk insert of rows transactions with the insert triggers replaced by grouped statements
+
+    Must run inside the caller's write transaction, and the block may only insert into
+    transactions. Ids are AUTOINCREMENT, so the inserted rows are exactly those above
+    the MAX(id) read on entry. Inserts below GROUPED_MIN_ROWS keep the triggers:
+    recreating them is a schema change every pooled connection re-parses. A block that
+    raises is rolled back by the caller, which restores the triggers too.
+    """
+    if rows < GROUPED_MIN_ROWS:
+        yield
+        return
+    last_id = conn.execute('SELECT COALESCE(MAX(id), 0) FROM transactions').fetchone()[0]
+    triggers = conn.execute(f'''
+        SELECT name, sql FROM sqlite_master
+        WHERE type = 'trigger' AND name IN ({', '.join('?' * len(INSERT_TRIGGERS))})
+    ''', INSERT_TRIGGERS).fetchall()
+    for trigger in triggers:
+        conn.execute(f'DROP TRIGGER {trigger[0]}')
+    yield
+
+    add_to_rollups(conn, 'id > ?', (last_id,))
+    for statement in (LEDGER_SQL, FTS_SQL, LEARNED_SQL, CHANGES_SQL):
+        conn.execute(statement, (last_id,))
+    for trigger in triggers:
+        conn.execute(trigger[1])
@@ -0,0 +1,166 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from urllib.parse import urlencode
+
+from flask import Response, make_response, request
+
+
+class ResponseCache:
+    """In-process LRU cache of rendered responses with a TTL and tag-based invalidation
+
+    Entries are tagged with the data they were computed from (e.g. 'transactions');
+    mutating routes call invalidate() with the tags they touched. Writes made by other
+    processes are caught by version_source: a function returning the shared (database)
+    versions of a list of tags. Each entry keeps the versions it was computed at and
+    is dropped once they change, so a commit in any worker, the scheduler or the CLI
+    invalidates every process's cache.
+    """
+
+    def __init__(self, max_entries=256, ttl=60, version_source=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.version_source = version_source
+        self._entries = OrderedDict()  # key -> (expires_at, body, status, mimetype, etag, tags, versions)
+        self._tags = {}                # tag -> set of keys
+        self._generations = {}         # tag -> number of times it has been invalidated
+        self._lock = threading.Lock()
+
+        # Statistics
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self.stale = 0
+
+    def versions(self, tags):
+        """Return the shared versions of tags (None without a version_source)"""
+        return tuple(self.version_source(tags)) if self.version_source is not None else None
+
+    def get(self, key, versions=None):
+        """Return the cached entry for key, or None if missing, expired or computed at other versions"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry[0] < time.monotonic():
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return None
+            if entry[6] != versions:
+                # Written to since, possibly by another process
+                self._remove(key)
+                self.stale += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def generation(self, tags):
+        """Return a token identifying the current invalidation state of tags"""
+        with self._lock:
+            return tuple(self._generations.get(tag, 0) for tag in tags)
+
+    def set(self, key, body, status, mimetype, etag, tags, generation=None, versions=None):
+        """Store a rendered response under key, computed at the shared versions given
+
+        If generation is given and any tag was invalidated since it was taken, the
+        response may be stale and is not stored.
+        """
+        with self._lock:
+            if generation is not None and generation != tuple(self._generations.get(tag, 0) for tag in tags):
+                return
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic() + self.ttl, body, status, mimetype, etag, tags, versions)
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def invalidate(self, *tags):
+        """Drop every entry tagged with any of tags"""
+        with self._lock:
+            for tag in tags:
+                self._generations[tag] = self._generations.get(tag, 0) + 1
+                for key in self._tags.pop(tag, set()):
+                    if key in self._entries:
+                        self._remove(key)
+                        self.invalidations += 1
+
+    def clear(self):
+        """Drop every entry"""
+        with self._lock:
+            self._entries.clear()
+            self._tags.clear()
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        for tag in entry[5]:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+    def stats(self):
+        """Return cache statistics as a dict"""
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations,
+                'stale': self.stale
+            }
+
+    def cached(self, *tags):
+        """Decorator caching a GET view's response in this cache (see cached())"""
+        return cached(self, *tags)
+
+
+def cached(cache, *tags):
+    """Decorator caching a GET view's response in cache per path and query string
+
+    cache is only touched while handling a request, so it may be a proxy to the
+    current app's cache. Responses carry an ETag; a matching If-None-Match gets a 304.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            key = request.path + '?' + urlencode(sorted(request.args.items(multi=True)))
+
+            # Read before the view runs: a write during it leaves the entry at older versions
+            versions = cache.versions(tags)
+            entry = cache.get(key, versions)
+            if entry is None:
+                generation = cache.generation(tags)
+                response = view(*args, **kwargs)
+                if not isinstance(response, Response):
+                    response = make_response(response)
+                if response.status_code != 200:
+                    return response
+
+                body = response.get_data()
+                etag = hashlib.sha1(body).hexdigest()
+                cache.set(key, body, response.status_code, response.mimetype, etag, tags, generation, versions)
+            else:
+                _, body, status, mimetype, etag, _, _ = entry
+                response = Response(body, status=status, mimetype=mimetype)
+
+            response.set_etag(etag)
+            return response.make_conditional(request)
+        return wrapper
+    return decorator
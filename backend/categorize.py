@@ -0,0 +1,320 @@
+"""Rule-based and learned auto-categorization of transactions
+
+User rules (categorization_rules) match on a description substring or regex and/or
+an amount range, optionally restricted to income or expenses; the first rule in
+(priority, id) order that matches wins. Substring rules, and the literal prefixes of
+regex rules, are compiled into one Aho-Corasick automaton, so each description is
+scanned once rather than once per rule; only the regexes whose prefix occurs are then
+run. Descriptions no rule matches fall back to the category most often used for the
+same normalized description (description_categories, kept by triggers from migration 6).
+"""
+import json
+import re
+import threading
+import time
+
+MATCH_TYPES = ('substring', 'regex', 'amount')
+
+_NORMALIZE_STRIP = re.compile(r'[\W\d_]+')
+
+
+def normalize_description(description):
+    """Lower-case a description and drop digits and punctuation (card/reference numbers)"""
+    return _NORMALIZE_STRIP.sub(' ', (description or '').lower()).strip()
+
+
+def validate_rule(data):
+    """Validate a rule payload, returning (values, error)
+
+    values is (name, match_type, pattern, min_amount, max_amount, transaction_type,
+    category, priority, is_active).
+    """
+    match_type = data.get('match_type', 'substring')
+    if match_type not in MATCH_TYPES:
+        return None, f'Invalid match_type: {match_type}'
+    if not data.get('category'):
+        return None, 'Missing required field: category'
+
+    pattern = data.get('pattern') or None
+    if match_type != 'amount' and not pattern:
+        return None, 'Missing required field: pattern'
+    if match_type == 'amount':
+        pattern = None
+    if match_type == 'regex':
+        try:
+            re.compile(pattern, re.I)
+        except re.error as e:
+            return None, f'Invalid regex: {e}'
+
+    bounds = []
+    for field in ('min_amount', 'max_amount'):
+        value = data.get(field)
+        if value in (None, ''):
+            bounds.append(None)
+            continue
+        try:
+            bounds.append(float(value))
+        except (TypeError, ValueError):
+            return None, f'Invalid {field}: {value}'
+    if match_type == 'amount' and bounds == [None, None]:
+        return None, 'Amount rules need min_amount or max_amount'
+
+    transaction_type = data.get('transaction_type') or None
+    if transaction_type not in (None, 'income', 'expense'):
+        return None, f'Invalid transaction_type: {transaction_type}'
+
+    try:
+        priority = int(data.get('priority', 100))
+    except (TypeError, ValueError):
+        return None, f"Invalid priority: {data.get('priority')}"
+
+    return (data.get('name') or pattern or data['category'], match_type, pattern, bounds[0], bounds[1],
+            transaction_type, data['category'], priority, 1 if data.get('is_active', True) else 0), None
+
+
+_REGEX_SPECIAL = set('.^$*+?{}[]|()')
+_REGEX_OPTIONAL = set('*?{')
+
+
+def literal_prefix(pattern):
+    """Return the literal text every match of pattern must start with ('' if unknown)
+
+    Used to pre-filter regex rules with the substring automaton: a rule whose
+    prefix doesn't occur in a description can't match it.
+    """
+    if '|' in pattern:
+        return ''
+    literal = []
+    index = 0
+    while index < len(pattern):
+        char = pattern[index]
+        if char == '\\':
+            escaped = pattern[index + 1:index + 2]
+            if not escaped or escaped.isalnum():
+                break  # Character class (\d, \s, \b...) or backreference
+            char = escaped
+            index += 1
+        elif char in _REGEX_SPECIAL:
+            break
+        literal.append(char)
+        index += 1
+    # A following quantifier makes the last character optional
+    if literal and index < len(pattern) and pattern[index] in _REGEX_OPTIONAL:
+        literal.pop()
+    return ''.join(literal)
+
+
+class SubstringAutomaton:
+    """Aho-Corasick automaton over lower-cased substrings
+
+    find() returns the values of every pattern occurring in the text in a single
+    pass over it, however many patterns there are.
+    """
+
+    def __init__(self, patterns):
+        # patterns: iterable of (substring, value)
+        self._goto = [{}]
+        self._outputs = [()]
+        for substring, value in patterns:
+            node = 0
+            for char in substring.lower():
+                next_node = self._goto[node].get(char)
+                if next_node is None:
+                    next_node = len(self._goto)
+                    self._goto[node][char] = next_node
+                    self._goto.append({})
+                    self._outputs.append(())
+                node = next_node
+            self._outputs[node] += (value,)
+
+        # Breadth-first failure links; each node also reports the patterns ending at its suffixes
+        self._fail = [0] * len(self._goto)
+        queue = list(self._goto[0].values())
+        for node in queue:
+            for char, child in self._goto[node].items():
+                queue.append(child)
+                fallback = self._fail[node]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(char, 0)
+                self._fail[child] = target if target != child else 0
+                self._outputs[child] += self._outputs[self._fail[child]]
+
+    def find(self, text):
+        """Return the set of values of the patterns found in text"""
+        goto, fail, outputs = self._goto, self._fail, self._outputs
+        found = set()
+        node = 0
+        for char in text.lower():
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            if outputs[node]:
+                found.update(outputs[node])
+        return found
+
+
+class Categorizer:
+    """Compiled matcher for a set of rules and learned description mappings"""
+
+    def __init__(self, rules, learned=None):
+        # rules: dicts in evaluation order; learned: normalized description -> category
+        self.rules = list(rules)
+        self.learned = learned or {}
+
+        literals = []
+        self._regexes = {}
+        self._always = []  # Rules that must be checked for every description
+        for order, rule in enumerate(self.rules):
+            if rule['match_type'] == 'substring':
+                literals.append((rule['pattern'], order))
+            elif rule['match_type'] == 'regex':
+                self._regexes[order] = re.compile(rule['pattern'], re.I)
+                prefix = literal_prefix(rule['pattern'])
+                if len(prefix) >= 2:
+                    literals.append((prefix, order))
+                else:
+                    self._always.append(order)
+            else:
+                self._always.append(order)
+
+        self._automaton = SubstringAutomaton(literals)
+
+    def _conditions_hold(self, rule, amount, transaction_type):
+        if rule['transaction_type'] and transaction_type and rule['transaction_type'] != transaction_type:
+            return False
+        if amount is None:
+            return rule['min_amount'] is None and rule['max_amount'] is None
+        amount = abs(amount)
+        if rule['min_amount'] is not None and amount < rule['min_amount']:
+            return False
+        if rule['max_amount'] is not None and amount > rule['max_amount']:
+            return False
+        return True
+
+    def match_rule(self, description, amount=None, transaction_type=None):
+        """Return the first rule matching the transaction, or None
+
+        One automaton pass yields the matching substring rules and the regex rules whose
+        literal prefix occurs; candidates are then checked in priority order.
+        """
+        candidates = self._automaton.find(description)
+        candidates.update(self._always)
+        for order in sorted(candidates):
+            regex = self._regexes.get(order)
+            if regex is not None and regex.search(description) is None:
+                continue
+            rule = self.rules[order]
+            if self._conditions_hold(rule, amount, transaction_type):
+                return rule
+        return None
+
+    def categorize(self, description, amount=None, transaction_type=None, use_learned=True):
+        """Return (category, source) with source 'rule' or 'learned', or (None, None)"""
+        description = description or ''
+        rule = self.match_rule(description, amount, transaction_type)
+        if rule is not None:
+            return rule['category'], 'rule'
+        if use_learned:
+            category = self.learned.get(normalize_description(description))
+            if category is not None:
+                return category, 'learned'
+        return None, None
+
+
+def load_categorizer(conn):
+    """Compile the active rules and learned mappings from the database"""
+    rules = [dict(row) for row in conn.execute('''
+        SELECT id, match_type, pattern, min_amount, max_amount, transaction_type, category
+        FROM categorization_rules
+        WHERE is_active = 1
+        ORDER BY priority, id
+    ''')]
+
+    # Several raw descriptions can share a normalized key; the category used most wins
+    counts = {}
+    for row in conn.execute('SELECT description_key, category, count FROM description_categories WHERE count > 0'):
+        key = normalize_description(row['description_key'])
+        if key:
+            per_category = counts.setdefault(key, {})
+            per_category[row['category']] = per_category.get(row['category'], 0) + row['count']
+    learned = {key: max(per_category, key=per_category.get) for key, per_category in counts.items()}
+
+    return Categorizer(rules, learned)
+
+
+class CategorizerCache:
+    """Holds the compiled categorizer, recompiling after invalidate() or ttl seconds
+
+    The TTL picks up learned mappings from writes made elsewhere (other workers,
+    single-transaction edits) without recompiling on every request.
+    """
+
+    def __init__(self, ttl=300):
+        self.ttl = ttl
+        self._categorizer = None
+        self._compiled_at = 0
+        self._lock = threading.Lock()
+
+    def get(self, conn):
+        """Return the compiled categorizer, compiling it if missing or stale"""
+        with self._lock:
+            if self._categorizer is None or time.monotonic() - self._compiled_at > self.ttl:
+                self._categorizer = load_categorizer(conn)
+                self._compiled_at = time.monotonic()
+            return self._categorizer
+
+    def invalidate(self):
+        """Drop the compiled categorizer so the next get() recompiles"""
+        with self._lock:
+            self._categorizer = None
+
+
+def recategorize(conn, categorizer, where=' WHERE 1=1', params=(), batch_size=5000, use_learned=False,
+                 dry_run=False, lock=None):
+    """Re-run the categorizer over matching transactions in id-ordered batches
+
+    The matching ids are collected once, through whichever index suits where (ordering
+    the filter by id would walk the whole table instead); each batch is then re-read
+    by id and updated in its own write transaction (holding lock, a db.WriteLock, if
+    given) so other writers are only blocked briefly. Only transactions whose category
+    changes are updated.
+    Returns {'scanned', 'updated', 'batches'}.
+    """
+    ids = sorted(row[0] for row in conn.execute(f'SELECT id FROM transactions {where}', list(params)))
+
+    scanned = updated = batches = 0
+    for start in range(0, len(ids), batch_size):
+        chunk = ids[start:start + batch_size]
+        if lock is not None:
+            lock.acquire()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            rows = conn.execute(f'''
+                SELECT id, description, amount, type, category FROM transactions
+                WHERE id IN (SELECT value FROM json_each(?))
+            ''', (json.dumps(chunk),)).fetchall()
+
+            changes = []
+            for row in rows:
+                category, _ = categorizer.categorize(row['description'], row['amount'], row['type'], use_learned)
+                if category is not None and category != row['category']:
+                    changes.append((category, row['id']))
+
+            if changes and not dry_run:
+                conn.executemany('''
+                    UPDATE transactions SET category = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?
+                ''', changes)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            if lock is not None:
+                lock.release()
+
+        scanned += len(rows)
+        updated += len(changes)
+        batches += 1
+
+    return {'scanned': scanned, 'updated': updated, 'batches': batches}
@@ -0,0 +1,63 @@
+"""Change feed for delta sync
+
+Triggers from migration 7 record every insert, update and delete of a transaction or
+recurring template in change_log under a new, increasing seq, keeping only each row's
+latest change (a delete leaves a tombstone). A client remembers the seq it has synced
+up to and asks for what changed after it, so sync traffic grows with the number of
+changes rather than with the ledger size. Archived transactions keep their entries
+and are read back from the archive files (see archive.py).
+"""
+
+# change_log entity -> (table, key in the response)
+ENTITIES = {
+    'transaction': ('transactions', 'transactions'),
+    'recurring': ('recurring_transactions', 'recurring_transactions')
+}
+
+
+def changes_since(conn, since, limit, archive=None):
+    """Return up to limit changes with a seq greater than since
+
+    The result holds the current version of every changed row per entity, the ids
+    of deleted rows under 'deleted', and next_since: the seq to pass next time.
+    All of it is read from one snapshot.
+    """
+    conn.execute('BEGIN')
+    try:
+        page = conn.execute('''
+            SELECT seq, entity, entity_id, deleted FROM change_log
+            WHERE seq > ?
+            ORDER BY seq
+            LIMIT ?
+        ''', (since, limit + 1)).fetchall()
+        has_more = len(page) > limit
+        page = page[:limit]
+
+        result = {
+            'since': since,
+            'next_since': page[-1]['seq'] if page else since,
+            'has_more': has_more,
+            'deleted': {key: [] for _, key in ENTITIES.values()}
+        }
+        changed = {entity: [] for entity in ENTITIES}
+        for change in page:
+            _, key = ENTITIES[change['entity']]
+            if change['deleted']:
+                result['deleted'][key].append(change['entity_id'])
+            else:
+                changed[change['entity']].append(change['entity_id'])
+
+        for entity, ids in changed.items():
+            table, key = ENTITIES[entity]
+            rows = conn.execute(
+                f"SELECT * FROM {table} WHERE id IN ({', '.join('?' * len(ids))}) ORDER BY id", ids
+            ).fetchall() if ids else []
+            result[key] = [dict(row) for row in rows]
+            if entity == 'transaction' and archive is not None and len(rows) < len(ids):
+                archived = archive.rows(conn, set(ids) - {row['id'] for row in rows})
+                result[key] = sorted(result[key] + archived, key=lambda row: row['id'])
+    finally:
+        conn.rollback()  # Read-only: just end the snapshot
+
+    return result
+
@@ -0,0 +1,249 @@
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: the write lock only serializes threads of one process
+    fcntl = None
+
+# Applied once to every new connection
+DEFAULT_PRAGMAS = {
+    'journal_mode': 'WAL',        # Readers don't block the writer (and vice versa)
+    'synchronous': 'NORMAL',      # Safe with WAL, avoids an fsync per commit
+    'mmap_size': 268435456,       # Map up to 256 MB of the database file
+    'cache_size': -16000,         # ~16 MB page cache per connection (negative = KiB)
+    'temp_store': 'MEMORY',
+    'busy_timeout': 10000         # Wait up to 10s for another process's write lock
+}
+
+
+class PoolTimeout(Exception):
+    """Raised when no connection becomes available within the pool timeout"""
+
+
+class WriteLockTimeout(Exception):
+    """Raised when the database write lock isn't acquired within its timeout"""
+
+
+class WriteLock:
+    """Lock serializing database writers across the threads and processes of a deployment
+
+    SQLite allows a single writer at a time. Queuing writers here, on a thread lock
+    plus an flock() on a file next to the database, hands the write lock over as soon
+    as it's free instead of leaving each writer to poll SQLite's busy handler. Both
+    waits are bounded by timeout: the flock() is retried non-blocking (every 1-20ms)
+    so a writer queued behind another process still gets WriteLockTimeout.
+    """
+
+    def __init__(self, path, timeout=30):
+        self.path = path  # Lock file; None for a database only this process can open
+        self.timeout = timeout
+        self._lock = threading.RLock()
+        self._local = threading.local()  # Per-thread nesting depth
+        self._fd = None
+        self._pid = None
+
+        # Statistics
+        self.acquisitions = 0
+        self.timeouts = 0
+        self.total_wait_ms = 0.0
+
+    def _file(self):
+        # A descriptor inherited across fork() would share its lock with the parent
+        if self._pid != os.getpid():
+            self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+            self._pid = os.getpid()
+        return self._fd
+
+    def acquire(self):
+        """Block until this thread holds the write lock (re-entrant)"""
+        depth = getattr(self._local, 'depth', 0)
+        if depth:
+            self._local.depth = depth + 1
+            return
+
+        started = time.monotonic()
+        if not self._lock.acquire(timeout=self.timeout):
+            self.timeouts += 1
+            raise WriteLockTimeout(f'Database write lock not acquired after {self.timeout}s')
+        if fcntl is not None and self.path is not None:
+            try:
+                self._flock(started + self.timeout)
+            except Exception:
+                self._lock.release()
+                raise
+        self._local.depth = 1
+        self.acquisitions += 1
+        self.total_wait_ms += (time.monotonic() - started) * 1000
+
+    def _flock(self, deadline):
+        # A blocking flock() can't time out, so poll with a growing sleep until the deadline
+        delay = 0.001
+        while True:
+            try:
+                fcntl.flock(self._file(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return
+            except BlockingIOError:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.timeouts += 1
+                    raise WriteLockTimeout(f'Database write lock not acquired after {self.timeout}s') from None
+                time.sleep(min(delay, remaining))
+                delay = min(delay * 2, 0.02)
+
+    def release(self):
+        """Release the write lock held by this thread"""
+        self._local.depth -= 1
+        if self._local.depth:
+            return
+        if fcntl is not None and self.path is not None:
+            fcntl.flock(self._file(), fcntl.LOCK_UN)
+        self._lock.release()
+
+    @contextmanager
+    def held(self):
+        """Context manager holding the write lock"""
+        self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    def stats(self):
+        """Return write lock statistics as a dict"""
+        return {
+            'acquisitions': self.acquisitions,
+            'timeouts': self.timeouts,
+            'total_wait_ms': round(self.total_wait_ms, 3),
+            'average_wait_ms': round(self.total_wait_ms / self.acquisitions, 3) if self.acquisitions else 0
+        }
+
+
+class ConnectionPool:
+    """Bounded pool of SQLite connections shared between request threads
+
+    database may be ':memory:', giving the pool a private in-memory database shared
+    by its connections (for tests); it lives until the pool is garbage collected.
+    """
+
+    def __init__(self, database, max_connections=8, timeout=30, pragmas=None):
+        self.database = database
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self.pragmas = DEFAULT_PRAGMAS if pragmas is None else pragmas
+
+        self._uri = None
+        self._keepalive = None
+        if database == ':memory:':
+            # A plain :memory: connection gets its own empty database; a named shared-cache
+            # one is visible to every connection of this pool while any of them is open
+            self._uri = f'file:finance-tracker-{uuid.uuid4().hex}?mode=memory&cache=shared'
+            self._keepalive = self._connect()
+
+        self._idle = []
+        self._open = 0
+        self._cond = threading.Condition()
+
+        # Statistics
+        self.hits = 0      # Acquired an idle connection
+        self.misses = 0    # Had to open a new connection
+        self.waits = 0     # Had to wait for a connection to be released
+        self.timeouts = 0
+
+    def _connect(self):
+        # Implicit transactions start as IMMEDIATE so a writer never has to upgrade a read
+        # snapshot (which fails with "database is locked" instead of waiting)
+        conn = sqlite3.connect(self._uri or self.database, check_same_thread=False,
+                               isolation_level='IMMEDIATE', uri=self._uri is not None)
+        conn.row_factory = sqlite3.Row  # Enable dict-like access to rows
+        for name, value in self.pragmas.items():
+            conn.execute(f'PRAGMA {name} = {value}')
+        if self._uri:
+            # Shared-cache readers would otherwise fail on tables a writer has locked
+            conn.execute('PRAGMA read_uncommitted = 1')
+        return conn
+
+    def acquire(self):
+        """Take a connection from the pool, opening one if the pool isn't full"""
+        with self._cond:
+            deadline = None
+            while True:
+                if self._idle:
+                    self.hits += 1
+                    return self._idle.pop()
+
+                if self._open < self.max_connections:
+                    self._open += 1
+                    self.misses += 1
+                    break
+
+                if deadline is None:
+                    self.waits += 1
+                    deadline = time.monotonic() + self.timeout
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.timeouts += 1
+                    raise PoolTimeout(f'No database connection available after {self.timeout}s')
+                self._cond.wait(remaining)
+
+        # Open outside the lock so a slow connect doesn't block other threads
+        try:
+            return self._connect()
+        except Exception:
+            with self._cond:
+                self._open -= 1
+                self._cond.notify()
+            raise
+
+    def release(self, conn):
+        """Return a connection to the pool, rolling back any unfinished transaction"""
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            # Connection is unusable; drop it instead of pooling it
+            with self._cond:
+                self._open -= 1
+                self._cond.notify()
+            conn.close()
+            return
+
+        with self._cond:
+            self._idle.append(conn)
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self):
+        """Context manager yielding a pooled connection"""
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def close_all(self):
+        """Close every idle connection in the pool"""
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self._open -= len(idle)
+        for conn in idle:
+            conn.close()
+
+    def stats(self):
+        """Return pool statistics as a dict"""
+        with self._cond:
+            return {
+                'max_connections': self.max_connections,
+                'open_connections': self._open,
+                'idle_connections': len(self._idle),
+                'in_use_connections': self._open - len(self._idle),
+                'hits': self.hits,
+                'misses': self.misses,
+                'waits': self.waits,
+                'timeouts': self.timeouts
+            }
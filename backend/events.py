@@ -0,0 +1,327 @@
+"""Server-sent events push channel
+
+EventServer streams compact change notifications ("transactions changed, now at seq
+N") to EventSource clients. It runs an asyncio loop in a single thread, so thousands
+of idle subscribers cost a socket and a small coroutine each rather than a thread.
+
+Notifications are derived from the database rather than sent by the routes, so writes
+made by any gunicorn worker, the recurring scheduler or the CLI are all seen: a
+watcher polls PRAGMA data_version, which changes whenever another connection commits
+and costs no disk read, and only then reads the change_log seq (migration 7) and
+topic_versions (migration 8) to work out which topics changed. Polling costs the same
+however many clients are connected.
+"""
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+import time
+from urllib.parse import parse_qs
+
+logger = logging.getLogger(__name__)
+
+# change_log entity -> topic
+ENTITY_TOPICS = {'transaction': 'transactions', 'recurring': 'recurring'}
+
+# Topics versioned in topic_versions, in the order they appear in event ids
+VERSIONED_TOPICS = ('budget_goals', 'accounts', 'categorization_rules')
+
+TOPICS = tuple(ENTITY_TOPICS.values()) + VERSIONED_TOPICS
+
+MAX_HEADER_LINES = 100
+
+
+def current_topic_versions(conn):
+    """Return {topic: version}; any commit touching a topic, from any connection, changes it
+
+    The change_log topics share the log's latest seq.
+    """
+    versions = dict.fromkeys(TOPICS, 0)
+    seq = conn.execute('SELECT COALESCE(MAX(seq), 0) FROM change_log').fetchone()[0]
+    versions.update(dict.fromkeys(ENTITY_TOPICS.values(), seq))
+    versions.update(conn.execute('SELECT topic, version FROM topic_versions').fetchall())
+    return versions
+
+
+class TopicWatcher:
+    """Tracks the change_log seq and topic versions seen on one connection"""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self._data_version = None
+        self.seq = conn.execute('SELECT COALESCE(MAX(seq), 0) FROM change_log').fetchone()[0]
+        self.versions = self._read_versions()
+
+    def _read_versions(self):
+        versions = dict.fromkeys(VERSIONED_TOPICS, 0)
+        versions.update(self.conn.execute('SELECT topic, version FROM topic_versions').fetchall())
+        return versions
+
+    @property
+    def event_id(self):
+        """An SSE event id encoding the current position: seq and topic versions"""
+        return '-'.join(str(value) for value in (self.seq,) + tuple(self.versions[t] for t in VERSIONED_TOPICS))
+
+    def changed_since(self, event_id):
+        """Return the topics changed since event_id (every topic if it can't be parsed)"""
+        try:
+            values = [int(value) for value in event_id.split('-')]
+        except (AttributeError, ValueError):
+            return set(TOPICS)
+        if len(values) != 1 + len(VERSIONED_TOPICS):
+            return set(TOPICS)
+
+        changed = {topic for topic, version in zip(VERSIONED_TOPICS, values[1:]) if version != self.versions[topic]}
+        if values[0] != self.seq:
+            changed.update(ENTITY_TOPICS[row[0]] for row in self.conn.execute(
+                'SELECT DISTINCT entity FROM change_log WHERE seq > ?', (min(values[0], self.seq),)))
+        return changed
+
+    def poll(self):
+        """Return the set of topics changed since the previous poll"""
+        data_version = self.conn.execute('PRAGMA data_version').fetchone()[0]
+        if data_version == self._data_version:
+            return set()
+        self._data_version = data_version
+
+        changed = set()
+        seq = self.conn.execute('SELECT COALESCE(MAX(seq), 0) FROM change_log').fetchone()[0]
+        if seq != self.seq:
+            changed.update(ENTITY_TOPICS[row[0]] for row in self.conn.execute(
+                'SELECT DISTINCT entity FROM change_log WHERE seq > ?', (self.seq,)))
+            self.seq = seq
+
+        versions = self._read_versions()
+        changed.update(topic for topic in VERSIONED_TOPICS if versions[topic] != self.versions[topic])
+        self.versions = versions
+        return changed
+
+
+class Subscriber:
+    """One connected client's pending notification, coalesced until it is written"""
+
+    __slots__ = ('topics', 'position', 'ping', 'wakeup')
+
+    def __init__(self):
+        self.topics = set()
+        self.position = None  # (event id, seq) of the latest notification
+        self.ping = False
+        self.wakeup = asyncio.Event()
+
+
+class EventBroker:
+    """Fans notifications out to subscribers (called from the event loop only)
+
+    Publishing marks each subscriber's pending topics and wakes it; a client that is
+    slow to read gets one combined notification instead of a growing queue.
+    """
+
+    def __init__(self):
+        self.subscribers = set()
+        self.published = 0
+
+    def subscribe(self):
+        subscriber = Subscriber()
+        self.subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        self.subscribers.discard(subscriber)
+
+    def publish(self, topics, event_id, seq):
+        self.published += 1
+        position = (event_id, seq)
+        for subscriber in self.subscribers:
+            subscriber.topics.update(topics)
+            subscriber.position = position
+            subscriber.wakeup.set()
+
+    def ping(self):
+        for subscriber in self.subscribers:
+            subscriber.ping = True
+            subscriber.wakeup.set()
+
+
+def format_event(event, event_id, data):
+    return f'event: {event}\nid: {event_id}\ndata: {json.dumps(data, separators=(",", ":"))}\n\n'.encode()
+
+
+class EventServer:
+    """HTTP server for GET /api/events (text/event-stream) on an asyncio loop
+
+    Also serves GET /api/events/stats. Use start()/stop() to run it on a background
+    thread next to the API, or serve_forever() to run it as its own process.
+    """
+
+    def __init__(self, db_pool, host='127.0.0.1', port=5001, poll_interval=0.25, heartbeat=15,
+                 max_clients=10000):
+        self.db_pool = db_pool
+        self.host = host
+        self.port = port
+        self.poll_interval = poll_interval
+        self.heartbeat = heartbeat
+        self.max_clients = max_clients
+        self.broker = EventBroker()
+        self._watcher = None
+        self._loop = None
+        self._stopping = None
+        self._thread = None
+        self._ready = threading.Event()
+
+        # Statistics
+        self.polls = 0
+        self.connections = 0
+        self.rejected = 0
+        self.started_at = None
+
+    def serve_forever(self):
+        """Serve on the calling thread until interrupted"""
+        asyncio.run(self._serve())
+
+    def start(self):
+        """Serve on a background thread; returns once the port is bound"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._ready.clear()
+        self._thread = threading.Thread(target=self.serve_forever, name='event-server', daemon=True)
+        self._thread.start()
+        self._ready.wait(10)
+
+    def stop(self, timeout=None):
+        """Disconnect every client and stop the background thread"""
+        if self._loop is not None and self._stopping is not None:
+            self._loop.call_soon_threadsafe(self._stopping.set)
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+
+    @property
+    def running(self):
+        return self._loop is not None
+
+    def stats(self):
+        return {
+            'running': self.running,
+            'subscribers': len(self.broker.subscribers),
+            'connections_total': self.connections,
+            'rejected_total': self.rejected,
+            'events_published': self.broker.published,
+            'polls': self.polls,
+            'poll_interval_seconds': self.poll_interval,
+            'event_id': self._watcher.event_id if self._watcher else None,
+            'started_at': self.started_at
+        }
+
+    async def _serve(self):
+        self._loop = asyncio.get_running_loop()
+        self._stopping = asyncio.Event()
+        self.started_at = time.strftime('%Y-%m-%dT%H:%M:%S')
+        # The watcher keeps one pooled connection for as long as the server runs
+        try:
+            with self.db_pool.connection() as conn:
+                self._watcher = TopicWatcher(conn)
+                server = await asyncio.start_server(self._handle, self.host, self.port, backlog=1024)
+                tasks = [asyncio.create_task(self._watch()), asyncio.create_task(self._heartbeat())]
+                self._ready.set()
+                try:
+                    await self._stopping.wait()
+                finally:
+                    # Open streams are cancelled by asyncio.run() on the way out
+                    server.close()
+                    for task in tasks:
+                        task.cancel()
+        finally:
+            self._loop = None
+            self._ready.set()  # Don't leave start() waiting if binding failed
+
+    async def _watch(self):
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            self.polls += 1
+            try:
+                # A few index lookups: quick enough to run on the loop itself
+                changed = self._watcher.poll()
+            except sqlite3.Error:
+                logger.exception('Polling for changes failed')
+                continue
+            if changed:
+                self.broker.publish(changed, self._watcher.event_id, self._watcher.seq)
+
+    async def _heartbeat(self):
+        # Comments keep idle connections open through proxies and reveal dead clients
+        while True:
+            await asyncio.sleep(self.heartbeat)
+            self.broker.ping()
+
+    async def _handle(self, reader, writer):
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), 10)
+            headers = {}
+            for _ in range(MAX_HEADER_LINES):
+                line = await asyncio.wait_for(reader.readline(), 10)
+                if line in (b'\r\n', b'\n', b''):
+                    break
+                name, _, value = line.decode('latin-1').partition(':')
+                headers[name.strip().lower()] = value.strip()
+            method, target, _ = request_line.decode('latin-1').split(' ', 2)
+        except (asyncio.TimeoutError, ConnectionError, UnicodeDecodeError, ValueError):
+            writer.close()
+            return
+
+        path, _, query = target.partition('?')
+        try:
+            if method != 'GET':
+                await self._respond(writer, '405 Method Not Allowed', {'error': 'Only GET is supported'})
+            elif path == '/api/events/stats':
+                await self._respond(writer, '200 OK', self.stats())
+            elif path != '/api/events':
+                await self._respond(writer, '404 Not Found', {'error': 'Not found'})
+            elif len(self.broker.subscribers) >= self.max_clients:
+                self.rejected += 1
+                await self._respond(writer, '503 Service Unavailable', {'error': 'Too many subscribers'})
+            else:
+                last_event_id = headers.get('last-event-id') or parse_qs(query).get('last_event_id', [None])[0]
+                await self._stream(reader, writer, last_event_id)
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
+
+    async def _respond(self, writer, status, data):
+        body = json.dumps(data).encode()
+        writer.write(f'HTTP/1.1 {status}\r\nContent-Type: application/json\r\nContent-Length: {len(body)}\r\n'
+                     f'Access-Control-Allow-Origin: *\r\nConnection: close\r\n\r\n'.encode() + body)
+        await writer.drain()
+
+    async def _stream(self, reader, writer, last_event_id):
+        self.connections += 1
+        subscriber = self.broker.subscribe()
+        try:
+            writer.write(b'HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nCache-Control: no-cache\r\n'
+                         b'Access-Control-Allow-Origin: *\r\nX-Accel-Buffering: no\r\n\r\nretry: 5000\n\n')
+
+            # A reconnecting client is told what it missed; a new one learns the current position
+            event_id = self._watcher.event_id
+            changed = self._watcher.changed_since(last_event_id) if last_event_id else set()
+            if changed:
+                writer.write(format_event('change', event_id, {'topics': sorted(changed), 'seq': self._watcher.seq}))
+            else:
+                writer.write(format_event('ready', event_id, {'seq': self._watcher.seq}))
+            await writer.drain()
+
+            while True:
+                await subscriber.wakeup.wait()
+                subscriber.wakeup.clear()
+                if reader.at_eof() or writer.is_closing():
+                    break  # The client went away
+                if subscriber.topics:
+                    event_id, seq = subscriber.position
+                    writer.write(format_event('change', event_id, {'topics': sorted(subscriber.topics), 'seq': seq}))
+                    subscriber.topics.clear()
+                elif subscriber.ping:
+                    writer.write(b': ping\n\n')
+                subscriber.ping = False
+                await writer.drain()
+        finally:
+            self.broker.unsubscribe(subscriber)
@@ -1,92 +1,232 @@
-from flask import Flask, request, jsonify
+from flask import Blueprint, Flask, current_app, request, jsonify, g, Response, stream_with_context
 from flask_cors import CORS
-import sqlite3
 import json
+import base64
+import csv
+import io
+import re
+import zlib
+import hmac
+import heapq
 from datetime import datetime, timedelta
 from dateutil.relativedelta import relativedelta
+from itertools import islice
 import os
+import time
+import click
+from analytics import GRANULARITIES, time_series, budget_variance
+from archive import Archive, archive_transactions, default_before_year
+from bulk import grouped_insert_maintenance
+from cache import ResponseCache, cached
+from categorize import CategorizerCache, recategorize, validate_rule
+from changes import changes_since
+from db import ConnectionPool, WriteLock, WriteLockTimeout
+from events import EventServer, current_topic_versions
+from forecast import MAX_HORIZON_MONTHS, forecast
+from importers import parse_upload
+from ledger import reconcile_accounts
+from metrics import InstrumentedConnection, Metrics, RequestProfile
+from migrations import migrate, check_query_plans
+from rollups import rebuild_rollups, check_rollups, rollup_triggers_suspended, add_to_rollups
+from recurrence import FREQUENCIES, materialize_due_occurrences
+from scheduler import RecurringScheduler
+from seed import seed_sample_data
+from tenants import ShardRouter, TenantError, issue_token, tenant_from_token
+from werkzeug.local import LocalProxy
 
-app = Flask(__name__)
-CORS(app)  # Enable CORS for frontend communication
+# Routes, hooks and CLI commands; create_app() registers them on an application
+api = Blueprint('api', __name__, cli_group=None)
 
-# Database configuration
+# Default configuration for create_app()
+# Database path (':memory:' for a throwaway in-memory database); FINANCE_TRACKER_DATABASE overrides it
 DATABASE = 'finance_tracker.db'
+DATABASE_POOL_SIZE = 8
+
+# Response cache for read-heavy endpoints
+RESPONSE_CACHE_SIZE = 256
+RESPONSE_CACHE_TTL = 60
+
+# How long (in seconds) the compiled categorization rules and learned mappings are reused
+CATEGORIZER_TTL = 300
+
+# How often (in seconds) the background scheduler materializes due recurring transactions
+RECURRING_SCHEDULER_INTERVAL = 300
+
+# Per-query SQL timing, Server-Timing headers and per-route histograms (FINANCE_TRACKER_INSTRUMENTATION=1)
+INSTRUMENTATION = False
+# Statements slower than this (in milliseconds) are logged with their query plan
+SLOW_QUERY_MS = 100
+# Directory where each worker process shares its metrics, so /metrics reports the totals
+# of all Gunicorn workers (FINANCE_TRACKER_METRICS_DIRECTORY; gunicorn.conf.py sets one);
+# None reports this process only
+METRICS_DIRECTORY = None
+
+# Server-sent events push channel on its own port (FINANCE_TRACKER_EVENTS_HOST/PORT override it)
+EVENTS_HOST = '127.0.0.1'
+EVENTS_PORT = 5001
+# How often (in seconds) the event server checks the database for commits
+EVENTS_POLL_INTERVAL = 0.25
+EVENTS_MAX_CLIENTS = 10000
+
+# Cold storage for old transactions (see archive-transactions); None puts the files in
+# a directory next to the database named after it with an .archive suffix
+ARCHIVE_DIRECTORY = None
+# archive-transactions moves whole years more than this many years old
+ARCHIVE_OLDER_THAN_YEARS = 2
+
+# Multi-tenant mode (FINANCE_TRACKER_TENANTS=1): each tenant's data lives in its own
+# database under TENANT_DIRECTORY, opened on first use
+TENANTS = False
+TENANT_DIRECTORY = 'tenants'
+MAX_OPEN_SHARDS = 64
+SHARD_POOL_SIZE = 4
+SHARD_CACHE_SIZE = 64
+# Tenant ids come from bearer tokens signed with TENANT_SECRET (see issue-tenant-token), or
+# from TENANT_HEADER when an authenticating reverse proxy sets it
+TENANT_SECRET = None
+TENANT_HEADER = None
+# Bearer token for the /api/admin routes (disabled when unset)
+ADMIN_TOKEN = None
+# Processes computing cross-tenant aggregates (None: one per CPU)
+AGGREGATE_PROCESSES = None
+
+def app_state(name):
+    """Proxy to one of the current application's objects created by create_app()"""
+    return LocalProxy(lambda: current_app.extensions['finance_tracker'][name])
+
+def shard_state(name):
+    """Proxy to the current tenant shard's object in multi-tenant mode, else the application's"""
+    def resolve():
+        shard = g.get('shard')
+        return getattr(shard, name) if shard is not None else current_app.extensions['finance_tracker'][name]
+    return LocalProxy(resolve)
+
+db_pool = shard_state('db_pool')
+# Single-writer queue shared by every worker thread and process serving the database
+write_lock = shard_state('write_lock')
+response_cache = shard_state('response_cache')
+categorizer_cache = shard_state('categorizer_cache')
+archive = shard_state('archive')
+recurring_scheduler = app_state('recurring_scheduler')
+metrics = app_state('metrics')
+event_server = app_state('event_server')
+shards = app_state('shards')  # Only in multi-tenant mode (check config['TENANTS'])
 
 def get_db_connection():
-    """Create and return database connection"""
-    conn = sqlite3.connect(DATABASE)
-    conn.row_factory = sqlite3.Row  # Enable dict-like access to rows
-    return conn
+    """Return the pooled database connection for the current request
 
-def init_database():
-    """Initialize database with required tables"""
-    conn = get_db_connection()
-    
-    # Create transactions table
-    conn.execute('''
-        CREATE TABLE IF NOT EXISTS transactions (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            date TEXT NOT NULL,
-            description TEXT NOT NULL,
-            amount REAL NOT NULL,
-            type TEXT NOT NULL CHECK (type IN ('income', 'expense')),
-            category TEXT NOT NULL,
-            notes TEXT,
-            recurring_id INTEGER,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (recurring_id) REFERENCES recurring_transactions (id)
-        )
-    ''')
-    
-    # Create recurring transactions table
-    conn.execute('''
-        CREATE TABLE IF NOT EXISTS recurring_transactions (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            description TEXT NOT NULL,
-            amount REAL NOT NULL,
-            type TEXT NOT NULL CHECK (type IN ('income', 'expense')),
-            category TEXT NOT NULL,
-            notes TEXT,
-            frequency TEXT NOT NULL CHECK (frequency IN ('weekly', 'biweekly', 'monthly', 'quarterly', 'yearly')),
-            start_date TEXT NOT NULL,
-            end_date TEXT,
-            next_occurrence TEXT NOT NULL,
-            is_active BOOLEAN DEFAULT 1,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    
-    # Create budget_goals table
-    conn.execute('''
-        CREATE TABLE IF NOT EXISTS budget_goals (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            monthly_income REAL NOT NULL DEFAULT 0,
-            debt_payments REAL NOT NULL DEFAULT 0,
-            savings REAL NOT NULL DEFAULT 0,
-            investments REAL NOT NULL DEFAULT 0,
-            discretionary REAL NOT NULL DEFAULT 0,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    
-    # Create accounts table
-    conn.execute('''
-        CREATE TABLE IF NOT EXISTS accounts (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL,
-            type TEXT NOT NULL,
-            balance REAL NOT NULL DEFAULT 0,
-            monthly_contribution REAL NOT NULL DEFAULT 0,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    
-    conn.commit()
-    conn.close()
+    The connection is acquired once per request and released on teardown. With
+    instrumentation on it is wrapped to time every statement.
+    """
+    if 'db' not in g:
+        conn = db_pool.acquire()
+        profile = g.get('profile')
+        g.db = InstrumentedConnection(conn, profile) if profile is not None else conn
+    return g.db
+
+# Routes that don't belong to a tenant
+TENANT_EXEMPT = ('api.get_tenant_aggregates', 'api.get_metrics')
+
+def tenant_id_from_request():
+    """Return the tenant id the request is authenticated as (raises TenantError)"""
+    header = current_app.config['TENANT_HEADER']
+    if header:
+        tenant_id = request.headers.get(header)
+        if not tenant_id:
+            raise TenantError(f'Missing {header} header')
+        return tenant_id
+    
+    scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+    if scheme.lower() != 'bearer':
+        raise TenantError('Missing bearer token')
+    return tenant_from_token(current_app.config['TENANT_SECRET'], token.strip())
+
+@api.before_app_request
+def route_to_tenant_shard():
+    """Point the request at its tenant's shard (multi-tenant mode only)"""
+    if not current_app.config['TENANTS'] or request.method == 'OPTIONS' or request.endpoint in TENANT_EXEMPT:
+        return
+    try:
+        g.shard = shards.acquire(tenant_id_from_request())
+    except TenantError as e:
+        return jsonify({'error': str(e)}), 401
+
+@api.after_app_request
+def vary_on_tenant(response):
+    """Keep shared HTTP caches from serving one tenant's response to another"""
+    if current_app.config['TENANTS']:
+        response.vary.add(current_app.config['TENANT_HEADER'] or 'Authorization')
+    return response
+
+def response_cache_versions(tags):
+    """Shared database versions of response cache tags, so other processes' writes invalidate too"""
+    versions = current_topic_versions(get_db_connection())
+    return [versions[tag] for tag in tags]
+
+def begin_read_snapshot(conn):
+    """Serve the rest of the request's reads from one snapshot (ends when the connection is released)"""
+    if not conn.in_transaction:
+        conn.execute('BEGIN')
+
+WRITE_METHODS = ('POST', 'PUT', 'PATCH', 'DELETE')
+
+# Long-running writers that take the write lock per database transaction instead
+WRITE_LOCK_EXEMPT = ('api.manual_process_recurring', 'api.recategorize_transactions')
+
+@api.before_app_request
+def acquire_write_lock():
+    """Queue mutating requests behind the single database writer"""
+    if request.method in WRITE_METHODS and request.endpoint not in WRITE_LOCK_EXEMPT:
+        try:
+            write_lock.acquire()
+        except WriteLockTimeout as e:
+            return jsonify({'error': str(e)}), 503
+        g.holds_write_lock = True
+
+def release_db_connection(exception):
+    """Return the request's connection to the pool, then give up the write lock and shard"""
+    conn = g.pop('db', None)
+    if isinstance(conn, InstrumentedConnection):
+        conn = conn.detach()
+    if conn is not None:
+        db_pool.release(conn)
+    if g.pop('holds_write_lock', False):
+        write_lock.release()
+    shard = g.pop('shard', None)
+    if shard is not None:
+        shards.release(shard)
+
+def start_request_profile():
+    """Start profiling the request (registered by create_app() when instrumentation is on)"""
+    g.profile = RequestProfile()
+
+def finish_request_profile(response):
+    """Add the Server-Timing header and record the request's route metrics"""
+    profile = g.pop('profile', None)
+    if profile is None:
+        return response
+    
+    total = time.perf_counter() - profile.started
+    response.headers['Server-Timing'] = profile.server_timing(total)
+    
+    # Label by URL rule rather than path so IDs don't create a series per record
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    conn = g.get('db')
+    metrics.record(route, request.method, response.status_code, profile, total,
+                   conn.raw if isinstance(conn, InstrumentedConnection) else None)
+    return response
+
+def init_database(shard=None):
+    """Initialize database by applying any pending schema migrations
+
+    Given a tenant shard, initializes that shard's database instead (creating it if
+    it doesn't exist); the shard router calls this when it opens a shard.
+    """
+    with (shard.db_pool if shard else db_pool).connection() as conn:
+        applied = migrate(conn)
+    if applied:
+        target = f" for tenant {shard.tenant_id}" if shard else ""
+        print(f"Applied database migrations{target}: {', '.join(str(v) for v in applied)}")
 
 def calculate_next_occurrence(start_date, frequency):
     """Calculate next occurrence date based on frequency"""
@@ -106,108 +246,435 @@ def calculate_next_occurrence(start_date, frequency):
     return start_date
 
 def process_recurring_transactions():
-    """Process recurring transactions that are due"""
-    conn = get_db_connection()
-    today = datetime.now().strftime('%Y-%m-%d')
-    
-    # Get all active recurring transactions due today or overdue
-    recurring = conn.execute('''
-        SELECT * FROM recurring_transactions 
-        WHERE is_active = 1 AND next_occurrence <= ?
-        AND (end_date IS NULL OR end_date >= ?)
-    ''', (today, today)).fetchall()
-    
-    for rec in recurring:
-        # Create new transaction from recurring template
-        conn.execute('''
-            INSERT INTO transactions (date, description, amount, type, category, notes, recurring_id)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        ''', (rec['next_occurrence'], rec['description'], rec['amount'], 
-              rec['type'], rec['category'], rec['notes'], rec['id']))
-        
-        # Update next occurrence
-        new_next_occurrence = calculate_next_occurrence(rec['next_occurrence'], rec['frequency'])
-        conn.execute('''
-            UPDATE recurring_transactions 
-            SET next_occurrence = ?, updated_at = CURRENT_TIMESTAMP
-            WHERE id = ?
-        ''', (new_next_occurrence, rec['id']))
-    
-    conn.commit()
-    conn.close()
-    return len(recurring)
+    """Process recurring transactions that are due, catching up on every missed occurrence"""
+    with write_lock.held(), db_pool.connection() as conn:
+        count = materialize_due_occurrences(conn)
+    if count:
+        response_cache.invalidate('transactions', 'recurring', 'accounts')
+    return count
 
 # ==================== TRANSACTION ROUTES ====================
 
-@app.route('/api/transactions', methods=['GET'])
-def get_transactions():
-    """Get all transactions with optional filtering"""
-    process_recurring_transactions()  # Process any due recurring transactions
-    
-    conn = get_db_connection()
-    
-    # Get query parameters for filtering
-    start_date = request.args.get('start_date')
-    end_date = request.args.get('end_date')
-    category = request.args.get('category')
-    transaction_type = request.args.get('type')
-    
-    # Build query with filters
-    query = 'SELECT * FROM transactions WHERE 1=1'
+# Columns that may be requested with ?fields= (id and date are always returned for the cursor)
+TRANSACTION_FIELDS = ['id', 'date', 'description', 'amount', 'type', 'category', 'notes',
+                      'recurring_id', 'account_id', 'created_at', 'updated_at']
+MAX_PAGE_SIZE = 500
+
+# Category used when neither the request nor the categorizer provides one
+DEFAULT_CATEGORY = 'Other'
+
+def build_search_query(text):
+    """Turn free text into an FTS5 query matching every word as a prefix (None if no words)"""
+    terms = re.findall(r'\w+', text or '')
+    return ' '.join(f'"{term}"*' for term in terms) or None
+
+def build_transaction_filters(args):
+    """Build the WHERE clause and parameters for the transaction filters in args"""
+    query = ' WHERE 1=1'
     params = []
     
-    if start_date:
+    search = build_search_query(args.get('q'))
+    if search:
+        query += ' AND id IN (SELECT rowid FROM transactions_fts WHERE transactions_fts MATCH ?)'
+        params.append(search)
+    
+    if args.get('start_date'):
         query += ' AND date >= ?'
-        params.append(start_date)
+        params.append(args['start_date'])
     
-    if end_date:
+    if args.get('end_date'):
         query += ' AND date <= ?'
-        params.append(end_date)
+        params.append(args['end_date'])
     
-    if category:
+    if args.get('category'):
         query += ' AND category = ?'
-        params.append(category)
+        params.append(args['category'])
     
-    if transaction_type:
+    if args.get('type'):
         query += ' AND type = ?'
-        params.append(transaction_type)
+        params.append(args['type'])
+    
+    return query, params
+
+def encode_cursor(row):
+    """Encode the (date, id) position of a row as an opaque cursor"""
+    raw = json.dumps([row['date'], row['id']]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    """Decode a cursor produced by encode_cursor() into (date, id)"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        date, row_id = json.loads(base64.urlsafe_b64decode(padded))
+        return str(date), int(row_id)
+    except (ValueError, TypeError):
+        raise ValueError('Invalid cursor')
+
+@api.route('/api/transactions', methods=['GET'])
+def get_transactions():
+    """Get transactions with optional filtering, keyset pagination and field projection
+
+    Without limit/cursor the full filtered list is returned (as before). With them the
+    response is {'transactions': [...], 'next_cursor': ...}; pass next_cursor back to
+    get the following page. q= searches descriptions and notes (words match as prefixes);
+    add sort=relevance to rank matches instead of ordering by date (first page only).
+    """
+    conn = get_db_connection()
+    
+    # Field projection
+    fields = request.args.get('fields')
+    if fields:
+        requested = [f.strip() for f in fields.split(',') if f.strip()]
+        unknown = [f for f in requested if f not in TRANSACTION_FIELDS]
+        if unknown:
+            return jsonify({'error': f"Unknown field: {', '.join(unknown)}"}), 400
+        columns = ['id', 'date'] + [f for f in requested if f not in ('id', 'date')]
+        select = ', '.join(columns)
+    else:
+        select = '*'
+    
+    # Build query with filters
+    where, params = build_transaction_filters(request.args)
+    query = f'SELECT {select} FROM transactions' + where
+    
+    limit = request.args.get('limit')
+    cursor = request.args.get('cursor')
+    paginated = limit is not None or cursor is not None
+    
+    # Live rows and archive_segments must be read from the same snapshot
+    begin_read_snapshot(conn)
+    
+    search = build_search_query(request.args.get('q'))
+    if search and request.args.get('sort') == 'relevance':
+        if cursor:
+            return jsonify({'error': 'cursor is not supported with sort=relevance'}), 400
+        try:
+            limit = min(max(int(limit or MAX_PAGE_SIZE), 1), MAX_PAGE_SIZE)
+        except ValueError:
+            return jsonify({'error': 'limit must be an integer'}), 400
+        
+        # Rank with bm25 via a join on the full-text index; the other filters still apply
+        where, params = build_transaction_filters({k: v for k, v in request.args.items() if k != 'q'})
+        query = f'''
+            WITH matches AS (
+                SELECT rowid AS match_id, rank AS match_rank
+                FROM transactions_fts WHERE transactions_fts MATCH ?
+            )
+            SELECT {select} FROM transactions JOIN matches ON match_id = id
+        ''' + where + ' ORDER BY match_rank LIMIT ?'
+        result = conn.execute(query, [search] + params + [limit])
+        transactions = [dict(row) for row in result]
+        if len(transactions) < limit:
+            # Archived matches aren't ranked; they follow the live ones, newest first
+            columns = [column[0] for column in result.description]
+            archived = archive.scan(conn, request.args, columns)
+            transactions.extend(dict(zip(columns, row)) for row in islice(archived, limit - len(transactions)))
+        return jsonify({'transactions': transactions, 'next_cursor': None})
+    
+    before = None
+    if paginated:
+        try:
+            limit = min(max(int(limit or MAX_PAGE_SIZE), 1), MAX_PAGE_SIZE)
+        except ValueError:
+            return jsonify({'error': 'limit must be an integer'}), 400
+        if cursor:
+            try:
+                before = decode_cursor(cursor)
+            except ValueError:
+                return jsonify({'error': 'Invalid cursor'}), 400
+            query += ' AND (date, id) < (?, ?)'
+            params.extend(before)
     
     query += ' ORDER BY date DESC, id DESC'
     
-    transactions = conn.execute(query, params).fetchall()
-    conn.close()
+    if paginated:
+        # Fetch one extra row to know whether there is a next page
+        query += ' LIMIT ?'
+        params.append(limit + 1)
+    result = conn.execute(query, params)
+    columns = [column[0] for column in result.description]
+    transactions = [dict(row) for row in result]
+    
+    # Merge in archived rows; once the live rows fill the page, only archived rows
+    # newer than its last one can still make it
+    after = (transactions[-1]['date'], transactions[-1]['id']) if paginated and len(transactions) > limit else None
+    archived = (dict(zip(columns, row)) for row in archive.scan(conn, request.args, columns, before, after))
+    transactions = heapq.merge(transactions, archived, key=lambda row: (row['date'], row['id']), reverse=True)
+    
+    if not paginated:
+        return jsonify(list(transactions))
+    
+    transactions = list(islice(transactions, limit + 1))
+    has_more = len(transactions) > limit
+    transactions = transactions[:limit]
+    
+    return jsonify({
+        'transactions': transactions,
+        'next_cursor': encode_cursor(transactions[-1]) if has_more else None
+    })
+
+EXPORT_BATCH_SIZE = 1000
+
+def iter_export_chunks(columns, rows, export_format):
+    """Yield NDJSON or CSV text chunks, taking rows (sequences of columns) in batches"""
+    rows = iter(rows)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    
+    if export_format == 'csv':
+        writer.writerow(columns)
+    
+    while True:
+        batch = list(islice(rows, EXPORT_BATCH_SIZE))
+        if not batch:
+            break
+        if export_format == 'csv':
+            writer.writerows(batch)
+        else:
+            for row in batch:
+                buffer.write(json.dumps(dict(zip(columns, row))))
+                buffer.write('\n')
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    
+    # Header-only CSV for an empty result
+    if buffer.tell():
+        yield buffer.getvalue()
+
+def gzip_chunks(chunks):
+    """Compress a stream of text chunks into a gzip stream on the fly"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode())
+        if data:
+            yield data
+    yield compressor.flush()
+
+@api.route('/api/transactions/export', methods=['GET'])
+def export_transactions():
+    """Stream all matching transactions as NDJSON or CSV without loading them into memory"""
+    export_format = request.args.get('format', 'ndjson')
+    if export_format not in ('ndjson', 'csv'):
+        return jsonify({'error': 'format must be ndjson or csv'}), 400
     
-    return jsonify([dict(row) for row in transactions])
+    conn = get_db_connection()
+    begin_read_snapshot(conn)
+    where, params = build_transaction_filters(request.args)
+    cursor = conn.execute('SELECT * FROM transactions' + where + ' ORDER BY date DESC, id DESC', params)
+    
+    # Archived years are streamed file by file, merged into the live rows
+    columns = [col[0] for col in cursor.description]
+    archived = archive.scan(conn, request.args, columns)
+    date_index, id_index = columns.index('date'), columns.index('id')
+    rows = heapq.merge(cursor, archived, key=lambda row: (row[date_index], row[id_index]), reverse=True)
+    
+    chunks = iter_export_chunks(columns, rows, export_format)
+    headers = {
+        'Content-Disposition': f'attachment; filename=transactions.{export_format}',
+        'Vary': 'Accept-Encoding'
+    }
+    if 'gzip' in request.headers.get('Accept-Encoding', ''):
+        chunks = gzip_chunks(chunks)
+        headers['Content-Encoding'] = 'gzip'
+    
+    mimetype = 'text/csv' if export_format == 'csv' else 'application/x-ndjson'
+    return Response(stream_with_context(chunks), mimetype=mimetype, headers=headers)
+
+def account_exists(conn, account_id):
+    """Check that an optional account reference points at an existing account"""
+    if account_id is None:
+        return True
+    return conn.execute('SELECT 1 FROM accounts WHERE id = ?', (account_id,)).fetchone() is not None
 
-@app.route('/api/transactions', methods=['POST'])
+@api.route('/api/transactions', methods=['POST'])
 def create_transaction():
-    """Create a new transaction"""
+    """Create a new transaction (the category is filled in by the categorizer if omitted)"""
     data = request.get_json()
     
     # Validate required fields
-    required_fields = ['date', 'description', 'amount', 'type', 'category']
+    required_fields = ['date', 'description', 'amount', 'type']
     for field in required_fields:
         if field not in data:
             return jsonify({'error': f'Missing required field: {field}'}), 400
     
     conn = get_db_connection()
     
+    if not account_exists(conn, data.get('account_id')):
+        return jsonify({'error': 'Account not found'}), 400
+    
+    category = data.get('category')
+    if not category:
+        try:
+            amount = float(data['amount'])
+        except (TypeError, ValueError):
+            amount = None
+        category, _ = categorizer_cache.get(conn).categorize(data['description'], amount, data['type'])
+    
     cursor = conn.execute('''
-        INSERT INTO transactions (date, description, amount, type, category, notes)
-        VALUES (?, ?, ?, ?, ?, ?)
+        INSERT INTO transactions (date, description, amount, type, category, notes, account_id)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
     ''', (data['date'], data['description'], data['amount'], 
-          data['type'], data['category'], data.get('notes', '')))
+          data['type'], category or DEFAULT_CATEGORY, data.get('notes', ''), data.get('account_id')))
     
     transaction_id = cursor.lastrowid
     conn.commit()
+    response_cache.invalidate('transactions', 'accounts')
     
     # Get the created transaction
     transaction = conn.execute('SELECT * FROM transactions WHERE id = ?', (transaction_id,)).fetchone()
-    conn.close()
     
     return jsonify(dict(transaction)), 201
 
-@app.route('/api/transactions/<int:transaction_id>', methods=['PUT'])
+def parse_account_id(value):
+    """Parse an optional account reference, returning (account id or None, error)"""
+    if value in (None, ''):
+        return None, None
+    try:
+        return int(value), None
+    except (TypeError, ValueError):
+        return None, f"Invalid account_id: {value}"
+
+def validate_transaction_row(row, categorizer=None):
+    """Validate and normalize one imported transaction, returning (values, error)
+
+    With a categorizer, a missing category is filled in by it (or DEFAULT_CATEGORY).
+    """
+    required_fields = ['date', 'description', 'amount', 'type']
+    if categorizer is None:
+        required_fields.append('category')
+    for field in required_fields:
+        if row.get(field) in (None, ''):
+            return None, f'Missing required field: {field}'
+    
+    try:
+        date = datetime.strptime(str(row['date']), '%Y-%m-%d').strftime('%Y-%m-%d')
+    except ValueError:
+        return None, f"Invalid date: {row['date']}"
+    
+    try:
+        amount = float(row['amount'])
+    except (TypeError, ValueError):
+        return None, f"Invalid amount: {row['amount']}"
+    
+    if row['type'] not in ('income', 'expense'):
+        return None, f"Invalid type: {row['type']}"
+    
+    account_id, error = parse_account_id(row.get('account_id'))
+    if error:
+        return None, error
+    
+    category = row.get('category')
+    if category in (None, ''):
+        category, _ = categorizer.categorize(str(row['description']), amount, row['type'])
+    
+    return (date, str(row['description']), amount, row['type'], str(category or DEFAULT_CATEGORY),
+            row.get('notes') or '', account_id), None
+
+@api.route('/api/transactions/bulk', methods=['POST'])
+def bulk_import_transactions():
+    """Import many transactions in one transaction
+
+    Accepts a JSON array (or {"transactions": [...], "dedupe": true}) or an uploaded
+    CSV/OFX file in the "file" form field. Rows without a category are auto-categorized.
+    Invalid rows are reported and skipped; with dedupe, rows matching an existing
+    (date, description, amount) are skipped too.
+    """
+    dedupe = request.args.get('dedupe', '').lower() in ('1', 'true', 'yes')
+    
+    if 'file' in request.files:
+        upload = request.files['file']
+        text = upload.read().decode('utf-8-sig', errors='replace')
+        rows = parse_upload(upload.filename, text, request.form.get('category'))
+        dedupe = dedupe or request.form.get('dedupe', '').lower() in ('1', 'true', 'yes')
+    else:
+        data = request.get_json(silent=True)
+        if isinstance(data, dict):
+            dedupe = dedupe or bool(data.get('dedupe'))
+            data = data.get('transactions')
+        if not isinstance(data, list):
+            return jsonify({'error': 'Expected a JSON array of transactions or an uploaded file'}), 400
+        rows = data
+    
+    conn = get_db_connection()
+    categorizer = categorizer_cache.get(conn)
+    
+    errors = []
+    valid = []
+    auto_categorized = 0
+    for index, row in enumerate(rows):
+        if not isinstance(row, dict):
+            errors.append({'row': index, 'error': 'Expected an object'})
+            continue
+        values, error = validate_transaction_row(row, categorizer)
+        if error:
+            errors.append({'row': index, 'error': error})
+        else:
+            valid.append((index, values))
+            if row.get('category') in (None, ''):
+                auto_categorized += 1
+    
+    conn.execute('BEGIN IMMEDIATE')
+    
+    # Reject rows referencing accounts that don't exist
+    account_ids = {values[6] for _, values in valid if values[6] is not None}
+    if account_ids:
+        known = {row['id'] for row in conn.execute(
+            f"SELECT id FROM accounts WHERE id IN ({', '.join('?' * len(account_ids))})", list(account_ids))}
+        for index, values in valid:
+            if values[6] is not None and values[6] not in known:
+                errors.append({'row': index, 'error': f'Account not found: {values[6]}'})
+        valid = [(index, values) for index, values in valid if values[6] is None or values[6] in known]
+        errors.sort(key=lambda error: error['row'])
+    
+    duplicates = []
+    if dedupe and valid:
+        # Look up the batch's own keys only: the live rows on its dates, through the date
+        # index (a temporary table of the dates drives the join), and just those dates'
+        # rows in the archive; only matches are kept, not every row in the date range
+        keys = {}
+        for _, values in valid:
+            keys.setdefault(values[0], set()).add((values[1], round(values[2], 2)))
+        conn.execute('CREATE TEMP TABLE IF NOT EXISTS import_dates (date TEXT PRIMARY KEY) WITHOUT ROWID')
+        conn.executemany('INSERT INTO import_dates (date) VALUES (?)', [(date,) for date in keys])
+        seen = set()
+        for row in conn.execute('''
+            SELECT t.date, t.description, t.amount
+            FROM import_dates d CROSS JOIN transactions t ON t.date = d.date  -- CROSS JOIN keeps d outer
+        '''):
+            key = (row['description'], round(row['amount'], 2))
+            if key in keys[row['date']]:
+                seen.add((row['date'],) + key)
+        conn.execute('DELETE FROM import_dates')
+        seen.update(archive.existing(conn, keys))
+        
+        unique = []
+        for index, values in valid:
+            key = (values[0], values[1], round(values[2], 2))
+            if key in seen:
+                duplicates.append(index)
+            else:
+                seen.add(key)
+                unique.append((index, values))
+        valid = unique
+    
+    with grouped_insert_maintenance(conn, len(valid)):
+        conn.executemany('''
+            INSERT INTO transactions (date, description, amount, type, category, notes, account_id)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', [values for _, values in valid])
+    conn.commit()
+    response_cache.invalidate('transactions', 'accounts')
+    
+    return jsonify({
+        'received': len(rows),
+        'inserted': len(valid),
+        'auto_categorized': auto_categorized,
+        'duplicates': duplicates,
+        'errors': errors
+    })
+
+@api.route('/api/transactions/<int:transaction_id>', methods=['PUT'])
 def update_transaction(transaction_id):
     """Update an existing transaction"""
     data = request.get_json()
@@ -217,14 +684,19 @@ def update_transaction(transaction_id):
     # Check if transaction exists
     existing = conn.execute('SELECT * FROM transactions WHERE id = ?', (transaction_id,)).fetchone()
     if not existing:
-        conn.close()
+        if archive.find(conn, transaction_id):
+            return jsonify({'error': 'Transaction is archived and read-only'}), 409
         return jsonify({'error': 'Transaction not found'}), 404
     
+    account_id = data.get('account_id', existing['account_id'])
+    if not account_exists(conn, account_id):
+        return jsonify({'error': 'Account not found'}), 400
+    
     # Update transaction
     conn.execute('''
         UPDATE transactions 
         SET date = ?, description = ?, amount = ?, type = ?, category = ?, 
-            notes = ?, updated_at = CURRENT_TIMESTAMP
+            notes = ?, account_id = ?, updated_at = CURRENT_TIMESTAMP
         WHERE id = ?
     ''', (data.get('date', existing['date']), 
           data.get('description', existing['description']),
@@ -232,17 +704,18 @@ def update_transaction(transaction_id):
           data.get('type', existing['type']),
           data.get('category', existing['category']),
           data.get('notes', existing['notes']),
+          account_id,
           transaction_id))
     
     conn.commit()
+    response_cache.invalidate('transactions', 'accounts')
     
     # Get updated transaction
     transaction = conn.execute('SELECT * FROM transactions WHERE id = ?', (transaction_id,)).fetchone()
-    conn.close()
     
     return jsonify(dict(transaction))
 
-@app.route('/api/transactions/<int:transaction_id>', methods=['DELETE'])
+@api.route('/api/transactions/<int:transaction_id>', methods=['DELETE'])
 def delete_transaction(transaction_id):
     """Delete a transaction"""
     conn = get_db_connection()
@@ -250,27 +723,27 @@ def delete_transaction(transaction_id):
     # Check if transaction exists
     existing = conn.execute('SELECT * FROM transactions WHERE id = ?', (transaction_id,)).fetchone()
     if not existing:
-        conn.close()
+        if archive.find(conn, transaction_id):
+            return jsonify({'error': 'Transaction is archived and read-only'}), 409
         return jsonify({'error': 'Transaction not found'}), 404
     
     conn.execute('DELETE FROM transactions WHERE id = ?', (transaction_id,))
     conn.commit()
-    conn.close()
+    response_cache.invalidate('transactions', 'accounts')
     
     return jsonify({'message': 'Transaction deleted successfully'})
 
 # ==================== RECURRING TRANSACTION ROUTES ====================
 
-@app.route('/api/recurring-transactions', methods=['GET'])
+@api.route('/api/recurring-transactions', methods=['GET'])
 def get_recurring_transactions():
     """Get all recurring transactions"""
     conn = get_db_connection()
     recurring = conn.execute('SELECT * FROM recurring_transactions ORDER BY next_occurrence').fetchall()
-    conn.close()
     
     return jsonify([dict(row) for row in recurring])
 
-@app.route('/api/recurring-transactions', methods=['POST'])
+@api.route('/api/recurring-transactions', methods=['POST'])
 def create_recurring_transaction():
     """Create a new recurring transaction"""
     data = request.get_json()
@@ -286,25 +759,29 @@ def create_recurring_transaction():
     
     conn = get_db_connection()
     
+    if not account_exists(conn, data.get('account_id')):
+        return jsonify({'error': 'Account not found'}), 400
+    
     cursor = conn.execute('''
         INSERT INTO recurring_transactions 
         (description, amount, type, category, notes, frequency, start_date, 
-         end_date, next_occurrence, is_active)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+         end_date, next_occurrence, is_active, account_id)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
     ''', (data['description'], data['amount'], data['type'], data['category'],
           data.get('notes', ''), data['frequency'], data['start_date'],
-          data.get('end_date'), next_occurrence, data.get('is_active', True)))
+          data.get('end_date'), next_occurrence, data.get('is_active', True),
+          data.get('account_id')))
     
     recurring_id = cursor.lastrowid
     conn.commit()
+    response_cache.invalidate('recurring')
     
     # Get the created recurring transaction
     recurring = conn.execute('SELECT * FROM recurring_transactions WHERE id = ?', (recurring_id,)).fetchone()
-    conn.close()
     
     return jsonify(dict(recurring)), 201
 
-@app.route('/api/recurring-transactions/<int:recurring_id>', methods=['PUT'])
+@api.route('/api/recurring-transactions/<int:recurring_id>', methods=['PUT'])
 def update_recurring_transaction(recurring_id):
     """Update an existing recurring transaction"""
     data = request.get_json()
@@ -314,15 +791,18 @@ def update_recurring_transaction(recurring_id):
     # Check if recurring transaction exists
     existing = conn.execute('SELECT * FROM recurring_transactions WHERE id = ?', (recurring_id,)).fetchone()
     if not existing:
-        conn.close()
         return jsonify({'error': 'Recurring transaction not found'}), 404
     
+    account_id = data.get('account_id', existing['account_id'])
+    if not account_exists(conn, account_id):
+        return jsonify({'error': 'Account not found'}), 400
+    
     # Update recurring transaction
     conn.execute('''
         UPDATE recurring_transactions 
         SET description = ?, amount = ?, type = ?, category = ?, notes = ?, 
             frequency = ?, start_date = ?, end_date = ?, is_active = ?,
-            updated_at = CURRENT_TIMESTAMP
+            account_id = ?, updated_at = CURRENT_TIMESTAMP
         WHERE id = ?
     ''', (data.get('description', existing['description']),
           data.get('amount', existing['amount']),
@@ -333,17 +813,18 @@ def update_recurring_transaction(recurring_id):
           data.get('start_date', existing['start_date']),
           data.get('end_date', existing['end_date']),
           data.get('is_active', existing['is_active']),
+          account_id,
           recurring_id))
     
     conn.commit()
+    response_cache.invalidate('recurring')
     
     # Get updated recurring transaction
     recurring = conn.execute('SELECT * FROM recurring_transactions WHERE id = ?', (recurring_id,)).fetchone()
-    conn.close()
     
     return jsonify(dict(recurring))
 
-@app.route('/api/recurring-transactions/<int:recurring_id>', methods=['DELETE'])
+@api.route('/api/recurring-transactions/<int:recurring_id>', methods=['DELETE'])
 def delete_recurring_transaction(recurring_id):
     """Delete a recurring transaction"""
     conn = get_db_connection()
@@ -351,18 +832,42 @@ def delete_recurring_transaction(recurring_id):
     # Check if recurring transaction exists
     existing = conn.execute('SELECT * FROM recurring_transactions WHERE id = ?', (recurring_id,)).fetchone()
     if not existing:
-        conn.close()
         return jsonify({'error': 'Recurring transaction not found'}), 404
     
     conn.execute('DELETE FROM recurring_transactions WHERE id = ?', (recurring_id,))
     conn.commit()
-    conn.close()
+    response_cache.invalidate('recurring')
     
     return jsonify({'message': 'Recurring transaction deleted successfully'})
 
+# ==================== SYNC ROUTES ====================
+
+DEFAULT_CHANGES_PAGE = 1000
+MAX_CHANGES_PAGE = 5000
+
+@api.route('/api/changes', methods=['GET'])
+def get_changes():
+    """Get the transactions and recurring transactions changed after a sequence number
+
+    Query parameters: since (next_since from the previous response; 0 syncs everything)
+    and limit (changes per page). Deleted rows are listed by id under 'deleted'; keep
+    requesting with next_since while has_more is true.
+    """
+    try:
+        since = int(request.args.get('since', 0))
+        limit = min(max(int(request.args.get('limit', DEFAULT_CHANGES_PAGE)), 1), MAX_CHANGES_PAGE)
+    except ValueError:
+        return jsonify({'error': 'since and limit must be integers'}), 400
+    if since < 0:
+        return jsonify({'error': 'since must not be negative'}), 400
+    
+    conn = get_db_connection()
+    return jsonify(changes_since(conn, since, limit, archive))
+
 # ==================== ANALYTICS ROUTES ====================
 
-@app.route('/api/analytics/spending-by-category', methods=['GET'])
+@api.route('/api/analytics/spending-by-category', methods=['GET'])
+@cached(response_cache, 'transactions')
 def get_spending_by_category():
     """Get spending breakdown by category"""
     period = request.args.get('period', 'month')  # month, 6months, year
@@ -380,20 +885,43 @@ def get_spending_by_category():
     else:
         start_date = today.replace(day=1).strftime('%Y-%m-%d')
     
+    # Whole months come from the rollup; a partial first month is summed from the raw rows
+    month_start = datetime.strptime(start_date[:7] + '-01', '%Y-%m-%d')
+    if start_date.endswith('-01'):
+        rollup_from = start_date[:7]
+        partial_end = start_date
+    else:
+        next_month = month_start + relativedelta(months=1)
+        rollup_from = next_month.strftime('%Y-%m')
+        partial_end = next_month.strftime('%Y-%m-%d')
+    
     # Get spending by category (expenses only)
+    begin_read_snapshot(conn)
     spending = conn.execute('''
-        SELECT category, SUM(ABS(amount)) as total_amount
-        FROM transactions 
-        WHERE type = 'expense' AND date >= ?
+        SELECT category, SUM(total) AS total_amount FROM (
+            SELECT category, abs_total AS total FROM monthly_category_totals
+            WHERE type = 'expense' AND month >= ?
+            UNION ALL
+            SELECT category, ABS(amount) FROM transactions
+            WHERE type = 'expense' AND date >= ? AND date < ?
+        )
         GROUP BY category
         ORDER BY total_amount DESC
-    ''', (start_date,)).fetchall()
-    
-    conn.close()
-    
-    return jsonify([{'category': row['category'], 'amount': row['total_amount']} for row in spending])
+    ''', (rollup_from, start_date, partial_end)).fetchall()
+    totals = {row['category']: row['total_amount'] for row in spending}
+    
+    # The partial first month may lie in an archived year
+    if start_date < partial_end:
+        last_day = (datetime.strptime(partial_end, '%Y-%m-%d') - timedelta(days=1)).strftime('%Y-%m-%d')
+        window = {'start_date': start_date, 'end_date': last_day, 'type': 'expense'}
+        for category, amount in archive.scan(conn, window, ['category', 'amount']):
+            totals[category] = totals.get(category, 0) + abs(amount)
+    
+    return jsonify([{'category': category, 'amount': round(total, 2)}
+                    for category, total in sorted(totals.items(), key=lambda item: item[1], reverse=True)])
 
-@app.route('/api/analytics/financial-overview', methods=['GET'])
+@api.route('/api/analytics/financial-overview', methods=['GET'])
+@cached(response_cache, 'transactions', 'accounts')
 def get_financial_overview():
     """Get financial overview (income, expenses, savings, etc.)"""
     conn = get_db_connection()
@@ -402,30 +930,27 @@ def get_financial_overview():
     today = datetime.now()
     start_of_month = today.replace(day=1).strftime('%Y-%m-%d')
     
-    # Calculate income and expenses for current month
-    income = conn.execute('''
-        SELECT COALESCE(SUM(amount), 0) as total
-        FROM transactions 
-        WHERE type = 'income' AND date >= ?
-    ''', (start_of_month,)).fetchone()['total']
-    
-    expenses = conn.execute('''
-        SELECT COALESCE(SUM(ABS(amount)), 0) as total
-        FROM transactions 
-        WHERE type = 'expense' AND date >= ?
-    ''', (start_of_month,)).fetchone()['total']
+    # Calculate income and expenses for current month from the monthly rollup
+    totals = conn.execute('''
+        SELECT COALESCE(SUM(CASE WHEN type = 'income' THEN amount_total END), 0) AS income,
+               COALESCE(SUM(CASE WHEN type = 'expense' THEN abs_total END), 0) AS expenses
+        FROM monthly_category_totals
+        WHERE month >= ?
+    ''', (start_of_month[:7],)).fetchone()
+    income = round(totals['income'], 2)
+    expenses = round(totals['expenses'], 2)
     
     # Calculate savings (income - expenses)
-    savings = income - expenses
-    
-    # Get total debt (this would typically come from account balances)
-    # For now, we'll use a placeholder or sum of debt-related transactions
-    debt = 12500  # Placeholder - you'd calculate this from account balances
+    savings = round(income - expenses, 2)
     
-    # Calculate net worth (you'd typically get this from account balances)
-    net_worth = 25750  # Placeholder
-    
-    conn.close()
+    # Debt and net worth come from the incrementally maintained account balances
+    balances = conn.execute('''
+        SELECT COALESCE(SUM(balance), 0) AS net_worth,
+               COALESCE(SUM(CASE WHEN balance < 0 THEN -balance END), 0) AS debt
+        FROM accounts
+    ''').fetchone()
+    debt = round(balances['debt'], 2)
+    net_worth = round(balances['net_worth'], 2)
     
     return jsonify({
         'income': income,
@@ -435,9 +960,76 @@ def get_financial_overview():
         'net_worth': net_worth
     })
 
+@api.route('/api/analytics/time-series', methods=['GET'])
+@cached(response_cache, 'transactions')
+def get_time_series():
+    """Get income, expenses and net bucketed by day, week or month over a date range
+
+    Query parameters: start_date, end_date (default: the last 12 months),
+    granularity (day, week, month) and by_category (true to split by category).
+    """
+    granularity = request.args.get('granularity', 'month')
+    if granularity not in GRANULARITIES:
+        return jsonify({'error': f"granularity must be one of: {', '.join(GRANULARITIES)}"}), 400
+    
+    try:
+        end = datetime.strptime(request.args['end_date'], '%Y-%m-%d').date() \
+            if request.args.get('end_date') else datetime.now().date()
+        start = datetime.strptime(request.args['start_date'], '%Y-%m-%d').date() \
+            if request.args.get('start_date') else end - relativedelta(years=1) + timedelta(days=1)
+    except ValueError:
+        return jsonify({'error': 'Dates must be in YYYY-MM-DD format'}), 400
+    
+    if start > end:
+        return jsonify({'error': 'start_date must be on or before end_date'}), 400
+    
+    by_category = request.args.get('by_category', '').lower() in ('1', 'true', 'yes')
+    
+    conn = get_db_connection()
+    begin_read_snapshot(conn)
+    series = time_series(conn, start, end, granularity, by_category, archive)
+    
+    return jsonify({
+        'start_date': start.isoformat(),
+        'end_date': end.isoformat(),
+        'granularity': granularity,
+        'series': series
+    })
+
+@api.route('/api/analytics/forecast', methods=['GET'])
+@cached(response_cache, 'recurring', 'accounts')
+def get_forecast():
+    """Project balances forward from recurring transactions and account contributions
+
+    Query parameters: months (horizon, default 12, max 120) and granularity (day or month).
+    """
+    granularity = request.args.get('granularity', 'month')
+    if granularity not in ('day', 'month'):
+        return jsonify({'error': 'granularity must be day or month'}), 400
+    
+    try:
+        months = int(request.args.get('months', 12))
+    except ValueError:
+        return jsonify({'error': 'months must be an integer'}), 400
+    if not 1 <= months <= MAX_HORIZON_MONTHS:
+        return jsonify({'error': f'months must be between 1 and {MAX_HORIZON_MONTHS}'}), 400
+    
+    conn = get_db_connection()
+    return jsonify(forecast(conn, months, granularity))
+
 # ==================== BUDGET GOALS ROUTES ====================
 
-@app.route('/api/budget-goals', methods=['GET'])
+# Returned (and used for variance) until budget goals are saved
+DEFAULT_BUDGET_GOALS = {
+    'monthly_income': 5200,
+    'debt_payments': 800,
+    'savings': 1000,
+    'investments': 600,
+    'discretionary': 2800
+}
+
+@api.route('/api/budget-goals', methods=['GET'])
+@cached(response_cache, 'budget_goals')
 def get_budget_goals():
     """Get current budget goals"""
     conn = get_db_connection()
@@ -449,21 +1041,13 @@ def get_budget_goals():
         LIMIT 1
     ''').fetchone()
     
-    conn.close()
-    
     if goals:
         return jsonify(dict(goals))
     else:
         # Return default values if no goals set
-        return jsonify({
-            'monthly_income': 5200,
-            'debt_payments': 800,
-            'savings': 1000,
-            'investments': 600,
-            'discretionary': 2800
-        })
-
-@app.route('/api/budget-goals', methods=['POST'])
+        return jsonify(DEFAULT_BUDGET_GOALS)
+
+@api.route('/api/budget-goals', methods=['POST'])
 def update_budget_goals():
     """Update budget goals"""
     data = request.get_json()
@@ -482,25 +1066,152 @@ def update_budget_goals():
     
     goals_id = cursor.lastrowid
     conn.commit()
+    response_cache.invalidate('budget_goals')
     
     # Get the created budget goals
     goals = conn.execute('SELECT * FROM budget_goals WHERE id = ?', (goals_id,)).fetchone()
-    conn.close()
     
     return jsonify(dict(goals))
 
+@api.route('/api/budget-goals/variance', methods=['GET'])
+@cached(response_cache, 'transactions', 'budget_goals')
+def get_budget_variance():
+    """Get planned vs. actual per budget bucket per month
+
+    Query parameters: start_month and end_month (YYYY-MM, default: the last 6 months).
+    """
+    today = datetime.now()
+    end_month = request.args.get('end_month', today.strftime('%Y-%m'))
+    start_month = request.args.get('start_month', (today - relativedelta(months=5)).strftime('%Y-%m'))
+    
+    try:
+        start = datetime.strptime(start_month, '%Y-%m')
+        end = datetime.strptime(end_month, '%Y-%m')
+    except ValueError:
+        return jsonify({'error': 'Months must be in YYYY-MM format'}), 400
+    if start > end:
+        return jsonify({'error': 'start_month must be on or before end_month'}), 400
+    
+    conn = get_db_connection()
+    return jsonify(budget_variance(conn, start.strftime('%Y-%m'), end.strftime('%Y-%m'), DEFAULT_BUDGET_GOALS))
+
+# ==================== CATEGORIZATION RULES ROUTES ====================
+
+@api.route('/api/categorization-rules', methods=['GET'])
+@cached(response_cache, 'categorization_rules')
+def get_categorization_rules():
+    """Get all categorization rules in evaluation order"""
+    conn = get_db_connection()
+    rules = conn.execute('SELECT * FROM categorization_rules ORDER BY priority, id').fetchall()
+    
+    return jsonify([dict(row) for row in rules])
+
+@api.route('/api/categorization-rules', methods=['POST'])
+def create_categorization_rule():
+    """Create a categorization rule"""
+    values, error = validate_rule(request.get_json() or {})
+    if error:
+        return jsonify({'error': error}), 400
+    
+    conn = get_db_connection()
+    cursor = conn.execute('''
+        INSERT INTO categorization_rules
+        (name, match_type, pattern, min_amount, max_amount, transaction_type, category, priority, is_active)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', values)
+    
+    rule_id = cursor.lastrowid
+    conn.commit()
+    categorizer_cache.invalidate()
+    response_cache.invalidate('categorization_rules')
+    
+    rule = conn.execute('SELECT * FROM categorization_rules WHERE id = ?', (rule_id,)).fetchone()
+    
+    return jsonify(dict(rule)), 201
+
+@api.route('/api/categorization-rules/<int:rule_id>', methods=['PUT'])
+def update_categorization_rule(rule_id):
+    """Update a categorization rule"""
+    conn = get_db_connection()
+    
+    existing = conn.execute('SELECT * FROM categorization_rules WHERE id = ?', (rule_id,)).fetchone()
+    if not existing:
+        return jsonify({'error': 'Rule not found'}), 404
+    
+    values, error = validate_rule({**dict(existing), **(request.get_json() or {})})
+    if error:
+        return jsonify({'error': error}), 400
+    
+    conn.execute('''
+        UPDATE categorization_rules
+        SET name = ?, match_type = ?, pattern = ?, min_amount = ?, max_amount = ?,
+            transaction_type = ?, category = ?, priority = ?, is_active = ?, updated_at = CURRENT_TIMESTAMP
+        WHERE id = ?
+    ''', values + (rule_id,))
+    
+    conn.commit()
+    categorizer_cache.invalidate()
+    response_cache.invalidate('categorization_rules')
+    
+    rule = conn.execute('SELECT * FROM categorization_rules WHERE id = ?', (rule_id,)).fetchone()
+    
+    return jsonify(dict(rule))
+
+@api.route('/api/categorization-rules/<int:rule_id>', methods=['DELETE'])
+def delete_categorization_rule(rule_id):
+    """Delete a categorization rule"""
+    conn = get_db_connection()
+    
+    if not conn.execute('SELECT 1 FROM categorization_rules WHERE id = ?', (rule_id,)).fetchone():
+        return jsonify({'error': 'Rule not found'}), 404
+    
+    conn.execute('DELETE FROM categorization_rules WHERE id = ?', (rule_id,))
+    conn.commit()
+    categorizer_cache.invalidate()
+    response_cache.invalidate('categorization_rules')
+    
+    return jsonify({'message': 'Rule deleted successfully'})
+
+@api.route('/api/transactions/recategorize', methods=['POST'])
+def recategorize_transactions():
+    """Re-apply the categorization rules to existing transactions in batches
+
+    Accepts the transaction filters (start_date, end_date, category, type, q) plus
+    batch_size, use_learned (also apply learned mappings) and dry_run.
+    """
+    data = request.get_json(silent=True) or {}
+    
+    try:
+        batch_size = min(max(int(data.get('batch_size', 5000)), 1), 50000)
+    except (TypeError, ValueError):
+        return jsonify({'error': 'batch_size must be an integer'}), 400
+    
+    conn = get_db_connection()
+    
+    # Recompile so rules saved by other workers are picked up
+    categorizer_cache.invalidate()
+    where, params = build_transaction_filters(data)
+    result = recategorize(conn, categorizer_cache.get(conn), where, params, batch_size,
+                          use_learned=bool(data.get('use_learned')), dry_run=bool(data.get('dry_run')),
+                          lock=write_lock)
+    
+    if result['updated'] and not data.get('dry_run'):
+        response_cache.invalidate('transactions')
+    
+    return jsonify(result)
+
 # ==================== ACCOUNTS ROUTES ====================
 
-@app.route('/api/accounts', methods=['GET'])
+@api.route('/api/accounts', methods=['GET'])
+@cached(response_cache, 'accounts')
 def get_accounts():
     """Get all accounts"""
     conn = get_db_connection()
     accounts = conn.execute('SELECT * FROM accounts ORDER BY name').fetchall()
-    conn.close()
     
     return jsonify([dict(row) for row in accounts])
 
-@app.route('/api/accounts', methods=['POST'])
+@api.route('/api/accounts', methods=['POST'])
 def create_account():
     """Create a new account"""
     data = request.get_json()
@@ -512,42 +1223,386 @@ def create_account():
     
     conn = get_db_connection()
     
+    # The starting balance is the opening balance; linked transactions adjust it from there
     cursor = conn.execute('''
-        INSERT INTO accounts (name, type, balance, monthly_contribution)
-        VALUES (?, ?, ?, ?)
-    ''', (data['name'], data['type'], 
+        INSERT INTO accounts (name, type, balance, opening_balance, monthly_contribution)
+        VALUES (?, ?, ?, ?, ?)
+    ''', (data['name'], data['type'], data.get('balance', 0),
           data.get('balance', 0), data.get('monthly_contribution', 0)))
     
     account_id = cursor.lastrowid
     conn.commit()
+    response_cache.invalidate('accounts')
     
     # Get the created account
     account = conn.execute('SELECT * FROM accounts WHERE id = ?', (account_id,)).fetchone()
-    conn.close()
     
     return jsonify(dict(account)), 201
 
+@api.route('/api/accounts/<int:account_id>/history', methods=['GET'])
+@cached(response_cache, 'accounts')
+def get_account_history(account_id):
+    """Get the daily balance snapshots of an account, optionally within start_date/end_date"""
+    conn = get_db_connection()
+    
+    if not conn.execute('SELECT 1 FROM accounts WHERE id = ?', (account_id,)).fetchone():
+        return jsonify({'error': 'Account not found'}), 404
+    
+    history = conn.execute('''
+        SELECT date, balance FROM account_balance_history
+        WHERE account_id = ? AND date >= ? AND date <= ?
+        ORDER BY date
+    ''', (account_id, request.args.get('start_date', ''), request.args.get('end_date', '9999-12-31'))).fetchall()
+    
+    return jsonify([dict(row) for row in history])
+
+# ==================== BATCH ROUTES ====================
+
+MAX_BATCH_OPERATIONS = 10000
+
+# Columns in the order each validator returns them
+TRANSACTION_COLUMNS = ('date', 'description', 'amount', 'type', 'category', 'notes', 'account_id')
+RECURRING_COLUMNS = ('description', 'amount', 'type', 'category', 'notes', 'frequency', 'start_date',
+                     'end_date', 'is_active', 'account_id')
+ACCOUNT_COLUMNS = ('name', 'type', 'opening_balance', 'monthly_contribution')
+
+# entity -> (table, name used in errors, response cache topics, insert, update); the
+# statements take named parameters from the validated row
+BATCH_ENTITIES = {
+    'account': ('accounts', 'Account', ('accounts',), '''
+        INSERT INTO accounts (name, type, balance, opening_balance, monthly_contribution)
+        VALUES (:name, :type, :opening_balance, :opening_balance, :monthly_contribution)
+    ''', '''
+        UPDATE accounts
+        SET name = :name, type = :type, balance = balance + :opening_balance - opening_balance,
+            opening_balance = :opening_balance, monthly_contribution = :monthly_contribution,
+            updated_at = CURRENT_TIMESTAMP
+        WHERE id = :id
+    '''),
+    'transaction': ('transactions', 'Transaction', ('transactions', 'accounts'), '''
+        INSERT INTO transactions (date, description, amount, type, category, notes, account_id)
+        VALUES (:date, :description, :amount, :type, :category, :notes, :account_id)
+    ''', '''
+        UPDATE transactions
+        SET date = :date, description = :description, amount = :amount, type = :type, category = :category,
+            notes = :notes, account_id = :account_id, updated_at = CURRENT_TIMESTAMP
+        WHERE id = :id
+    '''),
+    'recurring': ('recurring_transactions', 'Recurring transaction', ('recurring',), '''
+        INSERT INTO recurring_transactions
+        (description, amount, type, category, notes, frequency, start_date,
+         end_date, next_occurrence, is_active, account_id)
+        VALUES (:description, :amount, :type, :category, :notes, :frequency, :start_date,
+                :end_date, :next_occurrence, :is_active, :account_id)
+    ''', '''
+        UPDATE recurring_transactions
+        SET description = :description, amount = :amount, type = :type, category = :category, notes = :notes,
+            frequency = :frequency, start_date = :start_date, end_date = :end_date, is_active = :is_active,
+            account_id = :account_id, updated_at = CURRENT_TIMESTAMP
+        WHERE id = :id
+    ''')
+}
+
+def validate_recurring_row(row):
+    """Validate and normalize a recurring transaction, returning (values, error)"""
+    for field in ('description', 'amount', 'type', 'category', 'frequency', 'start_date'):
+        if row.get(field) in (None, ''):
+            return None, f'Missing required field: {field}'
+    
+    dates = {}
+    for field in ('start_date', 'end_date'):
+        value = row.get(field)
+        try:
+            dates[field] = None if value in (None, '') else datetime.strptime(str(value), '%Y-%m-%d').strftime('%Y-%m-%d')
+        except ValueError:
+            return None, f'Invalid {field}: {value}'
+    
+    try:
+        amount = float(row['amount'])
+    except (TypeError, ValueError):
+        return None, f"Invalid amount: {row['amount']}"
+    
+    if row['type'] not in ('income', 'expense'):
+        return None, f"Invalid type: {row['type']}"
+    if row['frequency'] not in FREQUENCIES:
+        return None, f"Invalid frequency: {row['frequency']}"
+    
+    account_id, error = parse_account_id(row.get('account_id'))
+    if error:
+        return None, error
+    
+    return (str(row['description']), amount, row['type'], str(row['category']), row.get('notes') or '',
+            row['frequency'], dates['start_date'], dates['end_date'], 1 if row.get('is_active', True) else 0,
+            account_id), None
+
+def validate_account_row(row):
+    """Validate and normalize an account, returning (values, error)"""
+    for field in ('name', 'type'):
+        if row.get(field) in (None, ''):
+            return None, f'Missing required field: {field}'
+    
+    numbers = []
+    for field in ('opening_balance', 'monthly_contribution'):
+        try:
+            numbers.append(float(row.get(field) or 0))
+        except (TypeError, ValueError):
+            return None, f'Invalid {field}: {row[field]}'
+    
+    return (str(row['name']), str(row['type'])) + tuple(numbers), None
+
+def validate_batch_row(entity, row, categorizer):
+    """Validate one entity's row for a batch, returning (dict of columns, error)"""
+    if entity == 'transaction':
+        columns, (values, error) = TRANSACTION_COLUMNS, validate_transaction_row(row, categorizer)
+    elif entity == 'recurring':
+        columns, (values, error) = RECURRING_COLUMNS, validate_recurring_row(row)
+    else:
+        columns, (values, error) = ACCOUNT_COLUMNS, validate_account_row(row)
+    return (dict(zip(columns, values)) if values else None), error
+
+def apply_batch(conn, operations, categorizer, return_rows=False):
+    """Apply a list of create/update/delete operations all-or-nothing
+
+    Every row the batch touches is loaded with one query per entity, the operations
+    are applied to those rows in order (so later operations on a row see earlier
+    ones), and the final state is written with one grouped statement per entity and
+    action before a single commit. Returns (results, errors, topics); if there are
+    errors nothing was written.
+    """
+    results = [None] * len(operations)
+    errors = []
+    
+    def fail(index, status, error):
+        errors.append({'index': index, 'status': status, 'error': error})
+    
+    parsed = []
+    for index, operation in enumerate(operations):
+        if not isinstance(operation, dict):
+            fail(index, 400, 'Expected an object')
+            continue
+        action, entity, row_id = operation.get('op'), operation.get('entity'), operation.get('id')
+        data = operation.get('data', {})
+        if action not in ('create', 'update', 'delete'):
+            fail(index, 400, 'op must be create, update or delete')
+        elif entity not in BATCH_ENTITIES:
+            fail(index, 400, f"entity must be one of: {', '.join(BATCH_ENTITIES)}")
+        elif action != 'create' and (not isinstance(row_id, int) or isinstance(row_id, bool)):
+            fail(index, 400, f'{action} needs an integer id')
+        elif not isinstance(data, dict):
+            fail(index, 400, 'data must be an object')
+        else:
+            parsed.append((index, action, entity, row_id, data))
+    
+    # Validation and writes share one snapshot (the write lock is held already)
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        rows = {}
+        for entity, (table, _, _, _, _) in BATCH_ENTITIES.items():
+            ids = list({row_id for _, action, kind, row_id, _ in parsed if kind == entity and action != 'create'})
+            rows[entity] = {row['id']: dict(row) for row in conn.execute(
+                f"SELECT * FROM {table} WHERE id IN ({', '.join('?' * len(ids))})", ids)} if ids else {}
+        
+        # Fold the operations into each row's final state
+        creates = {entity: [] for entity in BATCH_ENTITIES}  # [(index, row)]
+        updates = {entity: {} for entity in BATCH_ENTITIES}  # id -> index of its last update
+        deletes = {entity: set() for entity in BATCH_ENTITIES}
+        for index, action, entity, row_id, data in parsed:
+            if action == 'create':
+                if entity == 'account':
+                    data = {'opening_balance': data.get('balance', 0), **data}
+                row, error = validate_batch_row(entity, data, categorizer)
+                if error:
+                    fail(index, 400, error)
+                    continue
+                if entity == 'recurring':
+                    row['next_occurrence'] = calculate_next_occurrence(row['start_date'], row['frequency'])
+                creates[entity].append((index, row))
+                results[index] = {'status': 201}
+                continue
+            
+            current = rows[entity].get(row_id)
+            if current is None:
+                if entity == 'transaction' and row_id not in deletes[entity] and archive.find(conn, row_id):
+                    fail(index, 409, 'Transaction is archived and read-only')
+                else:
+                    fail(index, 404, f'{BATCH_ENTITIES[entity][1]} not found')
+                continue
+            
+            if action == 'update':
+                if entity == 'account' and 'balance' in data:
+                    # Like a create, a balance moves the opening balance, so the ledger still adds up
+                    if 'opening_balance' in data:
+                        fail(index, 400, 'Set balance or opening_balance, not both')
+                        continue
+                    try:
+                        balance = float(data['balance'])
+                    except (TypeError, ValueError):
+                        fail(index, 400, f"Invalid balance: {data['balance']}")
+                        continue
+                    data = {**data, 'opening_balance': current['opening_balance'] + balance - current['balance']}
+                row, error = validate_batch_row(entity, {**current, **data}, categorizer)
+                if error:
+                    fail(index, 400, error)
+                    continue
+                if entity == 'account':
+                    current['balance'] += row['opening_balance'] - current['opening_balance']
+                current.update(row)
+                updates[entity][row_id] = index
+            else:
+                rows[entity][row_id] = None
+                updates[entity].pop(row_id, None)
+                deletes[entity].add(row_id)
+            results[index] = {'status': 200, 'id': row_id}
+        
+        # References to accounts must hold for the final state
+        references = [(index, row['account_id']) for entity in ('transaction', 'recurring')
+                      for index, row in creates[entity] if row['account_id'] is not None]
+        references += [(index, rows[entity][row_id]['account_id']) for entity in ('transaction', 'recurring')
+                       for row_id, index in updates[entity].items() if rows[entity][row_id]['account_id'] is not None]
+        account_ids = list({account_id for _, account_id in references})
+        known = set()
+        if account_ids:
+            known = {row[0] for row in conn.execute(
+                f"SELECT id FROM accounts WHERE id IN ({', '.join('?' * len(account_ids))})", account_ids)}
+            known -= deletes['account']
+        for index, account_id in references:
+            if account_id not in known:
+                fail(index, 400, f'Account not found: {account_id}')
+        
+        if deletes['account']:
+            # Accounts still linked to a transaction or recurring transaction can't go
+            account_ids = list(deletes['account'])
+            placeholders = ', '.join('?' * len(account_ids))
+            linked = set()
+            for entity in ('transaction', 'recurring'):
+                table = BATCH_ENTITIES[entity][0]
+                for row in conn.execute(f'SELECT id, account_id FROM {table} WHERE account_id IN ({placeholders})',
+                                        account_ids):
+                    final = rows[entity][row['id']] if row['id'] in rows[entity] else row
+                    if final is not None:
+                        linked.add(final['account_id'])
+            linked.update(account_id for (account_id,) in archive.scan(conn, {}, ['account_id'])
+                          if account_id in deletes['account'])
+            for index, action, entity, row_id, _ in parsed:
+                if entity == 'account' and action == 'delete' and row_id in linked:
+                    fail(index, 409, 'Account has linked transactions')
+        
+        if errors:
+            conn.rollback()
+            errors.sort(key=lambda error: error['index'])
+            return None, errors, ()
+        
+        # Large batches take the changed transactions out of the rollup and add their final
+        # state back with two grouped statements instead of the per-row triggers
+        changed = list(updates['transaction']) + list(deletes['transaction'])
+        with rollup_triggers_suspended(conn, len(creates['transaction']) + len(changed)) as suspended:
+            if suspended:
+                last_id = conn.execute('SELECT COALESCE(MAX(id), 0) FROM transactions').fetchone()[0]
+                if changed:
+                    add_to_rollups(conn, f"id IN ({', '.join('?' * len(changed))})", changed, sign=-1)
+            
+            # Accounts first, so rows moved off an account are gone before it is deleted
+            for entity, (table, _, _, insert, update) in BATCH_ENTITIES.items():
+                for index, row in creates[entity]:
+                    results[index]['id'] = conn.execute(insert, row).lastrowid
+                conn.executemany(update, [{**rows[entity][row_id], 'id': row_id} for row_id in updates[entity]])
+            for entity in ('transaction', 'recurring', 'account'):
+                ids = list(deletes[entity])
+                if ids:
+                    placeholders = ', '.join('?' * len(ids))
+                    conn.execute(f'DELETE FROM {BATCH_ENTITIES[entity][0]} WHERE id IN ({placeholders})', ids)
+                    if entity == 'account':
+                        conn.execute(f'DELETE FROM account_balance_history WHERE account_id IN ({placeholders})', ids)
+            
+            if suspended:
+                updated = list(updates['transaction'])
+                add_to_rollups(conn, f"id > ? OR id IN ({', '.join('?' * len(updated))})", [last_id, *updated])
+        
+        if return_rows:
+            for entity, (table, _, _, _, _) in BATCH_ENTITIES.items():
+                written = {index: results[index]['id'] for index, _ in creates[entity]}
+                written.update((index, row_id) for index, action, kind, row_id, _ in parsed
+                               if kind == entity and action == 'update' and rows[entity][row_id] is not None)
+                ids = list(set(written.values()))
+                fresh = {row['id']: dict(row) for row in conn.execute(
+                    f"SELECT * FROM {table} WHERE id IN ({', '.join('?' * len(ids))})", ids)} if ids else {}
+                for index, row_id in written.items():
+                    results[index]['row'] = fresh[row_id]
+        
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    
+    touched = {entity for _, _, entity, _, _ in parsed}
+    return results, [], {topic for entity in touched for topic in BATCH_ENTITIES[entity][2]}
+
+@api.route('/api/batch', methods=['POST'])
+def apply_batch_operations():
+    """Apply many create/update/delete operations atomically, in one database transaction
+
+    Accepts {"operations": [...], "return_rows": false}; each operation is
+    {"op": "create"|"update"|"delete", "entity": "transaction"|"recurring"|"account",
+    "id": <id for update/delete>, "data": {...}}. Updates take the changed fields only;
+    an account's balance is applied by moving its opening balance, so the ledger still
+    reconciles. Either every operation is applied or none is.
+    """
+    data = request.get_json(silent=True)
+    operations = data.get('operations') if isinstance(data, dict) else data
+    if not isinstance(operations, list) or not operations:
+        return jsonify({'error': 'Expected a non-empty list of operations'}), 400
+    if len(operations) > MAX_BATCH_OPERATIONS:
+        return jsonify({'error': f'A batch may hold at most {MAX_BATCH_OPERATIONS} operations'}), 400
+    
+    conn = get_db_connection()
+    return_rows = isinstance(data, dict) and bool(data.get('return_rows'))
+    results, errors, topics = apply_batch(conn, operations, categorizer_cache.get(conn), return_rows)
+    if errors:
+        # Report every failing operation; the status is the first one's
+        return jsonify({'error': 'No operations were applied', 'errors': errors}), errors[0]['status']
+    
+    response_cache.invalidate(*topics)
+    return jsonify({'applied': len(operations), 'results': results})
+
 # ==================== UTILITY ROUTES ====================
 
-@app.route('/api/process-recurring', methods=['POST'])
+@api.route('/api/process-recurring', methods=['POST'])
 def manual_process_recurring():
     """Manually trigger processing of recurring transactions"""
-    count = process_recurring_transactions()
-    return jsonify({'message': f'Processed {count} recurring transactions'})
+    if current_app.config['TENANTS']:
+        # Only the requesting tenant's shard; the scheduler covers every tenant
+        started = time.perf_counter()
+        count = process_recurring_transactions()
+        duration_ms = round((time.perf_counter() - started) * 1000, 3)
+    else:
+        count = recurring_scheduler.run_now()
+        duration_ms = recurring_scheduler.last_duration_ms
+    return jsonify({
+        'message': f'Processed {count} recurring transactions',
+        'duration_ms': duration_ms
+    })
 
-@app.route('/api/categories', methods=['GET'])
+@api.route('/api/process-recurring', methods=['GET'])
+def get_recurring_scheduler_stats():
+    """Get metrics for the recurring transaction scheduler"""
+    return jsonify(recurring_scheduler.stats())
+
+@api.route('/api/categories', methods=['GET'])
+@cached(response_cache, 'transactions', 'recurring', 'categorization_rules')
 def get_categories():
     """Get all unique categories from transactions"""
     conn = get_db_connection()
+    begin_read_snapshot(conn)
     categories = conn.execute('''
         SELECT DISTINCT category FROM transactions 
         UNION 
         SELECT DISTINCT category FROM recurring_transactions
+        UNION
+        SELECT DISTINCT category FROM categorization_rules
         ORDER BY category
     ''').fetchall()
-    conn.close()
     
-    category_list = [row['category'] for row in categories]
+    category_list = [row['category'] for row in categories] + list(archive.categories(conn))
     
     # Add default categories if none exist
     default_categories = ['Groceries', 'Housing', 'Transportation', 'Dining Out', 
@@ -559,89 +1614,390 @@ def get_categories():
     
     return jsonify(all_categories)
 
+@api.route('/api/pool-stats', methods=['GET'])
+def get_pool_stats():
+    """Get database connection pool and write lock statistics"""
+    stats = {**db_pool.stats(), 'write_lock': write_lock.stats()}
+    if current_app.config['TENANTS']:
+        stats['shards'] = shards.stats()
+    return jsonify(stats)
+
+@api.route('/api/cache-stats', methods=['GET'])
+def get_cache_stats():
+    """Get response cache statistics"""
+    return jsonify(response_cache.stats())
+
+def metric_samples(state):
+    """This process's pool, write lock, cache and scheduler samples for Metrics.render()"""
+    pool = state['db_pool'].stats()
+    lock = state['write_lock'].stats()
+    cache = state['response_cache'].stats()
+    scheduler = state['recurring_scheduler'].stats()
+    return [
+        ('finance_tracker_db_connections_opened_total', 'counter', 'Database connections opened by the pool', pool['misses']),
+        ('finance_tracker_db_connections_open', 'gauge', 'Open pooled database connections', pool['open_connections']),
+        ('finance_tracker_db_connections_in_use', 'gauge', 'Pooled connections checked out', pool['in_use_connections']),
+        ('finance_tracker_db_pool_waits_total', 'counter', 'Acquisitions that waited for a connection', pool['waits']),
+        ('finance_tracker_db_pool_timeouts_total', 'counter', 'Acquisitions that timed out', pool['timeouts']),
+        ('finance_tracker_write_lock_acquisitions_total', 'counter', 'Write lock acquisitions', lock['acquisitions']),
+        ('finance_tracker_write_lock_wait_seconds_total', 'counter', 'Time spent waiting for the write lock',
+         lock['total_wait_ms'] / 1000),
+        ('finance_tracker_response_cache_hits_total', 'counter', 'Response cache hits', cache['hits']),
+        ('finance_tracker_response_cache_misses_total', 'counter', 'Response cache misses', cache['misses']),
+        ('finance_tracker_response_cache_entries', 'gauge', 'Cached responses', cache['entries']),
+        ('finance_tracker_recurring_passes_total', 'counter', 'Recurring materialization passes', scheduler['total_passes']),
+        ('finance_tracker_recurring_rows_total', 'counter', 'Recurring transactions materialized', scheduler['total_rows'])
+    ]
+
+@api.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Expose request, SQL, pool, cache and scheduler metrics in the Prometheus text format
+
+    With METRICS_DIRECTORY set the values are the totals of every worker process.
+    """
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+# ==================== ADMIN ROUTES ====================
+
+def is_admin_request():
+    token = current_app.config['ADMIN_TOKEN']
+    scheme, _, credentials = request.headers.get('Authorization', '').partition(' ')
+    return bool(token) and scheme.lower() == 'bearer' and hmac.compare_digest(credentials.strip(), token)
+
+@api.route('/api/admin/tenants', methods=['GET'])
+def get_tenant_aggregates():
+    """Get per-tenant and overall totals across every shard (multi-tenant mode)"""
+    if not current_app.config['TENANTS']:
+        return jsonify({'error': 'Multi-tenant mode is not enabled'}), 404
+    if not is_admin_request():
+        return jsonify({'error': 'Admin token required'}), 403
+    
+    started = time.perf_counter()
+    tenants, totals = shards.aggregate()
+    return jsonify({
+        'tenants': tenants,
+        'totals': totals,
+        'duration_ms': round((time.perf_counter() - started) * 1000, 3)
+    })
+
+# ==================== CLI COMMANDS ====================
+
+tenant_option = click.option('--tenant', 'tenant_id', help='Only this tenant (multi-tenant mode; default: every tenant)')
+
+def each_database(tenant_id=None):
+    """Yield once per database a CLI command acts on: the tenant id (with g.shard set) or None
+
+    In multi-tenant mode that is every shard on disk, or just tenant_id's (created if
+    it doesn't exist yet); otherwise the single database.
+    """
+    if not current_app.config['TENANTS']:
+        if tenant_id:
+            raise click.UsageError('--tenant needs multi-tenant mode (FINANCE_TRACKER_TENANTS=1)')
+        yield None
+        return
+    for current in [tenant_id] if tenant_id else shards.tenant_ids():
+        try:
+            g.shard = shards.acquire(current)
+        except TenantError as e:
+            raise click.BadParameter(str(e), param_hint='--tenant')
+        try:
+            yield current
+        finally:
+            shards.release(g.pop('shard'))
+
+def tenant_prefix(tenant_id):
+    return f"{tenant_id}: " if tenant_id else ""
+
+@api.cli.command('check-query-plans')
+@tenant_option
+def check_query_plans_command(tenant_id):
+    """Verify via EXPLAIN QUERY PLAN that every route query uses an index"""
+    failed = False
+    for current in each_database(tenant_id):
+        with db_pool.connection() as conn:
+            problems = check_query_plans(conn)
+        for name, plan in problems:
+            print(f"{tenant_prefix(current)}{name}: {' | '.join(plan)}")
+        if not problems:
+            print(f"{tenant_prefix(current)}All route queries use an index")
+        failed = failed or bool(problems)
+    if failed:
+        raise SystemExit(1)
+
+@api.cli.command('rebuild-rollups')
+@tenant_option
+def rebuild_rollups_command(tenant_id):
+    """Recompute the monthly category rollup from the transactions table and archive"""
+    for current in each_database(tenant_id):
+        with write_lock.held(), db_pool.connection() as conn:
+            count = rebuild_rollups(conn, archive.monthly_totals(conn))
+        response_cache.invalidate('transactions')
+        print(f"{tenant_prefix(current)}Rebuilt monthly rollup ({count} rows)")
+
+@api.cli.command('check-rollups')
+@tenant_option
+def check_rollups_command(tenant_id):
+    """Compare the monthly category rollup against the raw and archived transactions"""
+    failed = False
+    for current in each_database(tenant_id):
+        with db_pool.connection() as conn:
+            mismatches = check_rollups(conn, archive.monthly_totals(conn))
+        for mismatch in mismatches:
+            print(json.dumps({'tenant_id': current, **mismatch} if current else mismatch))
+        if not mismatches:
+            print(f"{tenant_prefix(current)}Monthly rollup is consistent with transactions")
+        failed = failed or bool(mismatches)
+    if failed:
+        raise SystemExit(1)
+
+@api.cli.command('reconcile-accounts')
+@click.option('--fix', is_flag=True, help='Correct mismatched balances')
+@tenant_option
+def reconcile_accounts_command(fix, tenant_id):
+    """Verify account balances against their opening balance plus linked transactions"""
+    failed = False
+    for current in each_database(tenant_id):
+        with write_lock.held(), db_pool.connection() as conn:
+            mismatches = reconcile_accounts(conn, fix=fix)
+        for mismatch in mismatches:
+            print(json.dumps({'tenant_id': current, **mismatch} if current else mismatch))
+        if mismatches and fix:
+            response_cache.invalidate('accounts')
+        print(tenant_prefix(current) + ("Fixed account balances" if mismatches and fix else
+                                        "Account balances do not match the ledger" if mismatches else
+                                        "Account balances match the ledger"))
+        failed = failed or (bool(mismatches) and not fix)
+    if failed:
+        raise SystemExit(1)
+
+@api.cli.command('seed')
+@tenant_option
+def seed_command(tenant_id):
+    """Insert sample transactions, recurring rules and accounts into an empty database"""
+    for current in each_database(tenant_id):
+        with write_lock.held(), db_pool.connection() as conn:
+            inserted = seed_sample_data(conn)
+        print(tenant_prefix(current) + ("Sample data inserted successfully!" if inserted
+                                        else "Database already has transactions; not seeding"))
+
+@api.cli.command('archive-transactions')
+@click.option('--older-than-years', type=int, help='Archive years more than this many years old '
+                                                   '(default: ARCHIVE_OLDER_THAN_YEARS)')
+@click.option('--vacuum', is_flag=True, help='Return the freed pages to the filesystem afterwards')
+@tenant_option
+def archive_transactions_command(older_than_years, vacuum, tenant_id):
+    """Move old years of transactions into compressed, read-only archive files"""
+    if older_than_years is None:
+        older_than_years = current_app.config['ARCHIVE_OLDER_THAN_YEARS']
+    if older_than_years < 1:
+        raise click.BadParameter('must be at least 1', param_hint='--older-than-years')
+    before_year = default_before_year(older_than_years)
+    
+    for current in each_database(tenant_id):
+        try:
+            with write_lock.held(), db_pool.connection() as conn:
+                summary = archive_transactions(conn, archive, before_year)
+                if vacuum and summary['rows']:
+                    conn.execute('VACUUM')
+        except ValueError as e:
+            raise click.UsageError(str(e))
+        response_cache.invalidate('transactions', 'accounts')
+        print(json.dumps({'tenant_id': current, **summary} if current else summary))
+
+@api.cli.command('serve-events')
+@click.option('--host', help='Interface to listen on (default: EVENTS_HOST)')
+@click.option('--port', type=int, help='Port to listen on (default: EVENTS_PORT)')
+def serve_events_command(host, port):
+    """Serve the /api/events push channel (run it next to gunicorn in production)"""
+    if current_app.config['TENANTS']:
+        raise click.UsageError('The event server only supports single-database mode')
+    event_server.host = host or event_server.host
+    event_server.port = port or event_server.port
+    print(f"Serving change notifications on http://{event_server.host}:{event_server.port}/api/events")
+    try:
+        event_server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+@api.cli.command('issue-tenant-token')
+@click.argument('tenant_id')
+def issue_tenant_token_command(tenant_id):
+    """Print a bearer token that authenticates requests as TENANT_ID"""
+    if not current_app.config['TENANT_SECRET']:
+        raise click.UsageError('Set FINANCE_TRACKER_TENANT_SECRET to issue tenant tokens')
+    try:
+        print(issue_token(current_app.config['TENANT_SECRET'], tenant_id))
+    except TenantError as e:
+        raise click.BadParameter(str(e))
+
+@api.cli.command('tenant-stats')
+def tenant_stats_command():
+    """Print per-tenant and overall totals across every shard"""
+    if not current_app.config['TENANTS']:
+        raise click.UsageError('Multi-tenant mode is not enabled (FINANCE_TRACKER_TENANTS=1)')
+    tenants, totals = shards.aggregate()
+    for tenant in tenants:
+        print(json.dumps(tenant))
+    print(json.dumps({'totals': totals}))
+
 # ==================== ERROR HANDLERS ====================
 
-@app.errorhandler(400)
+@api.app_errorhandler(400)
 def bad_request(error):
     return jsonify({'error': 'Bad request'}), 400
 
-@app.errorhandler(404)
+@api.app_errorhandler(404)
 def not_found(error):
     return jsonify({'error': 'Not found'}), 404
 
-@app.errorhandler(500)
+@api.app_errorhandler(500)
 def internal_error(error):
     return jsonify({'error': 'Internal server error'}), 500
 
+# ==================== APPLICATION FACTORY ====================
+
+def create_app(config=None):
+    """Create the Flask application, applying pending migrations to its database
+
+    config overrides the defaults above, e.g. {'DATABASE': ':memory:'} for tests.
+    Sample data is not inserted; run the seed command for that.
+    """
+    app = Flask(__name__)
+    app.config.from_mapping(
+        DATABASE=os.environ.get('FINANCE_TRACKER_DATABASE', DATABASE),
+        DATABASE_POOL_SIZE=DATABASE_POOL_SIZE,
+        RESPONSE_CACHE_SIZE=RESPONSE_CACHE_SIZE,
+        RESPONSE_CACHE_TTL=RESPONSE_CACHE_TTL,
+        CATEGORIZER_TTL=CATEGORIZER_TTL,
+        RECURRING_SCHEDULER_INTERVAL=RECURRING_SCHEDULER_INTERVAL,
+        INSTRUMENTATION=os.environ.get('FINANCE_TRACKER_INSTRUMENTATION', '').lower() in ('1', 'true', 'yes')
+                        or INSTRUMENTATION,
+        SLOW_QUERY_MS=float(os.environ.get('FINANCE_TRACKER_SLOW_QUERY_MS', SLOW_QUERY_MS)),
+        METRICS_DIRECTORY=os.environ.get('FINANCE_TRACKER_METRICS_DIRECTORY', METRICS_DIRECTORY),
+        EVENTS_HOST=os.environ.get('FINANCE_TRACKER_EVENTS_HOST', EVENTS_HOST),
+        EVENTS_PORT=int(os.environ.get('FINANCE_TRACKER_EVENTS_PORT', EVENTS_PORT)),
+        EVENTS_POLL_INTERVAL=EVENTS_POLL_INTERVAL,
+        EVENTS_MAX_CLIENTS=EVENTS_MAX_CLIENTS,
+        TENANTS=os.environ.get('FINANCE_TRACKER_TENANTS', '').lower() in ('1', 'true', 'yes') or TENANTS,
+        TENANT_DIRECTORY=os.environ.get('FINANCE_TRACKER_TENANT_DIRECTORY', TENANT_DIRECTORY),
+        MAX_OPEN_SHARDS=int(os.environ.get('FINANCE_TRACKER_MAX_OPEN_SHARDS', MAX_OPEN_SHARDS)),
+        SHARD_POOL_SIZE=SHARD_POOL_SIZE,
+        SHARD_CACHE_SIZE=SHARD_CACHE_SIZE,
+        TENANT_SECRET=os.environ.get('FINANCE_TRACKER_TENANT_SECRET', TENANT_SECRET),
+        TENANT_HEADER=os.environ.get('FINANCE_TRACKER_TENANT_HEADER', TENANT_HEADER),
+        ADMIN_TOKEN=os.environ.get('FINANCE_TRACKER_ADMIN_TOKEN', ADMIN_TOKEN),
+        AGGREGATE_PROCESSES=AGGREGATE_PROCESSES,
+        ARCHIVE_DIRECTORY=os.environ.get('FINANCE_TRACKER_ARCHIVE_DIRECTORY', ARCHIVE_DIRECTORY),
+        ARCHIVE_OLDER_THAN_YEARS=ARCHIVE_OLDER_THAN_YEARS
+    )
+    app.config.update(config or {})
+    if app.config['TENANTS'] and not (app.config['TENANT_SECRET'] or app.config['TENANT_HEADER']):
+        raise ValueError('Multi-tenant mode needs TENANT_SECRET or TENANT_HEADER to identify tenants')
+    CORS(app)  # Enable CORS for frontend communication
+    
+    def process_recurring():
+        # Runs on the scheduler thread, outside any request
+        with app.app_context():
+            router = app.extensions['finance_tracker']['shards']
+            if router is None:
+                return process_recurring_transactions()
+            count = 0
+            for tenant_id in router.tenant_ids():
+                g.shard = router.acquire(tenant_id)
+                try:
+                    count += process_recurring_transactions()
+                finally:
+                    router.release(g.pop('shard'))
+            return count
+    
+    database = app.config['DATABASE']
+    pool = ConnectionPool(database, max_connections=app.config['DATABASE_POOL_SIZE'])
+    app.extensions['finance_tracker'] = {
+        'db_pool': pool,
+        'write_lock': WriteLock(None if database == ':memory:' else database + '.write-lock'),
+        'response_cache': ResponseCache(max_entries=app.config['RESPONSE_CACHE_SIZE'],
+                                        ttl=app.config['RESPONSE_CACHE_TTL'], version_source=response_cache_versions),
+        'categorizer_cache': CategorizerCache(ttl=app.config['CATEGORIZER_TTL']),
+        # Compressed files holding the years moved out by archive-transactions
+        'archive': Archive(None if database == ':memory:'
+                           else app.config['ARCHIVE_DIRECTORY'] or database + '.archive'),
+        # Materialization runs off the request path; reads never write
+        'recurring_scheduler': RecurringScheduler(process_recurring,
+                                                  interval=app.config['RECURRING_SCHEDULER_INTERVAL']),
+        # Shared with the other workers once started (see gunicorn.conf.py)
+        'metrics': Metrics(slow_query_ms=app.config['SLOW_QUERY_MS'], directory=app.config['METRICS_DIRECTORY'],
+                           samples=lambda: metric_samples(app.extensions['finance_tracker'])),
+        # Pushes change notifications; not started here (see __main__ and serve-events)
+        'event_server': EventServer(pool, host=app.config['EVENTS_HOST'], port=app.config['EVENTS_PORT'],
+                                    poll_interval=app.config['EVENTS_POLL_INTERVAL'],
+                                    max_clients=app.config['EVENTS_MAX_CLIENTS']),
+        # Tenant shards (multi-tenant mode), each with its own pool, write lock and caches
+        'shards': ShardRouter(app.config['TENANT_DIRECTORY'], max_open=app.config['MAX_OPEN_SHARDS'],
+                              on_open=init_database, aggregate_processes=app.config['AGGREGATE_PROCESSES'],
+                              pool_size=app.config['SHARD_POOL_SIZE'], cache_size=app.config['SHARD_CACHE_SIZE'],
+                              cache_ttl=app.config['RESPONSE_CACHE_TTL'],
+                              categorizer_ttl=app.config['CATEGORIZER_TTL'], cache_versions=response_cache_versions)
+                  if app.config['TENANTS'] else None
+    }
+    
+    if app.config['INSTRUMENTATION']:
+        # Registered before the blueprint's hooks so the timing covers them too
+        app.before_request(start_request_profile)
+        app.after_request(finish_request_profile)
+    
+    app.register_blueprint(api)
+    app.teardown_appcontext(release_db_connection)
+    
+    # Schema setup happens once here, not per request; it only reads schema_version
+    # when there is nothing to migrate, so startup doesn't depend on the database size.
+    # In multi-tenant mode DATABASE is unused; each shard is migrated when it is opened
+    if not app.config['TENANTS']:
+        with app.app_context():
+            init_database()
+    
+    return app
+
 # ==================== MAIN ====================
 
 if __name__ == '__main__':
-    # Initialize database on startup
-    init_database()
+    app = create_app()
     
-    # Insert some sample data if database is empty
-    conn = get_db_connection()
-    transaction_count = conn.execute('SELECT COUNT(*) as count FROM transactions').fetchone()['count']
-    
-    if transaction_count == 0:
-        # Insert sample transactions
-        sample_transactions = [
-            ('2025-07-29', 'Salary Deposit', 2600, 'income', 'Salary', 'Bi-weekly paycheck'),
-            ('2025-07-28', 'Grocery Store', -85.50, 'expense', 'Groceries', ''),
-            ('2025-07-27', 'Gas Station', -45.00, 'expense', 'Transportation', ''),
-            ('2025-07-26', 'Restaurant', -67.80, 'expense', 'Dining Out', 'Dinner with friends'),
-            ('2025-07-25', 'Netflix Subscription', -15.99, 'expense', 'Entertainment', ''),
-            ('2025-07-24', 'Rent Payment', -1200, 'expense', 'Housing', 'Monthly rent'),
-            ('2025-07-23', 'Freelance Work', 500, 'income', 'Freelance', 'Web design project')
-        ]
-        
-        for transaction in sample_transactions:
-            conn.execute('''
-                INSERT INTO transactions (date, description, amount, type, category, notes)
-                VALUES (?, ?, ?, ?, ?, ?)
-            ''', transaction)
-        
-        # Insert sample recurring transactions
-        sample_recurring = [
-            ('Salary', 2600, 'income', 'Salary', 'Bi-weekly paycheck', 'biweekly', '2025-07-29', None, '2025-08-12', 1),
-            ('Rent', -1200, 'expense', 'Housing', 'Monthly rent payment', 'monthly', '2025-08-01', None, '2025-08-01', 1),
-            ('Netflix', -15.99, 'expense', 'Entertainment', 'Streaming subscription', 'monthly', '2025-08-01', None, '2025-08-01', 1)
-        ]
-        
-        for recurring in sample_recurring:
-            conn.execute('''
-                INSERT INTO recurring_transactions 
-                (description, amount, type, category, notes, frequency, start_date, end_date, next_occurrence, is_active)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', recurring)
-        
-        # Insert sample accounts
-        sample_accounts = [
-            ('TFSA', 'Tax-Free Savings', 15000, 500),
-            ('RRSP', 'Retirement Savings', 25000, 800),
-            ('FHSA', 'First Home Savings', 8000, 300),
-            ('Emergency Fund', 'Savings', 5000, 200)
-        ]
-        
-        for account in sample_accounts:
-            conn.execute('''
-                INSERT INTO accounts (name, type, balance, monthly_contribution)
-                VALUES (?, ?, ?, ?)
-            ''', account)
-        
-        conn.commit()
-        print("Sample data inserted successfully!")
+    debug = True
     
-    conn.close()
+    # Start the recurring scheduler and the event server (only in the serving process when
+    # the reloader is active)
+    if not debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        app.extensions['finance_tracker']['recurring_scheduler'].start()
+        if not app.config['TENANTS']:
+            app.extensions['finance_tracker']['event_server'].start()
     
     print("Finance Tracker API starting...")
     print("Available endpoints:")
     print("- GET/POST /api/transactions")
     print("- PUT/DELETE /api/transactions/<id>")
+    print("- GET /api/transactions/export")
+    print("- POST /api/transactions/bulk")
     print("- GET/POST /api/recurring-transactions")
+    print("- POST /api/batch")
+    print("- GET /api/changes?since=<seq>")
+    print(f"- GET /api/events (server-sent events on port {app.config['EVENTS_PORT']})")
     print("- GET /api/analytics/spending-by-category")
     print("- GET /api/analytics/financial-overview")
+    print("- GET /api/analytics/time-series")
+    print("- GET /api/analytics/forecast")
     print("- GET/POST /api/budget-goals")
+    print("- GET /api/budget-goals/variance")
+    print("- GET/POST /api/categorization-rules")
+    print("- PUT/DELETE /api/categorization-rules/<id>")
+    print("- POST /api/transactions/recategorize")
     print("- GET/POST /api/accounts")
-    
-    app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
+    print("- GET /api/accounts/<id>/history")
+    print("- GET/POST /api/process-recurring")
+    print("- GET /api/pool-stats")
+    print("- GET /api/cache-stats")
+    print("- GET /metrics")
+    if app.config['TENANTS']:
+        print(f"Multi-tenant mode: shards in {app.config['TENANT_DIRECTORY']}/")
+        print("- GET /api/admin/tenants")
+    
+    app.run(debug=debug, host='0.0.0.0', port=5000)
\ No newline at end of file
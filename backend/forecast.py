@@ -0,0 +1,81 @@
+"""Cash-flow forecast built from recurring rules and account contributions"""
+from bisect import bisect_left
+from datetime import date, timedelta
+
+from dateutil.relativedelta import relativedelta
+
+from recurrence import occurrence_dates
+
+MAX_HORIZON_MONTHS = 120
+
+
+def forecast(conn, months=12, granularity='month', today=None):
+    """Project balances forward over the next `months` months
+
+    The starting balance is the sum of accounts.balance. Each period adds the net of
+    every active recurring rule occurring in it (income positive, expenses negative)
+    and each account's monthly_contribution on the first of every month. Each rule's
+    occurrences are expanded in one call and folded into per-period totals, so memory
+    grows with the number of periods rather than the total number of occurrences.
+    """
+    today = today or date.today()
+    horizon_end = today + relativedelta(months=months)
+
+    monthly = granularity == 'month'
+
+    income = {}
+    expenses = {}
+
+    rules = conn.execute('''
+        SELECT amount, type, frequency, next_occurrence, end_date
+        FROM recurring_transactions
+        WHERE is_active = 1 AND next_occurrence <= ?
+        AND (end_date IS NULL OR end_date = '' OR end_date >= ?)
+    ''', (horizon_end.isoformat(), today.isoformat()))
+
+    for rule in rules:
+        until = horizon_end
+        if rule['end_date']:
+            until = min(until, date.fromisoformat(rule['end_date']))
+        totals = income if rule['type'] == 'income' else expenses
+        amount = abs(rule['amount'])
+        dates, _ = occurrence_dates(date.fromisoformat(rule['next_occurrence']), rule['frequency'], until)
+        for day in dates[bisect_left(dates, today):]:
+            key = (day.year, day.month) if monthly else day
+            totals[key] = totals.get(key, 0) + amount
+
+    accounts = conn.execute('''
+        SELECT COALESCE(SUM(balance), 0) AS balance, COALESCE(SUM(monthly_contribution), 0) AS contribution
+        FROM accounts
+    ''').fetchone()
+    balance = accounts['balance']
+    monthly_contribution = accounts['contribution']
+
+    series = []
+    current = today
+    step = relativedelta(months=1) if monthly else timedelta(days=1)
+    if monthly:
+        current = today.replace(day=1)
+    while current <= horizon_end:
+        key = (current.year, current.month) if monthly else current
+        # Contributions land on the first of each month (the current month's is already in the balance)
+        contribution = monthly_contribution if current.day == 1 and current > today else 0
+        period_income = income.get(key, 0)
+        period_expenses = expenses.get(key, 0)
+        balance += period_income - period_expenses + contribution
+        series.append({
+            'period': current.strftime('%Y-%m') if monthly else current.isoformat(),
+            'income': round(period_income, 2),
+            'expenses': round(period_expenses, 2),
+            'contributions': round(contribution, 2),
+            'balance': round(balance, 2)
+        })
+        current = current + step
+
+    return {
+        'start_date': today.isoformat(),
+        'end_date': horizon_end.isoformat(),
+        'granularity': granularity,
+        'starting_balance': round(accounts['balance'], 2),
+        'series': series
+    }
@@ -0,0 +1,79 @@
+"""Gunicorn settings for serving the API in production
+
+    cd backend
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+Every setting can be overridden with the environment variables below (or on the
+command line, e.g. --workers 4).
+"""
+import glob
+import multiprocessing
+import os
+import tempfile
+
+bind = os.environ.get('FINANCE_TRACKER_BIND', '0.0.0.0:5000')
+
+# Threaded workers: SQLite reads run concurrently under WAL and release the GIL, while
+# writes are queued by the app's WriteLock across all workers
+worker_class = 'gthread'
+workers = int(os.environ.get('FINANCE_TRACKER_WORKERS', min(multiprocessing.cpu_count(), 4)))
+threads = int(os.environ.get('FINANCE_TRACKER_THREADS', 4))
+
+# Requests running longer than this get their worker restarted; on SIGTERM workers get
+# graceful_timeout seconds to finish in-flight requests
+timeout = int(os.environ.get('FINANCE_TRACKER_TIMEOUT', 60))
+graceful_timeout = int(os.environ.get('FINANCE_TRACKER_GRACEFUL_TIMEOUT', 30))
+keepalive = 5
+
+# Recycle workers now and then to bound memory growth (jitter avoids restarting all at once)
+max_requests = int(os.environ.get('FINANCE_TRACKER_MAX_REQUESTS', 10000))
+max_requests_jitter = max_requests // 10
+
+# Load the app (and run migrations) once in the master before forking
+preload_app = True
+
+# Workers share their metrics through this directory so /metrics, answered by whichever
+# worker gets the scrape, reports the totals of all of them. The default is per master
+# process (set here, before the app is loaded); snapshots are cleared on start and exit
+metrics_directory = os.environ.setdefault(
+    'FINANCE_TRACKER_METRICS_DIRECTORY',
+    os.path.join(tempfile.gettempdir(), f'finance-tracker-metrics-{os.getpid()}'))
+
+accesslog = os.environ.get('FINANCE_TRACKER_ACCESS_LOG', '-') or None  # Empty disables it
+loglevel = os.environ.get('FINANCE_TRACKER_LOG_LEVEL', 'info')
+
+
+def clear_metrics_snapshots():
+    for path in glob.glob(os.path.join(metrics_directory, 'metrics-*.json*')):
+        os.remove(path)
+
+
+def on_starting(server):
+    # Counters of a previous run's workers would be added to this run's
+    clear_metrics_snapshots()
+
+
+def post_fork(server, worker):
+    # Each worker runs the recurring scheduler; passes are serialized by the write lock
+    # and find nothing to do once one worker has materialized the due occurrences
+    from wsgi import app
+    app.extensions['finance_tracker']['recurring_scheduler'].start()
+    app.extensions['finance_tracker']['metrics'].start()
+
+
+def worker_exit(server, worker):
+    from wsgi import app
+    state = app.extensions['finance_tracker']
+    state['recurring_scheduler'].stop(timeout=graceful_timeout)
+    state['metrics'].stop()
+    state['db_pool'].close_all()
+    if state['shards'] is not None:
+        state['shards'].close()
+
+
+def on_exit(server):
+    clear_metrics_snapshots()
+    try:
+        os.rmdir(metrics_directory)
+    except OSError:  # Missing, or holding other files
+        pass
@@ -0,0 +1,60 @@
+"""Parsers turning uploaded bank statements into transaction dicts"""
+import csv
+import io
+import re
+from datetime import datetime
+
+_OFX_TRANSACTION_START = re.compile(r'<STMTTRN>', re.I)
+_OFX_TRANSACTION_END = re.compile(r'</STMTTRN>|</BANKTRANLIST>', re.I)
+_OFX_FIELD = re.compile(r'<(\w+)>([^<\r\n]*)')
+
+
+def parse_csv(text):
+    """Parse CSV with a header row into a list of dicts keyed by the lower-cased column names"""
+    reader = csv.DictReader(io.StringIO(text))
+    rows = []
+    for row in reader:
+        # Extra values beyond the header end up under the None key; ignore them
+        rows.append({key.strip().lower(): (value or '').strip() for key, value in row.items() if key is not None})
+    return rows
+
+
+def parse_ofx(text, default_category='Other'):
+    """Parse the STMTTRN entries of an OFX (SGML or XML) statement into transaction dicts"""
+    rows = []
+    # SGML OFX doesn't require closing tags, so each block runs to the next <STMTTRN>
+    for block in _OFX_TRANSACTION_START.split(text)[1:]:
+        block = _OFX_TRANSACTION_END.split(block, 1)[0]
+        fields = {name.upper(): value.strip() for name, value in _OFX_FIELD.findall(block)}
+        row = {'category': default_category}
+
+        posted = fields.get('DTPOSTED', '')
+        if len(posted) >= 8:
+            try:
+                row['date'] = datetime.strptime(posted[:8], '%Y%m%d').strftime('%Y-%m-%d')
+            except ValueError:
+                pass
+
+        if 'TRNAMT' in fields:
+            row['amount'] = fields['TRNAMT']
+            try:
+                row['type'] = 'expense' if float(fields['TRNAMT']) < 0 else 'income'
+            except ValueError:
+                pass
+
+        description = fields.get('NAME') or fields.get('PAYEE') or fields.get('MEMO')
+        if description:
+            row['description'] = description
+        if fields.get('MEMO') and fields.get('MEMO') != description:
+            row['notes'] = fields['MEMO']
+
+        rows.append(row)
+    return rows
+
+
+def parse_upload(filename, text, default_category='Other'):
+    """Parse an uploaded statement, choosing the parser from the file name or contents"""
+    name = (filename or '').lower()
+    if name.endswith(('.ofx', '.qfx')) or '<OFX>' in text[:4096].upper():
+        return parse_ofx(text, default_category)
+    return parse_csv(text)
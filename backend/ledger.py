@@ -0,0 +1,37 @@
+"""Account balance reconciliation
+
+accounts.balance is maintained incrementally by triggers (see migration 4): every
+insert, update or delete of a transaction linked to an account adjusts that account's
+balance, and every balance change is snapshotted into account_balance_history.
+"""
+
+LEDGER_SQL = '''
+    SELECT a.id, a.name, a.balance, a.opening_balance + COALESCE(SUM(
+        CASE WHEN t.type = 'income' THEN ABS(t.amount) ELSE -ABS(t.amount) END), 0) AS expected
+    FROM accounts a
+    LEFT JOIN transactions t ON t.account_id = a.id
+    GROUP BY a.id
+'''
+
+
+def reconcile_accounts(conn, fix=False, tolerance=0.005):
+    """Compare each account's balance with opening_balance plus its ledger
+
+    Returns the mismatched accounts; with fix=True their balances are corrected.
+    """
+    mismatches = []
+    for row in conn.execute(LEDGER_SQL).fetchall():
+        if abs(row['balance'] - row['expected']) > tolerance:
+            mismatches.append({
+                'account_id': row['id'],
+                'name': row['name'],
+                'balance': row['balance'],
+                'expected': round(row['expected'], 2)
+            })
+
+    if fix and mismatches:
+        conn.executemany('UPDATE accounts SET balance = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?',
+                         [(m['expected'], m['account_id']) for m in mismatches])
+        conn.commit()
+
+    return mismatches
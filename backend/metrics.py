@@ -0,0 +1,385 @@
+"""Opt-in request profiling and SQL timing instrumentation
+
+With instrumentation enabled every request's database connection is wrapped in an
+InstrumentedConnection, which records each statement's time (execute plus fetching),
+rows returned and SQLite VM steps. The per-request RequestProfile feeds per-route
+histograms in Metrics (rendered in the Prometheus text format, merged across the
+Gunicorn workers when they share a metrics directory), a Server-Timing header and the
+slow-query log.
+"""
+import json
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+from bisect import bisect_left
+
+logger = logging.getLogger(__name__)
+slow_query_logger = logging.getLogger('finance_tracker.slow_queries')
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# The progress handler fires every this many SQLite VM instructions
+VM_STEP_GRANULARITY = 1000
+
+_WHITESPACE = re.compile(r'\s+')
+
+
+class QueryRecord:
+    """Timing and row counts of one executed statement"""
+
+    __slots__ = ('sql', 'params', 'duration', 'rows', 'vm_steps')
+
+    def __init__(self, sql, params):
+        self.sql = _WHITESPACE.sub(' ', sql).strip()
+        self.params = params
+        self.duration = 0.0
+        self.rows = 0
+        self.vm_steps = 0
+
+
+class RequestProfile:
+    """The statements run while serving one request"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = []
+        self.vm_steps = 0  # Incremented by the connection's progress handler
+
+    def progress(self):
+        self.vm_steps += VM_STEP_GRANULARITY
+        return 0  # Non-zero would abort the statement
+
+    @property
+    def db_duration(self):
+        return sum(query.duration for query in self.queries)
+
+    def server_timing(self, total):
+        """Return a Server-Timing header value for this request"""
+        rows = sum(query.rows for query in self.queries)
+        return (f'db;desc="{len(self.queries)} queries, {rows} rows";dur={self.db_duration * 1000:.2f}, '
+                f'total;dur={total * 1000:.2f}')
+
+
+class InstrumentedCursor:
+    """Cursor wrapper adding fetch time and row counts to its QueryRecord"""
+
+    def __init__(self, cursor, record, profile):
+        self._cursor = cursor
+        self._record = record
+        self._profile = profile
+
+    def _timed(self, fetch, *args):
+        steps = self._profile.vm_steps
+        started = time.perf_counter()
+        try:
+            return fetch(*args)
+        finally:
+            self._record.duration += time.perf_counter() - started
+            self._record.vm_steps += self._profile.vm_steps - steps
+
+    def fetchone(self):
+        row = self._timed(self._cursor.fetchone)
+        if row is not None:
+            self._record.rows += 1
+        return row
+
+    def fetchmany(self, size=None):
+        rows = self._timed(self._cursor.fetchmany, size or self._cursor.arraysize)
+        self._record.rows += len(rows)
+        return rows
+
+    def fetchall(self):
+        rows = self._timed(self._cursor.fetchall)
+        self._record.rows += len(rows)
+        return rows
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        row = self._timed(next, self._cursor)
+        self._record.rows += 1
+        return row
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class InstrumentedConnection:
+    """Connection wrapper recording every statement into a RequestProfile"""
+
+    def __init__(self, conn, profile):
+        self.raw = conn
+        self._profile = profile
+        conn.set_progress_handler(profile.progress, VM_STEP_GRANULARITY)
+
+    def _run(self, method, sql, params):
+        record = QueryRecord(sql, params)
+        self._profile.queries.append(record)
+        steps = self._profile.vm_steps
+        started = time.perf_counter()
+        try:
+            cursor = method(sql, params)
+        finally:
+            record.duration += time.perf_counter() - started
+            record.vm_steps += self._profile.vm_steps - steps
+        return InstrumentedCursor(cursor, record, self._profile)
+
+    def execute(self, sql, params=()):
+        return self._run(self.raw.execute, sql, params)
+
+    def executemany(self, sql, seq_of_params):
+        seq_of_params = list(seq_of_params)
+        cursor = self._run(self.raw.executemany, sql, seq_of_params)
+        cursor._record.params = f'<{len(seq_of_params)} rows>'
+        return cursor
+
+    def detach(self):
+        """Stop profiling and return the wrapped connection"""
+        self.raw.set_progress_handler(None, 0)
+        return self.raw
+
+    def __getattr__(self, name):
+        return getattr(self.raw, name)
+
+
+class Histogram:
+    """Cumulative Prometheus-style histogram per label set"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.series = {}  # labels -> [bucket counts..., +Inf count, sum]
+
+    def observe(self, labels, value):
+        series = self.series.get(labels)
+        if series is None:
+            series = self.series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def merge(self, labels, counts):
+        """Add another histogram's series (bucket counts, +Inf count, sum) for labels"""
+        series = self.series.get(labels)
+        if series is None:
+            series = self.series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        for index, count in enumerate(counts):
+            series[index] += count
+
+
+def _labels(names, values, extra=''):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Metrics:
+    """Per-route request and SQL metrics, shared between worker processes through directory
+
+    Without a directory the metrics cover this process only. With one, start() makes
+    each worker write a snapshot of its metrics and samples (a callable returning the
+    process's (name, type, help, value) gauges and counters) to its own file every
+    flush_interval seconds, and render() merges every worker's file, so a scrape
+    answered by any worker reports the totals of all of them. Files of exited workers
+    are kept, so counters never go backwards; their gauges are dropped.
+    """
+
+    def __init__(self, slow_query_ms=100, directory=None, flush_interval=1.0, samples=None):
+        self.slow_query_ms = slow_query_ms
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.samples = samples
+        self._lock = threading.Lock()
+        self._request_duration = Histogram()
+        self._db_duration = Histogram()
+        self._queries = {}     # (route, method) -> statements executed
+        self._rows = {}        # (route, method) -> rows returned
+        self._vm_steps = {}    # (route, method) -> SQLite VM steps
+        self._slow_queries = 0
+        self._plans = {}       # sql -> query plan lines (bounded)
+        self._path = None      # This process's snapshot file, set by start()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def record(self, route, method, status, profile, total, conn=None):
+        """Aggregate a finished request and log its slow statements"""
+        key = (route, method)
+        with self._lock:
+            self._request_duration.observe((route, method, str(status)), total)
+            self._db_duration.observe(key, profile.db_duration)
+            self._queries[key] = self._queries.get(key, 0) + len(profile.queries)
+            self._rows[key] = self._rows.get(key, 0) + sum(query.rows for query in profile.queries)
+            self._vm_steps[key] = self._vm_steps.get(key, 0) + sum(query.vm_steps for query in profile.queries)
+
+        for query in profile.queries:
+            duration_ms = query.duration * 1000
+            if duration_ms >= self.slow_query_ms:
+                with self._lock:
+                    self._slow_queries += 1
+                slow_query_logger.warning(
+                    'slow query (%.1f ms, %d rows, ~%d VM steps) on %s %s: %s params=%r plan=%s',
+                    duration_ms, query.rows, query.vm_steps, method, route, query.sql, query.params,
+                    ' | '.join(self.query_plan(conn, query)) or '-' if conn is not None else '?')
+
+    def query_plan(self, conn, query):
+        """Return EXPLAIN QUERY PLAN lines for a recorded statement (cached per SQL text)"""
+        plan = self._plans.get(query.sql)
+        if plan is None:
+            if isinstance(query.params, str):
+                return ['(batch)']
+            try:
+                plan = [row[3] for row in conn.execute('EXPLAIN QUERY PLAN ' + query.sql, query.params)]
+            except Exception as e:
+                return [f'(unavailable: {e})']
+            with self._lock:
+                if len(self._plans) >= 512:
+                    self._plans.clear()
+                self._plans[query.sql] = plan
+        return plan
+
+    def start(self):
+        """Start sharing this process's metrics (call in each worker after fork)"""
+        if self.directory is None or self._thread is not None:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        # The token keeps a recycled pid from overwriting an exited worker's counters
+        self._path = os.path.join(self.directory, f'metrics-{os.getpid()}-{uuid.uuid4().hex[:8]}.json')
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='metrics-flush', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the flush thread and write a final snapshot"""
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        self.flush()
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Writing the metrics snapshot failed')
+
+    def flush(self):
+        """Write this process's snapshot file (atomically, so readers never see half of it)"""
+        if self._path is None:
+            return
+        temporary = f'{self._path}.tmp'
+        with open(temporary, 'w') as file:
+            json.dump(self.snapshot(), file)
+        os.replace(temporary, self._path)
+
+    def snapshot(self):
+        """Return this process's metrics and samples as a JSON-serializable dict"""
+        with self._lock:
+            data = {
+                'pid': os.getpid(),
+                'request_duration': [[list(labels), list(series)]
+                                     for labels, series in self._request_duration.series.items()],
+                'db_duration': [[list(labels), list(series)] for labels, series in self._db_duration.series.items()],
+                'queries': [[list(labels), value] for labels, value in self._queries.items()],
+                'rows': [[list(labels), value] for labels, value in self._rows.items()],
+                'vm_steps': [[list(labels), value] for labels, value in self._vm_steps.items()],
+                'slow_queries': self._slow_queries
+            }
+        data['samples'] = [list(sample) for sample in self.samples()] if self.samples is not None else []
+        return data
+
+    def _snapshots(self):
+        if self._path is None:
+            return [self.snapshot()]
+        self.flush()
+        snapshots = []
+        for name in sorted(os.listdir(self.directory)):
+            if not (name.startswith('metrics-') and name.endswith('.json')):
+                continue
+            try:
+                with open(os.path.join(self.directory, name)) as file:
+                    snapshots.append(json.load(file))
+            except (OSError, ValueError):
+                continue  # Removed or replaced while listing
+        return snapshots
+
+    def render(self):
+        """Return the metrics of every worker in the Prometheus text exposition format"""
+        request_duration, db_duration = Histogram(), Histogram()
+        queries, rows, vm_steps = {}, {}, {}
+        slow_queries = 0
+        samples = {}  # name -> [type, help, value], in first-seen order
+        for snapshot in self._snapshots():
+            live = _alive(snapshot['pid'])
+            for histogram, key in ((request_duration, 'request_duration'), (db_duration, 'db_duration')):
+                for labels, series in snapshot[key]:
+                    histogram.merge(tuple(labels), series)
+            for counters, key in ((queries, 'queries'), (rows, 'rows'), (vm_steps, 'vm_steps')):
+                for labels, value in snapshot[key]:
+                    counters[tuple(labels)] = counters.get(tuple(labels), 0) + value
+            slow_queries += snapshot['slow_queries']
+            for name, metric_type, help_text, value in snapshot['samples']:
+                sample = samples.setdefault(name, [metric_type, help_text, 0])
+                if metric_type == 'counter' or live:
+                    sample[2] += value
+
+        lines = []
+
+        def histogram(name, help_text, data, label_names):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} histogram')
+            for labels, series in sorted(data.series.items()):
+                cumulative = 0
+                for bound, count in zip(data.buckets, series):
+                    cumulative += count
+                    le = 'le="%s"' % bound
+                    lines.append(f'{name}_bucket{_labels(label_names, labels, le)} {cumulative}')
+                cumulative += series[len(data.buckets)]
+                le = 'le="+Inf"'
+                lines.append(f'{name}_bucket{_labels(label_names, labels, le)} {cumulative}')
+                lines.append(f'{name}_sum{_labels(label_names, labels)} {series[-1]:.6f}')
+                lines.append(f'{name}_count{_labels(label_names, labels)} {cumulative}')
+
+        def counter(name, help_text, data):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} counter')
+            for labels, value in sorted(data.items()):
+                lines.append(f'{name}{_labels(("route", "method"), labels)} {value}')
+
+        histogram('finance_tracker_request_duration_seconds', 'Request latency by route',
+                  request_duration, ('route', 'method', 'status'))
+        histogram('finance_tracker_db_duration_seconds', 'Time spent in SQL per request by route',
+                  db_duration, ('route', 'method'))
+        counter('finance_tracker_sql_queries_total', 'SQL statements executed by route', queries)
+        counter('finance_tracker_sql_rows_total', 'Rows returned by SQL statements by route', rows)
+        counter('finance_tracker_sql_vm_steps_total',
+                'SQLite VM instructions executed by route (a proxy for rows scanned)', vm_steps)
+        lines.append('# HELP finance_tracker_slow_queries_total Statements slower than the slow-query threshold')
+        lines.append('# TYPE finance_tracker_slow_queries_total counter')
+        lines.append(f'finance_tracker_slow_queries_total {slow_queries}')
+
+        for name, (metric_type, help_text, value) in samples.items():
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {metric_type}')
+            lines.append(f'{name} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+def _alive(pid):
+    """Whether the process that wrote a snapshot is still running"""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
@@ -0,0 +1,525 @@
+"""Versioned schema migrations for the finance tracker database
+
+Each migration is applied once, in order, and recorded in the schema_version
+table so startup only has to read the current version on an up-to-date database.
+"""
+
+# (version, name, statements)
+MIGRATIONS = [
+    (1, 'initial schema', [
+        '''
+        CREATE TABLE IF NOT EXISTS transactions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            date TEXT NOT NULL,
+            description TEXT NOT NULL,
+            amount REAL NOT NULL,
+            type TEXT NOT NULL CHECK (type IN ('income', 'expense')),
+            category TEXT NOT NULL,
+            notes TEXT,
+            recurring_id INTEGER,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (recurring_id) REFERENCES recurring_transactions (id)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS recurring_transactions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            description TEXT NOT NULL,
+            amount REAL NOT NULL,
+            type TEXT NOT NULL CHECK (type IN ('income', 'expense')),
+            category TEXT NOT NULL,
+            notes TEXT,
+            frequency TEXT NOT NULL CHECK (frequency IN ('weekly', 'biweekly', 'monthly', 'quarterly', 'yearly')),
+            start_date TEXT NOT NULL,
+            end_date TEXT,
+            next_occurrence TEXT NOT NULL,
+            is_active BOOLEAN DEFAULT 1,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS budget_goals (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            monthly_income REAL NOT NULL DEFAULT 0,
+            debt_payments REAL NOT NULL DEFAULT 0,
+            savings REAL NOT NULL DEFAULT 0,
+            investments REAL NOT NULL DEFAULT 0,
+            discretionary REAL NOT NULL DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS accounts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            type TEXT NOT NULL,
+            balance REAL NOT NULL DEFAULT 0,
+            monthly_contribution REAL NOT NULL DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        '''
+    ]),
+    (2, 'query indexes', [
+        # Transaction list ordered by date (rowid breaks ties) and date-range filters
+        'CREATE INDEX IF NOT EXISTS idx_transactions_date ON transactions (date)',
+        # Category filter on the transaction list, DISTINCT category
+        'CREATE INDEX IF NOT EXISTS idx_transactions_category_date ON transactions (category, date)',
+        # Type filter on the transaction list and covering index for the analytics aggregates
+        'CREATE INDEX IF NOT EXISTS idx_transactions_type_date ON transactions (type, date, category, amount)',
+        # Due scan in the recurring scheduler
+        'CREATE INDEX IF NOT EXISTS idx_recurring_active_next ON recurring_transactions (is_active, next_occurrence)',
+        'CREATE INDEX IF NOT EXISTS idx_recurring_category ON recurring_transactions (category)',
+        # Most recent budget goals
+        'CREATE INDEX IF NOT EXISTS idx_budget_goals_created ON budget_goals (created_at)'
+    ]),
+    (3, 'monthly category rollup', [
+        '''
+        CREATE TABLE IF NOT EXISTS monthly_category_totals (
+            month TEXT NOT NULL,
+            category TEXT NOT NULL,
+            type TEXT NOT NULL,
+            amount_total REAL NOT NULL DEFAULT 0,
+            abs_total REAL NOT NULL DEFAULT 0,
+            count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (month, category, type)
+        ) WITHOUT ROWID
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_rollup_insert AFTER INSERT ON transactions
+        BEGIN
+            INSERT INTO monthly_category_totals (month, category, type, amount_total, abs_total, count)
+            VALUES (substr(NEW.date, 1, 7), NEW.category, NEW.type, NEW.amount, ABS(NEW.amount), 1)
+            ON CONFLICT (month, category, type) DO UPDATE SET
+                amount_total = amount_total + excluded.amount_total,
+                abs_total = abs_total + excluded.abs_total,
+                count = count + 1;
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_rollup_delete AFTER DELETE ON transactions
+        BEGIN
+            UPDATE monthly_category_totals
+            SET amount_total = amount_total - OLD.amount, abs_total = abs_total - ABS(OLD.amount), count = count - 1
+            WHERE month = substr(OLD.date, 1, 7) AND category = OLD.category AND type = OLD.type;
+            DELETE FROM monthly_category_totals
+            WHERE month = substr(OLD.date, 1, 7) AND category = OLD.category AND type = OLD.type AND count <= 0;
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_rollup_update AFTER UPDATE OF date, amount, type, category ON transactions
+        BEGIN
+            UPDATE monthly_category_totals
+            SET amount_total = amount_total - OLD.amount, abs_total = abs_total - ABS(OLD.amount), count = count - 1
+            WHERE month = substr(OLD.date, 1, 7) AND category = OLD.category AND type = OLD.type;
+            DELETE FROM monthly_category_totals
+            WHERE month = substr(OLD.date, 1, 7) AND category = OLD.category AND type = OLD.type AND count <= 0;
+            INSERT INTO monthly_category_totals (month, category, type, amount_total, abs_total, count)
+            VALUES (substr(NEW.date, 1, 7), NEW.category, NEW.type, NEW.amount, ABS(NEW.amount), 1)
+            ON CONFLICT (month, category, type) DO UPDATE SET
+                amount_total = amount_total + excluded.amount_total,
+                abs_total = abs_total + excluded.abs_total,
+                count = count + 1;
+        END
+        ''',
+        # Backfill from existing transactions
+        'DELETE FROM monthly_category_totals',
+        '''
+        INSERT INTO monthly_category_totals (month, category, type, amount_total, abs_total, count)
+        SELECT substr(date, 1, 7), category, type, SUM(amount), SUM(ABS(amount)), COUNT(*)
+        FROM transactions
+        GROUP BY substr(date, 1, 7), category, type
+        '''
+    ]),
+    (4, 'account ledger', [
+        'ALTER TABLE transactions ADD COLUMN account_id INTEGER REFERENCES accounts (id)',
+        'ALTER TABLE recurring_transactions ADD COLUMN account_id INTEGER REFERENCES accounts (id)',
+        # Balance before any linked transaction; existing balances become the opening balance
+        'ALTER TABLE accounts ADD COLUMN opening_balance REAL NOT NULL DEFAULT 0',
+        'UPDATE accounts SET opening_balance = balance',
+        'CREATE INDEX IF NOT EXISTS idx_transactions_account ON transactions (account_id) WHERE account_id IS NOT NULL',
+        # End-of-day balance per account, for charting
+        '''
+        CREATE TABLE IF NOT EXISTS account_balance_history (
+            account_id INTEGER NOT NULL,
+            date TEXT NOT NULL,
+            balance REAL NOT NULL,
+            PRIMARY KEY (account_id, date)
+        ) WITHOUT ROWID
+        ''',
+        'INSERT OR REPLACE INTO account_balance_history (account_id, date, balance) '
+        "SELECT id, date('now', 'localtime'), balance FROM accounts",
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_account_snapshot_insert AFTER INSERT ON accounts
+        BEGIN
+            INSERT OR REPLACE INTO account_balance_history (account_id, date, balance)
+            VALUES (NEW.id, date('now', 'localtime'), NEW.balance);
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_account_snapshot_update AFTER UPDATE OF balance ON accounts
+        BEGIN
+            INSERT OR REPLACE INTO account_balance_history (account_id, date, balance)
+            VALUES (NEW.id, date('now', 'localtime'), NEW.balance);
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_ledger_insert AFTER INSERT ON transactions
+        WHEN NEW.account_id IS NOT NULL
+        BEGIN
+            UPDATE accounts
+            SET balance = balance + CASE WHEN NEW.type = 'income' THEN ABS(NEW.amount) ELSE -ABS(NEW.amount) END, updated_at = CURRENT_TIMESTAMP
+            WHERE id = NEW.account_id;
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_ledger_delete AFTER DELETE ON transactions
+        WHEN OLD.account_id IS NOT NULL
+        BEGIN
+            UPDATE accounts
+            SET balance = balance - (CASE WHEN OLD.type = 'income' THEN ABS(OLD.amount) ELSE -ABS(OLD.amount) END), updated_at = CURRENT_TIMESTAMP
+            WHERE id = OLD.account_id;
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_ledger_update AFTER UPDATE OF amount, type, account_id ON transactions
+        WHEN OLD.account_id IS NOT NULL OR NEW.account_id IS NOT NULL
+        BEGIN
+            UPDATE accounts
+            SET balance = balance - (CASE WHEN OLD.type = 'income' THEN ABS(OLD.amount) ELSE -ABS(OLD.amount) END), updated_at = CURRENT_TIMESTAMP
+            WHERE id = OLD.account_id;
+            UPDATE accounts
+            SET balance = balance + CASE WHEN NEW.type = 'income' THEN ABS(NEW.amount) ELSE -ABS(NEW.amount) END, updated_at = CURRENT_TIMESTAMP
+            WHERE id = NEW.account_id;
+        END
+        '''
+    ]),
+    (5, 'full-text search', [
+        # External-content index over description and notes; rowid is the transaction id
+        '''
+        CREATE VIRTUAL TABLE IF NOT EXISTS transactions_fts USING fts5 (
+            description, notes,
+            content = 'transactions', content_rowid = 'id',
+            tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3'
+        )
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_fts_insert AFTER INSERT ON transactions
+        BEGIN
+            INSERT INTO transactions_fts (rowid, description, notes) VALUES (NEW.id, NEW.description, NEW.notes);
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_fts_delete AFTER DELETE ON transactions
+        BEGIN
+            INSERT INTO transactions_fts (transactions_fts, rowid, description, notes)
+            VALUES ('delete', OLD.id, OLD.description, OLD.notes);
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_fts_update AFTER UPDATE OF description, notes ON transactions
+        BEGIN
+            INSERT INTO transactions_fts (transactions_fts, rowid, description, notes)
+            VALUES ('delete', OLD.id, OLD.description, OLD.notes);
+            INSERT INTO transactions_fts (rowid, description, notes) VALUES (NEW.id, NEW.description, NEW.notes);
+        END
+        ''',
+        # Index the rows that already exist
+        "INSERT INTO transactions_fts (transactions_fts) VALUES ('rebuild')"
+    ]),
+    (6, 'auto-categorization', [
+        '''
+        CREATE TABLE IF NOT EXISTS categorization_rules (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            match_type TEXT NOT NULL CHECK (match_type IN ('substring', 'regex', 'amount')),
+            pattern TEXT,
+            min_amount REAL,
+            max_amount REAL,
+            transaction_type TEXT CHECK (transaction_type IN ('income', 'expense')),
+            category TEXT NOT NULL,
+            priority INTEGER NOT NULL DEFAULT 100,
+            is_active BOOLEAN DEFAULT 1,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        # How often each (lower-cased) description has been filed under each category
+        '''
+        CREATE TABLE IF NOT EXISTS description_categories (
+            description_key TEXT NOT NULL,
+            category TEXT NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (description_key, category)
+        ) WITHOUT ROWID
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_learned_insert AFTER INSERT ON transactions
+        BEGIN
+            INSERT INTO description_categories (description_key, category, count)
+            VALUES (lower(trim(NEW.description)), NEW.category, 1)
+            ON CONFLICT (description_key, category) DO UPDATE SET count = count + 1;
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_learned_delete AFTER DELETE ON transactions
+        BEGIN
+            UPDATE description_categories SET count = count - 1
+            WHERE description_key = lower(trim(OLD.description)) AND category = OLD.category;
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_learned_update AFTER UPDATE OF description, category ON transactions
+        BEGIN
+            UPDATE description_categories SET count = count - 1
+            WHERE description_key = lower(trim(OLD.description)) AND category = OLD.category;
+            INSERT INTO description_categories (description_key, category, count)
+            VALUES (lower(trim(NEW.description)), NEW.category, 1)
+            ON CONFLICT (description_key, category) DO UPDATE SET count = count + 1;
+        END
+        ''',
+        '''
+        INSERT INTO description_categories (description_key, category, count)
+        SELECT lower(trim(description)), category, COUNT(*)
+        FROM transactions
+        GROUP BY lower(trim(description)), category
+        '''
+    ]),
+    (7, 'change feed', [
+        # Latest change per row: a new change replaces the row's entry with a higher seq,
+        # so the log holds at most one entry (or tombstone) per transaction/template
+        '''
+        CREATE TABLE IF NOT EXISTS change_log (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            entity TEXT NOT NULL CHECK (entity IN ('transaction', 'recurring')),
+            entity_id INTEGER NOT NULL,
+            deleted INTEGER NOT NULL DEFAULT 0,
+            changed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE (entity, entity_id)
+        )
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_changes_transaction_insert AFTER INSERT ON transactions
+        BEGIN
+            INSERT OR REPLACE INTO change_log (entity, entity_id, deleted) VALUES ('transaction', NEW.id, 0);
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_changes_transaction_update AFTER UPDATE ON transactions
+        BEGIN
+            INSERT OR REPLACE INTO change_log (entity, entity_id, deleted) VALUES ('transaction', NEW.id, 0);
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_changes_transaction_delete AFTER DELETE ON transactions
+        BEGIN
+            INSERT OR REPLACE INTO change_log (entity, entity_id, deleted) VALUES ('transaction', OLD.id, 1);
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_changes_recurring_insert AFTER INSERT ON recurring_transactions
+        BEGIN
+            INSERT OR REPLACE INTO change_log (entity, entity_id, deleted) VALUES ('recurring', NEW.id, 0);
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_changes_recurring_update AFTER UPDATE ON recurring_transactions
+        BEGIN
+            INSERT OR REPLACE INTO change_log (entity, entity_id, deleted) VALUES ('recurring', NEW.id, 0);
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_changes_recurring_delete AFTER DELETE ON recurring_transactions
+        BEGIN
+            INSERT OR REPLACE INTO change_log (entity, entity_id, deleted) VALUES ('recurring', OLD.id, 1);
+        END
+        ''',
+        # Existing rows, so syncing from seq 0 returns the whole ledger
+        "INSERT INTO change_log (entity, entity_id) SELECT 'recurring', id FROM recurring_transactions ORDER BY id",
+        "INSERT INTO change_log (entity, entity_id) SELECT 'transaction', id FROM transactions ORDER BY id"
+    ]),
+    (8, 'topic versions', [
+        # Bumped on every write to the small tables the change feed doesn't cover, so the
+        # event server can tell what changed without scanning them
+        '''
+        CREATE TABLE IF NOT EXISTS topic_versions (
+            topic TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID
+        ''',
+        "INSERT OR IGNORE INTO topic_versions (topic) VALUES ('budget_goals'), ('accounts'), ('categorization_rules')",
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_topic_budget_goals_insert AFTER INSERT ON budget_goals
+        BEGIN
+            UPDATE topic_versions SET version = version + 1 WHERE topic = 'budget_goals';
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_topic_budget_goals_update AFTER UPDATE ON budget_goals
+        BEGIN
+            UPDATE topic_versions SET version = version + 1 WHERE topic = 'budget_goals';
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_topic_budget_goals_delete AFTER DELETE ON budget_goals
+        BEGIN
+            UPDATE topic_versions SET version = version + 1 WHERE topic = 'budget_goals';
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_topic_accounts_insert AFTER INSERT ON accounts
+        BEGIN
+            UPDATE topic_versions SET version = version + 1 WHERE topic = 'accounts';
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_topic_accounts_update AFTER UPDATE ON accounts
+        BEGIN
+            UPDATE topic_versions SET version = version + 1 WHERE topic = 'accounts';
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_topic_accounts_delete AFTER DELETE ON accounts
+        BEGIN
+            UPDATE topic_versions SET version = version + 1 WHERE topic = 'accounts';
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_topic_categorization_rules_insert AFTER INSERT ON categorization_rules
+        BEGIN
+            UPDATE topic_versions SET version = version + 1 WHERE topic = 'categorization_rules';
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_topic_categorization_rules_update AFTER UPDATE ON categorization_rules
+        BEGIN
+            UPDATE topic_versions SET version = version + 1 WHERE topic = 'categorization_rules';
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_topic_categorization_rules_delete AFTER DELETE ON categorization_rules
+        BEGIN
+            UPDATE topic_versions SET version = version + 1 WHERE topic = 'categorization_rules';
+        END
+        '''
+    ]),
+    (9, 'archive segments', [
+        # The live cold-storage file of each archived year (see archive.py); replaced in the
+        # same transaction that deletes the rows it now holds
+        '''
+        CREATE TABLE IF NOT EXISTS archive_segments (
+            year INTEGER PRIMARY KEY,
+            file TEXT NOT NULL,
+            rows INTEGER NOT NULL,
+            min_date TEXT,
+            max_date TEXT,
+            archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        '''
+    ]),
+    (10, 'categorization rule category index', [
+        # DISTINCT category for /api/categories, which also lists the rules' categories
+        'CREATE INDEX IF NOT EXISTS idx_categorization_rules_category ON categorization_rules (category)'
+    ])
+]
+
+# Query shapes issued by the routes, checked against EXPLAIN QUERY PLAN
+QUERY_PLAN_CHECKS = [
+    ('get_transactions',
+     'SELECT * FROM transactions WHERE 1=1 ORDER BY date DESC, id DESC', ()),
+    ('get_transactions (date range)',
+     'SELECT * FROM transactions WHERE 1=1 AND date >= ? AND date <= ? ORDER BY date DESC, id DESC',
+     ('2025-01-01', '2025-12-31')),
+    ('get_transactions (category)',
+     'SELECT * FROM transactions WHERE 1=1 AND category = ? ORDER BY date DESC, id DESC', ('Groceries',)),
+    ('get_transactions (type)',
+     'SELECT * FROM transactions WHERE 1=1 AND type = ? ORDER BY date DESC, id DESC', ('expense',)),
+    ('get_transactions (next page)',
+     'SELECT * FROM transactions WHERE 1=1 AND (date, id) < (?, ?) ORDER BY date DESC, id DESC LIMIT ?',
+     ('2025-06-01', 100, 51)),
+    ('get_transactions (search)',
+     '''SELECT * FROM transactions WHERE 1=1
+        AND id IN (SELECT rowid FROM transactions_fts WHERE transactions_fts MATCH ?)
+        ORDER BY date DESC, id DESC''', ('"coffee"*',)),
+    ('get_spending_by_category',
+     '''SELECT category, SUM(total) AS total_amount FROM (
+            SELECT category, abs_total AS total FROM monthly_category_totals
+            WHERE type = 'expense' AND month >= ?
+            UNION ALL
+            SELECT category, ABS(amount) FROM transactions
+            WHERE type = 'expense' AND date >= ? AND date < ?
+        ) GROUP BY category ORDER BY total_amount DESC''', ('2025-02', '2025-01-15', '2025-02-01')),
+    ('get_financial_overview',
+     '''SELECT COALESCE(SUM(CASE WHEN type = 'income' THEN amount_total END), 0) AS income,
+               COALESCE(SUM(CASE WHEN type = 'expense' THEN abs_total END), 0) AS expenses
+        FROM monthly_category_totals WHERE month >= ?''', ('2025-01',)),
+    ('get_budget_goals',
+     'SELECT * FROM budget_goals ORDER BY created_at DESC LIMIT 1', ()),
+    ('get_categories',
+     '''SELECT DISTINCT category FROM transactions UNION
+        SELECT DISTINCT category FROM recurring_transactions UNION
+        SELECT DISTINCT category FROM categorization_rules ORDER BY category''', ()),
+    ('changes_since',
+     'SELECT seq, entity, entity_id, deleted FROM change_log WHERE seq > ? ORDER BY seq LIMIT ?', (0, 1001)),
+    ('process_recurring_transactions',
+     '''SELECT * FROM recurring_transactions WHERE is_active = 1 AND next_occurrence <= ?
+        AND (end_date IS NULL OR end_date = '' OR next_occurrence <= end_date)''', ('2025-01-01',))
+]
+
+
+def get_schema_version(conn):
+    """Return the highest applied migration version (0 for a new database)"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    return conn.execute('SELECT COALESCE(MAX(version), 0) FROM schema_version').fetchone()[0]
+
+
+def migrate(conn):
+    """Apply all pending migrations and return the list of versions applied"""
+    current = get_schema_version(conn)
+    conn.commit()
+
+    applied = []
+    for version, name, statements in MIGRATIONS:
+        if version <= current:
+            continue
+
+        # Each migration runs in its own transaction (SQLite DDL is transactional)
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            # Another process may have applied it while we waited for the write lock
+            if conn.execute('SELECT 1 FROM schema_version WHERE version = ?', (version,)).fetchone():
+                conn.commit()
+                continue
+            for statement in statements:
+                conn.execute(statement)
+            conn.execute('INSERT INTO schema_version (version, name) VALUES (?, ?)', (version, name))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        applied.append(version)
+
+    return applied
+
+
+def check_query_plans(conn):
+    """Return (name, plan) for every checked query that does a full table scan"""
+    def is_table_scan(detail):
+        # "SCAN (subquery-N)" walks an intermediate result, not a table
+        return detail.startswith('SCAN ') and not detail.startswith('SCAN (') and 'INDEX' not in detail
+
+    problems = []
+    for name, query, params in QUERY_PLAN_CHECKS:
+        plan = [row[3] for row in conn.execute(f'EXPLAIN QUERY PLAN {query}', params)]
+        if any(is_table_scan(detail) for detail in plan):
+            problems.append((name, plan))
+    return problems
@@ -0,0 +1,118 @@
+"""Recurrence expansion for recurring transaction rules
+
+Occurrence dates are generated with integer arithmetic: ordinal ranges for weekly
+rules and month-index stepping for monthly/quarterly/yearly rules. Month-based rules
+clamp to the end of shorter months and, because each step is chained from the
+previous occurrence (as calculate_next_occurrence() does), the clamped day sticks:
+Jan 31 -> Feb 28 -> Mar 28.
+"""
+from datetime import date
+from operator import itemgetter
+
+from bulk import grouped_insert_maintenance
+
+# Frequencies stepped by a fixed number of days or months
+DAY_STEPS = {'weekly': 7, 'biweekly': 14}
+MONTH_STEPS = {'monthly': 1, 'quarterly': 3, 'yearly': 12}
+FREQUENCIES = tuple(DAY_STEPS) + tuple(MONTH_STEPS)
+
+_DAYS_IN_MONTH = (31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31)
+
+
+def _days_in_month(year, month_index):
+    """Days in the month for a zero-based month index"""
+    if month_index == 1 and year % 4 == 0 and (year % 100 != 0 or year % 400 == 0):
+        return 29
+    return _DAYS_IN_MONTH[month_index]
+
+
+def occurrence_dates(start, frequency, until):
+    """Return (dates, next_date): every occurrence from start through until, and the one after
+
+    start and until are date objects. Unknown frequencies produce no occurrences and
+    leave start as the next date.
+    """
+    if frequency in DAY_STEPS:
+        step = DAY_STEPS[frequency]
+        start_ordinal = start.toordinal()
+        ordinals = range(start_ordinal, until.toordinal() + 1, step)
+        return list(map(date.fromordinal, ordinals)), date.fromordinal(start_ordinal + len(ordinals) * step)
+
+    step = MONTH_STEPS.get(frequency)
+    if step is None:
+        return [], start
+
+    dates = []
+    month = start.year * 12 + start.month - 1
+    day = start.day
+    while True:
+        year, month_index = divmod(month, 12)
+        if day > 28:
+            day = min(day, _days_in_month(year, month_index))
+        current = date(year, month_index + 1, day)
+        if current > until:
+            return dates, current
+        dates.append(current)
+        month += step
+
+
+def expand_occurrences(first_occurrence, frequency, until):
+    """Return every occurrence date from first_occurrence up to until, plus the next one after that
+
+    Dates are ISO strings; results match chaining calculate_next_occurrence().
+    """
+    dates, next_date = occurrence_dates(date.fromisoformat(first_occurrence), frequency, until)
+    return [d.isoformat() for d in dates], next_date.isoformat()
+
+
+def materialize_due_occurrences(conn, today=None):
+    """Insert every missed occurrence of all active recurring transactions in one transaction
+
+    Returns the number of transactions created.
+    """
+    today = today or date.today()
+    today_str = today.isoformat()
+
+    # Take the write lock before reading so concurrent passes can't materialize the same dates
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        templates = conn.execute('''
+            SELECT id, description, amount, type, category, notes, frequency, next_occurrence, end_date, account_id
+            FROM recurring_transactions
+            WHERE is_active = 1 AND next_occurrence <= ?
+            AND (end_date IS NULL OR end_date = '' OR next_occurrence <= end_date)
+        ''', (today_str,)).fetchall()
+
+        new_transactions = []
+        advanced = []
+        for rec in templates:
+            until = today
+            if rec['end_date']:
+                until = min(until, date.fromisoformat(rec['end_date']))
+
+            occurrences, next_occurrence = expand_occurrences(rec['next_occurrence'], rec['frequency'], until)
+            for occurrence in occurrences:
+                new_transactions.append((occurrence, rec['description'], rec['amount'], rec['type'],
+                                         rec['category'], rec['notes'], rec['id'], rec['account_id']))
+            advanced.append((next_occurrence, rec['id']))
+
+        # Inserting in date order keeps index and rollup updates local
+        new_transactions.sort(key=itemgetter(0))
+        with grouped_insert_maintenance(conn, len(new_transactions)):
+            conn.executemany('''
+                INSERT INTO transactions (date, description, amount, type, category, notes, recurring_id, account_id)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ''', new_transactions)
+
+        conn.executemany('''
+            UPDATE recurring_transactions
+            SET next_occurrence = ?, updated_at = CURRENT_TIMESTAMP
+            WHERE id = ?
+        ''', advanced)
+
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    return len(new_transactions)
@@ -0,0 +1,118 @@
+"""Maintenance helpers for the monthly_category_totals rollup
+
+The rollup holds per (month, category, type) sums of the transactions table and is
+kept current by triggers (see migration 3), so every write path updates it in the
+same transaction. Bulk writes of GROUPED_MIN_ROWS rows or more instead run with the
+triggers suspended and apply one grouped delta: large batches through
+rollup_triggers_suspended(), bulk inserts through bulk.grouped_insert_maintenance().
+Archived transactions (see archive.py) stay counted: their totals are passed in as
+`archived` rows of (month, category, type, amount_total, abs_total, count).
+"""
+from contextlib import contextmanager
+
+ROLLUP_TRIGGERS = ('trg_rollup_insert', 'trg_rollup_delete', 'trg_rollup_update')
+
+# Dropping and recreating the triggers is a schema change that every pooled connection
+# re-parses (about 1ms in all), so small writes keep the per-row triggers
+GROUPED_MIN_ROWS = 1000
+
+REBUILD_SQL = '''
+    INSERT INTO monthly_category_totals (month, category, type, amount_total, abs_total, count)
+    SELECT substr(date, 1, 7), category, type, SUM(amount), SUM(ABS(amount)), COUNT(*)
+    FROM transactions
+    GROUP BY substr(date, 1, 7), category, type
+'''
+
+ADD_ARCHIVED_SQL = '''
+    INSERT INTO monthly_category_totals (month, category, type, amount_total, abs_total, count)
+    VALUES (?, ?, ?, ?, ?, ?)
+    ON CONFLICT (month, category, type) DO UPDATE SET
+        amount_total = amount_total + excluded.amount_total,
+        abs_total = abs_total + excluded.abs_total,
+        count = count + excluded.count
+'''
+
+ADD_GROUPED_SQL = '''
+    INSERT INTO monthly_category_totals (month, category, type, amount_total, abs_total, count)
+    SELECT substr(date, 1, 7), category, type, ? * SUM(amount), ? * SUM(ABS(amount)), ? * COUNT(*)
+    FROM transactions
+    WHERE {where}
+    GROUP BY substr(date, 1, 7), category, type
+    ON CONFLICT (month, category, type) DO UPDATE SET
+        amount_total = amount_total + excluded.amount_total,
+        abs_total = abs_total + excluded.abs_total,
+        count = count + excluded.count
+'''
+
+
+@contextmanager
+def rollup_triggers_suspended(conn, rows):
+    """Drop the rollup triggers around a bulk write of rows transactions, yielding True if it did
+
+    Must run inside the caller's write transaction; while suspended the caller keeps the
+    rollup current with add_to_rollups(). A write that raises is rolled back by the
+    caller, which restores the triggers with everything else.
+    """
+    if rows < GROUPED_MIN_ROWS:
+        yield False
+        return
+    triggers = conn.execute(f'''
+        SELECT name, sql FROM sqlite_master
+        WHERE type = 'trigger' AND name IN ({', '.join('?' * len(ROLLUP_TRIGGERS))})
+    ''', ROLLUP_TRIGGERS).fetchall()
+    for trigger in triggers:
+        conn.execute(f'DROP TRIGGER {trigger[0]}')
+    yield True
+    for trigger in triggers:
+        conn.execute(trigger[1])
+
+
+def add_to_rollups(conn, where, params=(), sign=1):
+    """Add (sign=1) or subtract (sign=-1) the transactions matching where with one grouped statement"""
+    conn.execute(ADD_GROUPED_SQL.format(where=where), (sign, sign, sign, *params))
+    if sign < 0:
+        conn.execute('DELETE FROM monthly_category_totals WHERE count <= 0')
+
+
+def rebuild_rollups(conn, archived=()):
+    """Recompute the rollup from scratch and return the number of rollup rows"""
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        conn.execute('DELETE FROM monthly_category_totals')
+        conn.execute(REBUILD_SQL)
+        conn.executemany(ADD_ARCHIVED_SQL, archived)
+        count = conn.execute('SELECT COUNT(*) FROM monthly_category_totals').fetchone()[0]
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return count
+
+
+def check_rollups(conn, archived=(), tolerance=0.005):
+    """Compare the rollup against the raw and archived transactions and return a list of mismatches"""
+    def load(query):
+        return {(row[0], row[1], row[2]): (row[3], row[4], row[5]) for row in conn.execute(query)}
+
+    expected = load('''
+        SELECT substr(date, 1, 7), category, type, SUM(amount), SUM(ABS(amount)), COUNT(*)
+        FROM transactions
+        GROUP BY substr(date, 1, 7), category, type
+    ''')
+    for month, category, kind, amount_total, abs_total, count in archived:
+        want = expected.get((month, category, kind), (0, 0, 0))
+        expected[(month, category, kind)] = (want[0] + amount_total, want[1] + abs_total, want[2] + count)
+    actual = load('SELECT month, category, type, amount_total, abs_total, count FROM monthly_category_totals')
+
+    mismatches = []
+    for key in sorted(set(expected) | set(actual)):
+        want = expected.get(key, (0, 0, 0))
+        have = actual.get(key, (0, 0, 0))
+        if (want[2] != have[2] or abs(want[0] - have[0]) > tolerance
+                or abs(want[1] - have[1]) > tolerance):
+            mismatches.append({
+                'month': key[0], 'category': key[1], 'type': key[2],
+                'expected': {'amount_total': want[0], 'abs_total': want[1], 'count': want[2]},
+                'actual': {'amount_total': have[0], 'abs_total': have[1], 'count': have[2]}
+            })
+    return mismatches
@@ -0,0 +1,84 @@
+import logging
+import threading
+import time
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+
+class RecurringScheduler:
+    """Background worker that materializes due recurring transactions on a timer"""
+
+    def __init__(self, process_func, interval=300):
+        self.process_func = process_func
+        self.interval = interval
+        self._pass_lock = threading.Lock()  # Only one materialization pass at a time
+        self._stop_event = threading.Event()
+        self._thread = None
+
+        # Metrics for the most recent pass and running totals
+        self.total_passes = 0
+        self.total_rows = 0
+        self.last_run_at = None
+        self.last_duration_ms = None
+        self.last_rows = None
+        self.last_error = None
+
+    def start(self):
+        """Start the background thread (runs one pass immediately)"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name='recurring-scheduler', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        """Signal the background thread to exit and wait for it"""
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def run_now(self):
+        """Run a materialization pass synchronously and return the number of rows created"""
+        with self._pass_lock:
+            started = time.perf_counter()
+            try:
+                rows = self.process_func()
+            except Exception as exc:
+                self.last_error = str(exc)
+                raise
+            finally:
+                self.last_duration_ms = round((time.perf_counter() - started) * 1000, 3)
+                self.last_run_at = datetime.now().isoformat(timespec='seconds')
+                self.total_passes += 1
+
+            self.last_rows = rows
+            self.last_error = None
+            self.total_rows += rows
+            return rows
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            try:
+                self.run_now()
+            except Exception:
+                logger.exception('Recurring materialization pass failed')
+            self._stop_event.wait(self.interval)
+
+    def stats(self):
+        """Return scheduler metrics as a dict"""
+        return {
+            'running': self.running,
+            'interval_seconds': self.interval,
+            'total_passes': self.total_passes,
+            'total_rows': self.total_rows,
+            'last_run_at': self.last_run_at,
+            'last_duration_ms': self.last_duration_ms,
+            'last_rows': self.last_rows,
+            'last_error': self.last_error
+        }
@@ -0,0 +1,59 @@
+"""Sample data for trying the app out (flask --app finance-tracker-backend.py seed)"""
+
+SAMPLE_TRANSACTIONS = [
+    ('2025-07-29', 'Salary Deposit', 2600, 'income', 'Salary', 'Bi-weekly paycheck'),
+    ('2025-07-28', 'Grocery Store', -85.50, 'expense', 'Groceries', ''),
+    ('2025-07-27', 'Gas Station', -45.00, 'expense', 'Transportation', ''),
+    ('2025-07-26', 'Restaurant', -67.80, 'expense', 'Dining Out', 'Dinner with friends'),
+    ('2025-07-25', 'Netflix Subscription', -15.99, 'expense', 'Entertainment', ''),
+    ('2025-07-24', 'Rent Payment', -1200, 'expense', 'Housing', 'Monthly rent'),
+    ('2025-07-23', 'Freelance Work', 500, 'income', 'Freelance', 'Web design project')
+]
+
+SAMPLE_RECURRING = [
+    ('Salary', 2600, 'income', 'Salary', 'Bi-weekly paycheck', 'biweekly', '2025-07-29', None, '2025-08-12', 1),
+    ('Rent', -1200, 'expense', 'Housing', 'Monthly rent payment', 'monthly', '2025-08-01', None, '2025-08-01', 1),
+    ('Netflix', -15.99, 'expense', 'Entertainment', 'Streaming subscription', 'monthly', '2025-08-01', None, '2025-08-01', 1)
+]
+
+SAMPLE_ACCOUNTS = [
+    ('TFSA', 'Tax-Free Savings', 15000, 500),
+    ('RRSP', 'Retirement Savings', 25000, 800),
+    ('FHSA', 'First Home Savings', 8000, 300),
+    ('Emergency Fund', 'Savings', 5000, 200)
+]
+
+
+def seed_sample_data(conn):
+    """Insert the sample data in one transaction if there are no transactions yet
+
+    Returns True if the data was inserted.
+    """
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        if conn.execute('SELECT 1 FROM transactions LIMIT 1').fetchone():
+            conn.rollback()
+            return False
+
+        conn.executemany('''
+            INSERT INTO transactions (date, description, amount, type, category, notes)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', SAMPLE_TRANSACTIONS)
+
+        conn.executemany('''
+            INSERT INTO recurring_transactions
+            (description, amount, type, category, notes, frequency, start_date, end_date, next_occurrence, is_active)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', SAMPLE_RECURRING)
+
+        # The starting balance is also the opening balance
+        conn.executemany('''
+            INSERT INTO accounts (name, type, balance, monthly_contribution, opening_balance)
+            VALUES (?, ?, ?, ?, ?)
+        ''', [account + (account[2],) for account in SAMPLE_ACCOUNTS])
+
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return True
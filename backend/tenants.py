@@ -0,0 +1,249 @@
+"""Multi-tenant mode: one SQLite shard per tenant
+
+Each tenant's ledger lives in its own database file under a shard directory, with
+its own connection pool, write lock and caches, so households never wait on each
+other's writes and one large ledger doesn't slow the rest. Shards are opened on
+first use and kept in a bounded LRU; the least recently used idle shard is closed
+when the limit is reached.
+
+Tenant ids come from authentication, never from the URL: either a bearer token
+signed with the tenant secret (see issue_token()) or a header set by an
+authenticating reverse proxy.
+"""
+import hashlib
+import hmac
+import os
+import re
+import sqlite3
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+from archive import Archive
+from cache import ResponseCache
+from categorize import CategorizerCache
+from db import ConnectionPool, WriteLock
+
+# Tenant ids become file names, so only a conservative character set is accepted
+TENANT_ID_RE = re.compile(r'^[A-Za-z0-9][A-Za-z0-9_-]{0,63}$')
+
+SHARD_SUFFIX = '.db'
+
+
+class TenantError(Exception):
+    """Raised when a request carries no valid tenant credentials"""
+
+
+def valid_tenant_id(tenant_id):
+    return isinstance(tenant_id, str) and TENANT_ID_RE.match(tenant_id) is not None
+
+
+def _signature(secret, tenant_id):
+    return hmac.new(secret.encode(), tenant_id.encode(), hashlib.sha256).hexdigest()
+
+
+def issue_token(secret, tenant_id):
+    """Return a bearer token authenticating requests as tenant_id"""
+    if not valid_tenant_id(tenant_id):
+        raise TenantError(f'Invalid tenant id: {tenant_id!r}')
+    return f'{tenant_id}.{_signature(secret, tenant_id)}'
+
+
+def tenant_from_token(secret, token):
+    """Return the tenant id a bearer token was issued for"""
+    tenant_id, _, signature = (token or '').rpartition('.')
+    if not valid_tenant_id(tenant_id) or not hmac.compare_digest(signature, _signature(secret, tenant_id)):
+        raise TenantError('Invalid tenant token')
+    return tenant_id
+
+
+class Shard:
+    """A tenant's database with its own pool, write lock, caches and archive"""
+
+    def __init__(self, tenant_id, path, pool_size=4, cache_size=64, cache_ttl=60, categorizer_ttl=300,
+                 cache_versions=None):
+        self.tenant_id = tenant_id
+        self.path = path
+        self.db_pool = ConnectionPool(path, max_connections=pool_size)
+        self.write_lock = WriteLock(path + '.write-lock')
+        self.response_cache = ResponseCache(max_entries=cache_size, ttl=cache_ttl, version_source=cache_versions)
+        self.categorizer_cache = CategorizerCache(ttl=categorizer_ttl)
+        self.archive = Archive(path + '.archive')
+        self.users = 0  # Requests and jobs currently using the shard
+
+    def close(self):
+        self.db_pool.close_all()
+        self.archive.close()
+
+
+class ShardRouter:
+    """Bounded LRU of open tenant shards
+
+    acquire() opens a tenant's shard on first use (creating the database file and
+    calling on_open, which applies migrations) and release() returns it. When more
+    than max_open shards are open the least recently used one nobody is using is
+    closed; shards in use are never closed underneath a request.
+    """
+
+    def __init__(self, directory, max_open=64, on_open=None, aggregate_processes=None, **shard_options):
+        self.directory = directory
+        self.max_open = max_open
+        self.on_open = on_open
+        self.aggregate_processes = aggregate_processes or os.cpu_count() or 1
+        self.shard_options = shard_options
+        self._shards = OrderedDict()  # tenant id -> Shard, least recently used first
+        self._opening = {}            # tenant id -> Event set once its shard is open
+        self._lock = threading.Lock()
+        self._executor = None
+        os.makedirs(directory, exist_ok=True)
+
+        # Statistics
+        self.hits = 0
+        self.opens = 0
+        self.evictions = 0
+
+    def path(self, tenant_id):
+        return os.path.join(self.directory, tenant_id + SHARD_SUFFIX)
+
+    def acquire(self, tenant_id):
+        """Return tenant_id's shard, opening (and if needed creating) it"""
+        if not valid_tenant_id(tenant_id):
+            raise TenantError(f'Invalid tenant id: {tenant_id!r}')
+        while True:
+            with self._lock:
+                shard = self._shards.get(tenant_id)
+                if shard is not None:
+                    self._shards.move_to_end(tenant_id)
+                    shard.users += 1
+                    self.hits += 1
+                    return shard
+                opening = self._opening.get(tenant_id)
+                if opening is None:
+                    opening = self._opening[tenant_id] = threading.Event()
+                    break
+            # Another thread is opening this shard; use it once it's ready
+            opening.wait()
+
+        # Migrate outside the router lock so other tenants aren't held up
+        try:
+            shard = Shard(tenant_id, self.path(tenant_id), **self.shard_options)
+            if self.on_open is not None:
+                self.on_open(shard)
+        except Exception:
+            with self._lock:
+                del self._opening[tenant_id]
+            opening.set()
+            raise
+
+        with self._lock:
+            del self._opening[tenant_id]
+            shard.users = 1
+            self._shards[tenant_id] = shard
+            self.opens += 1
+            evicted = self._evict()
+        opening.set()
+        for idle in evicted:
+            idle.close()
+        return shard
+
+    def release(self, shard):
+        """Stop using a shard returned by acquire()"""
+        with self._lock:
+            shard.users -= 1
+            evicted = self._evict()
+            # A shard dropped from the LRU while in use is closed by its last user
+            closed = shard.users == 0 and self._shards.get(shard.tenant_id) is not shard
+        for idle in evicted:
+            idle.close()
+        if closed:
+            shard.close()
+
+    def _evict(self):
+        # Called with the lock held; the caller closes the returned shards
+        evicted = []
+        for tenant_id in list(self._shards):
+            if len(self._shards) <= self.max_open:
+                break
+            if self._shards[tenant_id].users == 0:
+                evicted.append(self._shards.pop(tenant_id))
+                self.evictions += 1
+        return evicted
+
+    def tenant_ids(self):
+        """Return the id of every tenant with a shard on disk"""
+        return sorted(name[:-len(SHARD_SUFFIX)] for name in os.listdir(self.directory)
+                      if name.endswith(SHARD_SUFFIX) and valid_tenant_id(name[:-len(SHARD_SUFFIX)]))
+
+    def aggregate(self):
+        """Summarize every shard on disk, in parallel across a process pool
+
+        Returns (per-tenant summaries, totals). Shards are read directly from their
+        files, so this doesn't open them in the LRU or touch their pools.
+        """
+        tenant_ids = self.tenant_ids()
+        paths = [self.path(tenant_id) for tenant_id in tenant_ids]
+        if self.aggregate_processes > 1 and len(paths) > 1:
+            if self._executor is None:
+                # spawn: forking a process with request threads and open connections isn't safe
+                self._executor = ProcessPoolExecutor(self.aggregate_processes, mp_context=get_context('spawn'))
+            chunksize = max(1, len(paths) // (self.aggregate_processes * 4))
+            summaries = list(self._executor.map(summarize_shard, paths, chunksize=chunksize))
+        else:
+            summaries = [summarize_shard(path) for path in paths]
+
+        tenants = [{'tenant_id': tenant_id, **summary} for tenant_id, summary in zip(tenant_ids, summaries)]
+        totals = {'tenants': len(tenants)}
+        for key in ('transactions', 'income', 'expenses', 'accounts', 'account_balance', 'size_bytes'):
+            totals[key] = round(sum(tenant[key] for tenant in tenants), 2)
+        totals['net'] = round(totals['income'] - totals['expenses'], 2)
+        return tenants, totals
+
+    def close(self):
+        """Close every open shard and the aggregation processes"""
+        with self._lock:
+            shards, self._shards = list(self._shards.values()), OrderedDict()
+        for shard in shards:
+            shard.close()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def stats(self):
+        with self._lock:
+            return {
+                'open_shards': len(self._shards),
+                'max_open_shards': self.max_open,
+                'in_use_shards': sum(1 for shard in self._shards.values() if shard.users),
+                'hits': self.hits,
+                'opens': self.opens,
+                'evictions': self.evictions
+            }
+
+
+def summarize_shard(path):
+    """Totals for one shard (runs in an aggregation worker process)"""
+    # Read-only and unpooled: the shard may be open for writing in a server process
+    conn = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+    try:
+        conn.execute('PRAGMA busy_timeout = 10000')
+        totals = dict.fromkeys(('income', 'expense'), (0, 0))
+        totals.update((kind, (count, amount)) for kind, count, amount in conn.execute('''
+            SELECT type, SUM(count), SUM(abs_total) FROM monthly_category_totals GROUP BY type
+        '''))
+        last_transaction = conn.execute('SELECT MAX(date) FROM transactions').fetchone()[0]
+        accounts, balance = conn.execute('SELECT COUNT(*), COALESCE(SUM(balance), 0) FROM accounts').fetchone()
+    finally:
+        conn.close()
+
+    size = sum(os.path.getsize(path + suffix) for suffix in ('', '-wal') if os.path.exists(path + suffix))
+    return {
+        'transactions': totals['income'][0] + totals['expense'][0],
+        'income': round(totals['income'][1], 2),
+        'expenses': round(totals['expense'][1], 2),
+        'net': round(totals['income'][1] - totals['expense'][1], 2),
+        'last_transaction': last_transaction,
+        'accounts': accounts,
+        'account_balance': round(balance, 2),
+        'size_bytes': size
+    }
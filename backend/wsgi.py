@@ -0,0 +1,20 @@
+"""WSGI entry point for production servers
+
+finance-tracker-backend.py isn't importable by name, so it is loaded here and the
+app it creates (for FINANCE_TRACKER_DATABASE) exposed as wsgi:app:
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+"""
+import importlib.util
+import os
+
+_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'finance-tracker-backend.py')
+_spec = importlib.util.spec_from_file_location('finance_tracker_backend', _path)
+backend = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(backend)
+
+app = backend.create_app()
+
+# create_app() applied pending migrations; close the connection it used so forked
+# workers don't inherit it
+app.extensions['finance_tracker']['db_pool'].close_all()
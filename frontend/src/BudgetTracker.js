@@ -1,9 +1,12 @@
 // frontend/src/BudgetTracker.js
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import { BarChart, Bar, XAxis, YAxis, CartesianGrid, Tooltip, ResponsiveContainer, PieChart, Pie, Cell } from 'recharts';
 import { DollarSign, TrendingUp, TrendingDown, CreditCard, Calendar, Plus, Edit, Trash2, Save, X, Target, PiggyBank, Building, RefreshCw } from 'lucide-react';
 
 const API_BASE_URL = process.env.REACT_APP_API_BASE_URL || 'http://localhost:5000/api';
+const EVENTS_URL = process.env.REACT_APP_EVENTS_URL || 'http://localhost:5001/api/events';
+// Tenant bearer token when the API runs in multi-tenant mode (flask issue-tenant-token)
+const API_TOKEN = process.env.REACT_APP_API_TOKEN;
 
 const BudgetTracker = () => {
   const [activeTab, setActiveTab] = useState('dashboard');
@@ -50,6 +53,7 @@ const BudgetTracker = () => {
       const response = await fetch(`${API_BASE_URL}${endpoint}`, {
         headers: {
           'Content-Type': 'application/json',
+          ...(API_TOKEN && { Authorization: `Bearer ${API_TOKEN}` }),
           ...options.headers,
         },
         ...options,
@@ -67,10 +71,36 @@ const BudgetTracker = () => {
     }
   };
 
+  // Change sequence the transaction list is synced up to (0 until the first sync)
+  const syncSeq = useRef(0);
+
+  // Fetch only the transactions changed since the last sync and merge them in
   const fetchTransactions = async () => {
     try {
-      const data = await apiCall('/transactions');
-      setTransactions(data);
+      const changed = new Map();
+      const deleted = new Set();
+      let since = syncSeq.current;
+      let page;
+      do {
+        page = await apiCall(`/changes?since=${since}`);
+        page.transactions.forEach(transaction => {
+          changed.set(transaction.id, transaction);
+          deleted.delete(transaction.id);
+        });
+        page.deleted.transactions.forEach(id => {
+          deleted.add(id);
+          changed.delete(id);
+        });
+        since = page.next_since;
+      } while (page.has_more);
+      syncSeq.current = since;
+      
+      setTransactions(prev => {
+        const merged = new Map(prev.map(transaction => [transaction.id, transaction]));
+        deleted.forEach(id => merged.delete(id));
+        changed.forEach((transaction, id) => merged.set(id, transaction));
+        return [...merged.values()].sort((a, b) => b.date.localeCompare(a.date) || b.id - a.id);
+      });
     } catch (error) {
       console.error('Failed to fetch transactions:', error);
     }
@@ -203,6 +233,33 @@ const LoadingSpinner = () => (
     fetchSpendingData(chartView);
   }, [chartView]);
 
+  // Chart period for refreshes triggered by change events (read outside render)
+  const chartViewRef = useRef(chartView);
+  chartViewRef.current = chartView;
+
+  // Refetch whatever another tab, device or the recurring scheduler changed, as the
+  // event server reports it, instead of polling
+  useEffect(() => {
+    const events = new EventSource(EVENTS_URL);
+    events.addEventListener('change', (event) => {
+      const topics = new Set(JSON.parse(event.data).topics);
+      if (topics.has('transactions')) {
+        fetchTransactions();
+        fetchFinancialOverview();
+        fetchSpendingData(chartViewRef.current);
+      }
+      if (topics.has('accounts')) {
+        fetchAccounts();
+        if (!topics.has('transactions')) fetchFinancialOverview();
+      }
+      if (topics.has('budget_goals')) fetchBudgetGoals();
+      if (topics.has('transactions') || topics.has('recurring') || topics.has('categorization_rules')) {
+        fetchCategories();
+      }
+    });
+    return () => events.close();
+  }, []);
+
   // Transaction functions
   const addTransaction = async () => {
     if (!newTransaction.description || !newTransaction.amount) return;
@@ -25,7 +25,8 @@ start_backend() {
         source venv/bin/activate
     fi
     
-    # Start the Flask application
+    # Load sample data into a new database, then start the Flask application
+    flask --app finance-tracker-backend.py seed
     python finance-tracker-backend.py &
     BACKEND_PID=$!
     echo "Backend started with PID: $BACKEND_PID"